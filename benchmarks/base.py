@@ -0,0 +1,33 @@
+"""
+Helpers shared by the benchmark scripts. Run a benchmark from the repository root, ex:
+
+    python benchmarks/query_copy.py
+"""
+import os
+import sys
+import timeit
+
+
+def setup_django():
+    """
+    Configures django with the test settings so querybuilder and the test models can be imported
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import django
+    from settings import configure_settings
+
+    configure_settings()
+    django.setup()
+
+
+def run_benchmark(name, func, number=1000, repeat=5):
+    """
+    Times a function and prints the best time per call in microseconds
+
+    :return: The best time per call in seconds
+    :rtype: float
+    """
+    seconds = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print('{0:<40} {1:>12.2f} us'.format(name, seconds * 1000000))
+    return seconds
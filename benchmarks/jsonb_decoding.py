@@ -0,0 +1,74 @@
+"""
+Compares decoding the jsonb columns of a result set cell by cell with decoding each column in bulk
+using json and orjson, and with lazy rows that only decode the values that are read
+"""
+import json
+from collections import namedtuple
+
+from base import run_benchmark, setup_django
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+setup_django()
+
+from querybuilder.utils import (  # noqa: E402
+    JSONB_OID, json_rows_as_dict, json_rows_as_lazy_dict, set_json_decoder
+)
+
+Column = namedtuple('Column', ['name', 'type_code'])
+
+
+class FakeCursor(object):
+    """
+    A cursor with the description of a result set with an int column and two jsonb columns
+    """
+    description = [Column('id', 23), Column('data', JSONB_OID), Column('tags', JSONB_OID)]
+
+
+def get_rows(num_rows=5000):
+    data = json.dumps({'name': 'Name', 'values': list(range(20)), 'nested': {'a': 1.5, 'b': None}})
+    tags = json.dumps(['one', 'two', 'three'])
+    return [(i, data, tags) for i in range(num_rows)]
+
+
+def cell_by_cell(cursor, rows):
+    """
+    How jsonb values used to be decoded, copying each row to a list and decoding one value at a time
+    """
+    colnames = [col.name for col in cursor.description]
+    jsonbcols = [i for i, col in enumerate(cursor.description) if col.type_code == JSONB_OID]
+    results = []
+    for row in rows:
+        rowvals = list(row)
+        for colindex in jsonbcols:
+            if type(rowvals[colindex]) is str:
+                try:
+                    rowvals[colindex] = json.loads(rowvals[colindex])
+                except json.JSONDecodeError:
+                    pass
+        results.append(dict(zip(colnames, tuple(rowvals))))
+    return results
+
+
+if __name__ == '__main__':
+    cursor = FakeCursor()
+    rows = get_rows()
+
+    cell_seconds = run_benchmark('cell by cell json.loads', lambda: cell_by_cell(cursor, rows), number=10)
+    set_json_decoder(json.loads)
+    run_benchmark('bulk json.loads', lambda: json_rows_as_dict(cursor, rows), number=10)
+    if orjson is not None:
+        set_json_decoder(orjson.loads)
+        bulk_seconds = run_benchmark('bulk orjson.loads', lambda: json_rows_as_dict(cursor, rows), number=10)
+        print('bulk orjson is {0:.1f}x faster than cell by cell json'.format(cell_seconds / bulk_seconds))
+    else:
+        print('orjson is not installed')
+    run_benchmark('lazy rows', lambda: json_rows_as_lazy_dict(cursor, rows), number=10)
+    run_benchmark(
+        'lazy rows reading one column',
+        lambda: [row['tags'] for row in json_rows_as_lazy_dict(cursor, rows)],
+        number=10
+    )
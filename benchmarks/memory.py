@@ -0,0 +1,57 @@
+"""
+Compares the memory used by the slotted Field and Table classes with equivalent classes that
+have an instance ``__dict__``, by building wide queries and measuring the allocations
+"""
+import gc
+import tracemalloc
+
+from base import setup_django
+
+setup_django()
+
+from querybuilder.fields import SimpleField  # noqa: E402
+from querybuilder.tables import ModelTable  # noqa: E402
+from querybuilder.tests.models import Order  # noqa: E402
+
+
+class DictField(SimpleField):
+    """
+    A field that doesn't declare ``__slots__``, so its instances get a ``__dict__``
+    """
+
+
+class DictModelTable(ModelTable):
+    """
+    A table that doesn't declare ``__slots__``, so its instances get a ``__dict__``
+    """
+
+
+def build_tables(table_class, field_class, num_tables=1000):
+    field_names = [field.column for field in Order._meta.fields] * 5
+    return [
+        table_class(Order, fields=[field_class(field_name) for field_name in field_names])
+        for i in range(num_tables)
+    ]
+
+
+def measure(name, table_class, field_class):
+    """
+    Prints the bytes allocated per table and field
+
+    :return: The total number of bytes allocated
+    :rtype: int
+    """
+    gc.collect()
+    tracemalloc.start()
+    tables = build_tables(table_class, field_class)
+    allocated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_objects = len(tables) * (len(tables[0].fields) + 1)
+    print('{0:<40} {1:>12} bytes {2:>8.1f} bytes/object'.format(name, allocated, allocated / num_objects))
+    return allocated
+
+
+if __name__ == '__main__':
+    dict_bytes = measure('__dict__ fields and tables', DictModelTable, DictField)
+    slots_bytes = measure('__slots__ fields and tables', ModelTable, SimpleField)
+    print('__slots__ objects use {0:.1f}% less memory'.format(100 - 100.0 * slots_bytes / dict_bytes))
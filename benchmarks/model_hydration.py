@@ -0,0 +1,71 @@
+"""
+Compares building model instances from selected rows with setattr per key, the way
+select(return_models=True) used to, with the hydration plans built from the model metadata
+"""
+from base import run_benchmark, setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+
+from querybuilder.metadata import get_model_metadata  # noqa: E402
+from querybuilder.tests.models import Account, Order  # noqa: E402
+
+
+def get_rows(num_rows=1000):
+    return [
+        {
+            'id': i,
+            'account_id': i,
+            'revenue': 10.0,
+            'margin': 5.0,
+            'margin_percent': 0.5,
+            'time': None,
+            'account': {'id': i, 'user_id': i, 'first_name': 'First', 'last_name': 'Last'},
+        }
+        for i in range(num_rows)
+    ]
+
+
+def hydrate_with_setattr(rows):
+    """
+    How select(return_models=True) used to build models
+    """
+    model_map = {'account': Account}
+    models = []
+    for row in rows:
+        model = Order()
+        for key, value in row.items():
+            if key not in model_map:
+                setattr(model, key, value)
+        for key, value in row.items():
+            if key in model_map:
+                child_model = model_map[key]()
+                for child_key, child_value in value.items():
+                    setattr(child_model, child_key, child_value)
+                value = child_model
+            setattr(model, key, value)
+        models.append(model)
+    return models
+
+
+def hydrate_with_plan(rows):
+    metadata = get_model_metadata(Order)
+    account_metadata = get_model_metadata(Account)
+    plan = metadata.get_hydration_plan(tuple(key for key in rows[0] if key != 'account'))
+    account_plan = account_metadata.get_hydration_plan(tuple(rows[0]['account']))
+    field, remote_field = metadata.get_related_cache('account', Account)
+    db = connection.alias
+    models = []
+    for row in rows:
+        model = metadata.hydrate(row, db, plan)
+        field.set_cached_value(model, account_metadata.hydrate(row['account'], db, account_plan))
+        models.append(model)
+    return models
+
+
+if __name__ == '__main__':
+    rows = get_rows()
+    setattr_seconds = run_benchmark('setattr per key', lambda: hydrate_with_setattr(rows), number=20)
+    plan_seconds = run_benchmark('hydration plan', lambda: hydrate_with_plan(rows), number=20)
+    print('the hydration plan is {0:.1f}x faster'.format(setattr_seconds / plan_seconds))
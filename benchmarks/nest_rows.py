@@ -0,0 +1,50 @@
+"""
+Compares nesting rows with set_value_for_keypath with nesting them with a precomputed nesting plan
+"""
+from base import run_benchmark, setup_django
+
+setup_django()
+
+from querybuilder.helpers import get_nesting_plan, nest_row, set_value_for_keypath  # noqa: E402
+
+
+def get_rows(num_rows=1000):
+    return [
+        {
+            'id': i,
+            'name': 'Name',
+            'account__id': i,
+            'account__first_name': 'First',
+            'account__last_name': 'Last',
+            'account__user__id': i,
+            'account__user__email': 'user@example.com',
+        }
+        for i in range(num_rows)
+    ]
+
+
+def nest_with_keypaths(rows):
+    """
+    How rows used to be nested
+    """
+    for row in rows:
+        _row = row.copy()
+        for key, value in _row.items():
+            set_value_for_keypath(row, key, value, True, '__')
+            if '__' in key:
+                row.pop(key)
+    return rows
+
+
+def nest_with_plan(rows):
+    plan = get_nesting_plan(tuple(rows[0]))
+    for row in rows:
+        nest_row(row, plan)
+    return rows
+
+
+if __name__ == '__main__':
+    keypath_seconds = run_benchmark('set_value_for_keypath', lambda: nest_with_keypaths(get_rows()), number=100)
+    plan_seconds = run_benchmark('nesting plan', lambda: nest_with_plan(get_rows()), number=100)
+    run_benchmark('building the rows', get_rows, number=100)
+    print('the nesting plan is {0:.1f}x faster including building the rows'.format(keypath_seconds / plan_seconds))
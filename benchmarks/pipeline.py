@@ -0,0 +1,17 @@
+"""
+Compares selecting many small queries one at a time with sending them with run_pipeline.
+This needs the database from the test settings.
+"""
+from base import run_benchmark, setup_django
+
+setup_django()
+
+from querybuilder.executor import run_pipeline  # noqa: E402
+from querybuilder.query import Query  # noqa: E402
+
+
+if __name__ == '__main__':
+    queries = [Query().from_table('pg_class', fields=['relname']).where(oid=oid) for oid in range(1000, 1050)]
+    sequential_seconds = run_benchmark('sequential', lambda: [query.select() for query in queries], number=20)
+    pipeline_seconds = run_benchmark('run_pipeline', lambda: run_pipeline(queries), number=20)
+    print('run_pipeline is {0:.1f}x faster'.format(sequential_seconds / pipeline_seconds))
@@ -0,0 +1,45 @@
+"""
+Compares Query.copy, which clones the structure of a query, with deep copying the whole query
+"""
+from copy import deepcopy
+
+from base import run_benchmark, setup_django
+
+setup_django()
+
+from django.db.models import Q  # noqa: E402
+
+from querybuilder.fields import SumField  # noqa: E402
+from querybuilder.query import Query  # noqa: E402
+from querybuilder.tests.models import Account, Order  # noqa: E402
+
+
+def get_query():
+    inner_query = Query().from_table(Order, fields=['id', 'account_id', 'margin']).where(margin__gt=10)
+    return Query().from_table(
+        inner_query,
+        fields=['account_id', {'margin_total': SumField('margin')}]
+    ).join(
+        Account,
+        fields=['first_name', 'last_name'],
+        condition='T0.account_id = querybuilder_tests_account.id',
+    ).where(
+        Q(margin__lt=1000) | Q(margin__isnull=False)
+    ).group_by('account_id').order_by('-margin_total').limit(10)
+
+
+def deepcopy_query(query):
+    """
+    How Query.copy used to copy a query, sharing the connection of the query and its inner queries
+    """
+    return deepcopy(query, {id(query.connection): query.connection})
+
+
+if __name__ == '__main__':
+    query = get_query()
+    query.get_sql()
+
+    deepcopy_seconds = run_benchmark('deepcopy', lambda: deepcopy_query(query))
+    clone_seconds = run_benchmark('Query.copy', lambda: query.copy())
+    run_benchmark('Query.get_count_query', lambda: query.get_count_query())
+    print('Query.copy is {0:.1f}x faster than deepcopy'.format(deepcopy_seconds / clone_seconds))
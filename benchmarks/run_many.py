@@ -0,0 +1,32 @@
+"""
+Compares executing independent queries one after another with executing them with run_many.
+This needs the database from the test settings.
+"""
+import time
+
+from base import setup_django
+
+setup_django()
+
+from querybuilder.executor import run_many  # noqa: E402
+from querybuilder.query import Query  # noqa: E402
+
+
+def run_timed(name, func, repeat=3):
+    seconds = min(timed(func) for _ in range(repeat))
+    print('{0:<40} {1:>12.2f} ms'.format(name, seconds * 1000))
+    return seconds
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    sql = 'SELECT pg_sleep(0.05)'
+    queries = [Query() for _ in range(8)]
+    sequential_seconds = run_timed('sequential', lambda: [query.select(sql=sql) for query in queries])
+    run_many_seconds = run_timed('run_many', lambda: run_many(queries, sql=sql))
+    print('run_many is {0:.1f}x faster'.format(sequential_seconds / run_many_seconds))
@@ -0,0 +1,106 @@
+import contextlib
+
+try:
+    from psycopg import AsyncClientCursor, AsyncConnection, AsyncServerCursor
+    from psycopg.client_cursor import ClientCursorMixin
+except ImportError:
+    AsyncConnection = None
+else:
+    class AsyncServerSideCursor(ClientCursorMixin, AsyncServerCursor):
+        """
+        An async server-side cursor that binds args on the client like django's chunked cursors
+        """
+
+
+def supports_async(connection):
+    """
+    Checks if queries on a django connection can be run with a native async connection. This
+    requires postgres with psycopg 3. Other connections run their queries in a thread with
+    ``sync_to_async``.
+
+    :param connection: The django database connection
+    :type connection: :class:`BaseDatabaseWrapper <django:django.db.backends.base.base.BaseDatabaseWrapper>`
+
+    :rtype: bool
+    """
+    if AsyncConnection is None or connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def get_async_connection_params(connection):
+    """
+    Gets the psycopg connection params of a django connection for an async connection. The params
+    are the same as django's, except that the cursors are async client side binding cursors like
+    django's cursors, and the connection is in autocommit mode.
+
+    :rtype: dict
+    """
+    conn_params = connection.get_connection_params()
+    conn_params['cursor_factory'] = AsyncClientCursor
+    conn_params['autocommit'] = True
+    return conn_params
+
+
+@contextlib.asynccontextmanager
+async def async_connection(connection, pool=None):
+    """
+    Opens a psycopg async connection to the database of a django connection. The async connection
+    is separate from the django connection, so it does not see the uncommitted changes of the
+    django connection's transaction. Without a pool, a new connection is opened and closed each time,
+    which costs a connection handshake, authentication, and possibly setting the time zone.
+
+    :param connection: The django database connection
+    :type connection: :class:`BaseDatabaseWrapper <django:django.db.backends.base.base.BaseDatabaseWrapper>`
+
+    :param pool: A psycopg_pool ``AsyncConnectionPool`` to get the connection from instead of opening
+        one. The pool should be created with the params from ``get_async_connection_params``
+    :type pool: AsyncConnectionPool or None
+    """
+    if pool is not None:
+        async with pool.connection() as conn:
+            conn.server_cursor_factory = AsyncServerSideCursor
+            yield conn
+        return
+
+    conn = await AsyncConnection.connect(**get_async_connection_params(connection))
+    conn.server_cursor_factory = AsyncServerSideCursor
+    try:
+        # set the time zone like django does when it opens a connection
+        timezone_name = connection.timezone_name
+        if timezone_name and conn.info.parameter_status('TimeZone') != timezone_name:
+            async with conn.cursor() as cursor:
+                await cursor.execute(connection.ops.set_time_zone_sql(), [timezone_name])
+        yield conn
+    finally:
+        await conn.close()
+
+
+def get_batch_transaction(conn, num_batches):
+    """
+    Gets the async context manager to execute the batches of a statement in. More than one batch
+    is run in a single transaction so a failing batch rolls back the others.
+    """
+    if num_batches > 1:
+        return conn.transaction()
+    return contextlib.nullcontext()
+
+
+async def copy_rows(cursor, sql, rows):
+    """
+    Streams the rows from an iterable to a COPY FROM STDIN statement on an async cursor
+
+    :param sql: The COPY ... FROM STDIN statement
+    :type sql: str
+
+    :param rows: An iterable of rows where each row is a sequence of values
+    :type rows: iterable of list
+
+    :return: The number of rows copied
+    :rtype: int
+    """
+    async with cursor.copy(sql) as copy:
+        for row in rows:
+            await copy.write_row(row)
+    return cursor.rowcount
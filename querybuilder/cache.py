@@ -0,0 +1,238 @@
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+def get_result_cache_key(sql, sql_args, alias='default', row_format='dict'):
+    """
+    Builds the result cache key for a query from a hash of its sql and args
+
+    :param sql: The sql of the query
+    :type sql: str
+
+    :param sql_args: The args of the query
+    :type sql_args: dict or list or None
+
+    :param alias: The alias of the db connection the query runs on
+    :type alias: str
+
+    :param row_format: The format of the cached rows
+    :type row_format: str
+
+    :rtype: str
+    """
+    if isinstance(sql_args, dict):
+        sql_args = sorted(sql_args.items())
+    key = '\0'.join([alias, row_format, sql, repr(sql_args)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Base class of the result cache backends used by ``Query.cache_results``. A backend stores the
+    rows of a select keyed by ``get_result_cache_key`` along with the names of the tables the
+    select reads, so that all of the results that read a table can be invalidated when it is written to.
+    """
+
+    def __init__(self, timeout=60):
+        """
+        :param timeout: The default number of seconds that results are cached
+        :type timeout: int
+        """
+        self.timeout = timeout
+
+    def get_versioned_key(self, key, table_names):
+        """
+        Gets the key the rows are stored under for the current state of the tables. A select gets this
+        key before it executes and passes it to ``get`` and ``set``, so rows that are fetched before a
+        table is invalidated are never stored as the results of the invalidated table.
+
+        :param table_names: The names of the tables the rows were selected from
+        :type table_names: list of str
+
+        :rtype: str
+        """
+        return key
+
+    def get(self, key, table_names, versioned_key=None):
+        """
+        :param table_names: The names of the tables the rows were selected from
+        :type table_names: list of str
+
+        :param versioned_key: The key from ``get_versioned_key``. It is looked up if not passed.
+        :type versioned_key: str or None
+
+        :return: The cached rows for the key or None if they are missing or expired
+        """
+        raise NotImplementedError
+
+    def set(self, key, value, table_names, timeout=None, versioned_key=None):
+        """
+        Caches the rows for the key
+
+        :param table_names: The names of the tables the rows were selected from
+        :type table_names: list of str
+
+        :param timeout: The number of seconds to cache the rows. Defaults to ``self.timeout``
+        :type timeout: int or None
+
+        :param versioned_key: The key from ``get_versioned_key`` that was used to read the rows before
+            they were selected. It is looked up if not passed.
+        :type versioned_key: str or None
+        """
+        raise NotImplementedError
+
+    def invalidate_tables(self, table_names):
+        """
+        Removes all of the cached results that were selected from any of the tables
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Removes all of the cached results
+        """
+        raise NotImplementedError
+
+
+class LocMemResultCache(ResultCache):
+    """
+    An in-process result cache with a TTL and least recently used eviction once there are
+    more than ``max_size`` entries. Values are pickled like Django's locmem cache so that
+    callers can modify the rows they get back without changing the cached rows. Invalidating a
+    table removes its entries and bumps its version, so rows selected before the invalidation
+    are not stored afterwards.
+    """
+
+    def __init__(self, timeout=60, max_size=1000):
+        super(LocMemResultCache, self).__init__(timeout=timeout)
+        self.max_size = max_size
+        # key -> (expire time, table names, pickled value)
+        self.entries = OrderedDict()
+        # table name -> number of invalidations, and the number of clears
+        self.table_versions = {}
+        self.clear_version = 0
+        self.lock = threading.Lock()
+
+    def _get_versioned_key(self, key, table_names):
+        versions = [self.clear_version] + [
+            self.table_versions.get(table_name, 0) for table_name in sorted(set(table_names))
+        ]
+        return '{0}:{1}'.format(key, ':'.join(str(version) for version in versions))
+
+    def get_versioned_key(self, key, table_names):
+        with self.lock:
+            return self._get_versioned_key(key, table_names)
+
+    def get(self, key, table_names, versioned_key=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(entry[2])
+
+    def set(self, key, value, table_names, timeout=None, versioned_key=None):
+        if timeout is None:
+            timeout = self.timeout
+        entry = (time.monotonic() + timeout, frozenset(table_names), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        with self.lock:
+            if versioned_key is not None and versioned_key != self._get_versioned_key(key, table_names):
+                # a table was invalidated after the rows were selected
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate_tables(self, table_names):
+        table_names = set(table_names)
+        with self.lock:
+            for table_name in table_names:
+                self.table_versions[table_name] = self.table_versions.get(table_name, 0) + 1
+            for key in [key for key, entry in self.entries.items() if entry[1] & table_names]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.clear_version += 1
+            self.entries.clear()
+
+
+class DjangoResultCache(ResultCache):
+    """
+    A result cache stored in one of Django's configured caches, which handles expiration and
+    eviction. Tables are invalidated by bumping a version number per table that is part of the
+    key of every result selected from the table, so stale results are never read again and
+    expire on their own.
+    """
+
+    def __init__(self, alias='default', timeout=60, key_prefix='querybuilder'):
+        """
+        :param alias: The alias of the cache in the ``CACHES`` setting
+        :type alias: str
+
+        :param key_prefix: The prefix of all cache keys
+        :type key_prefix: str
+        """
+        super(DjangoResultCache, self).__init__(timeout=timeout)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get_version_key(self, table_name=None):
+        """
+        Gets the key of the version number of a table. If no table is passed, this is the key of
+        the version number of all results, which is bumped by ``self.clear()``
+        """
+        if table_name is None:
+            return '{0}:all'.format(self.key_prefix)
+        return '{0}:table:{1}'.format(self.key_prefix, table_name)
+
+    def get_versioned_key(self, key, table_names):
+        """
+        Adds the current version of each table to the key
+        """
+        version_keys = [self.get_version_key()] + [
+            self.get_version_key(table_name) for table_name in sorted(set(table_names))
+        ]
+        versions = self.cache.get_many(version_keys)
+        return '{0}:result:{1}:{2}'.format(
+            self.key_prefix,
+            key,
+            ':'.join(str(versions.get(version_key, 0)) for version_key in version_keys),
+        )
+
+    def get(self, key, table_names, versioned_key=None):
+        if versioned_key is None:
+            versioned_key = self.get_versioned_key(key, table_names)
+        return self.cache.get(versioned_key)
+
+    def set(self, key, value, table_names, timeout=None, versioned_key=None):
+        if timeout is None:
+            timeout = self.timeout
+        if versioned_key is None:
+            versioned_key = self.get_versioned_key(key, table_names)
+        self.cache.set(versioned_key, value, timeout)
+
+    def bump_version(self, version_key):
+        # the versions never expire so that a result can not outlive an invalidation
+        if not self.cache.add(version_key, 1, None):
+            self.cache.incr(version_key)
+
+    def invalidate_tables(self, table_names):
+        for table_name in set(table_names):
+            self.bump_version(self.get_version_key(table_name))
+
+    def clear(self):
+        # only the results of this cache are cleared, not the whole django cache
+        self.bump_version(self.get_version_key())
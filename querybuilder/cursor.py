@@ -1,5 +1,11 @@
 import contextlib
+import hashlib
 import json
+import re
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.db import DatabaseError
 
 try:
     from psycopg2.extras import register_default_jsonb
@@ -21,10 +27,26 @@ def _passthrough_loads(value):
     return value
 
 
-def jsonify_cursor(django_cursor, enabled=True):
+def get_inner_cursor(django_cursor):
+    """
+    Gets the "real" psycopg cursor from a Django cursor wrapper. See ``jsonify_cursor`` for
+    why this follows the chain of ``cursor`` properties.
+    """
+    # We expect that there is always at least one wrapper, but we might as well handle
+    # the possibility that we get passed the inner cursor.
+    inner_cursor = django_cursor
+
+    while hasattr(inner_cursor, 'cursor'):
+        inner_cursor = inner_cursor.cursor
+
+    return inner_cursor
+
+
+def jsonify_cursor(django_cursor, enabled=True, loads=None):
     """
     Adjust an already existing cursor to ensure it will return structured types (list or dict)
     from jsonb columns instead of strings. Django 3.1.1+ returns strings for raw queries.
+    ``loads`` is the function psycopg decodes jsonb values with and defaults to ``json.loads``.
     https://code.djangoproject.com/ticket/31956
     https://code.djangoproject.com/ticket/31973
     https://www.psycopg.org/docs/extras.html#psycopg2.extras.register_default_jsonb
@@ -50,14 +72,9 @@ def jsonify_cursor(django_cursor, enabled=True):
     # case a passthrough function that just returns the value passed in. Note that passing
     # None for loads does NOT do a deregister; it uses the default value, which as it turns out
     # is json.loads anyway!
-    loads_func = json.loads if enabled else _passthrough_loads
+    loads_func = (loads or json.loads) if enabled else _passthrough_loads
 
-    # We expect that there is always at least one wrapper, but we might as well handle
-    # the possibility that we get passed the inner cursor.
-    inner_cursor = django_cursor
-
-    while hasattr(inner_cursor, 'cursor'):
-        inner_cursor = inner_cursor.cursor
+    inner_cursor = get_inner_cursor(django_cursor)
 
     # Hopefully we have the right thing now, but try/catch so we can get a little better info
     # if it is not. Another option might be an isinstance, or another function that tests the cursor?
@@ -93,3 +110,283 @@ def json_cursor(django_database_connection):
         # This should really not be necessary, because the cursor context manager will
         # be closing the cursor on __exit__ anyway. But just in case.
         dejsonify_cursor(cursor)
+
+
+def format_copy_value(value):
+    """
+    Formats a python value for the text format of a postgres COPY FROM STDIN statement
+    https://www.postgresql.org/docs/current/sql-copy.html
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace(
+        '\\', '\\\\'
+    ).replace(
+        '\t', '\\t'
+    ).replace(
+        '\n', '\\n'
+    ).replace(
+        '\r', '\\r'
+    )
+
+
+def format_copy_row(row):
+    """
+    Formats a row of python values as a line for the text format of a postgres COPY FROM STDIN statement
+    """
+    return '{0}\n'.format('\t'.join(format_copy_value(value) for value in row))
+
+
+class CopyRowsFile(object):
+    """
+    A read only file-like object that formats rows from an iterable as they are read. This lets
+    psycopg2's copy_expert stream the rows without building the whole COPY data in memory.
+    """
+
+    def __init__(self, rows):
+        self.lines = (format_copy_row(row) for row in rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            length += len(line)
+        data = ''.join(chunks)
+        if size < 0:
+            self.buffer = ''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def copy_rows(django_cursor, sql, rows):
+    """
+    Streams the rows from an iterable to a COPY FROM STDIN statement using the copy api of the
+    installed psycopg version. The rows are not loaded into memory all at once.
+
+    :param sql: The COPY ... FROM STDIN statement
+    :type sql: str
+
+    :param rows: An iterable of rows where each row is a sequence of values
+    :type rows: iterable of list
+
+    :return: The number of rows copied
+    :rtype: int
+    """
+    inner_cursor = get_inner_cursor(django_cursor)
+
+    if psycopg_version == 2:
+        inner_cursor.copy_expert(sql, CopyRowsFile(rows))
+    elif psycopg_version == 3:
+        with inner_cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+    else:
+        raise Exception('Unsupported psycopg version')
+
+    return inner_cursor.rowcount
+
+
+# Matches the pyformat placeholders and escaped percent signs of a query
+PLACEHOLDER_PATTERN = re.compile(r'%\((\w+)\)s|%s|%%')
+
+# Matches a list of placeholders after they are normalized, like the values of an IN condition or a row of an insert
+PLACEHOLDER_LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+# Matches the rows of a multi row VALUES list after their placeholders are collapsed
+VALUES_LIST_PATTERN = re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+')
+
+# Matches the number of a LIMIT or OFFSET
+LIMIT_PATTERN = re.compile(r'\b(LIMIT|OFFSET) \d+')
+
+
+def normalize_placeholder(match):
+    return match.group(0) if match.group(0) == '%%' else '?'
+
+
+@lru_cache(maxsize=1024)
+def get_sql_fingerprint(sql, normalize=False):
+    """
+    Gets a short stable hash of a sql string. Queries with the same shape generate the same sql
+    with different args, so this identifies repeated query shapes.
+
+    :param sql: The sql to fingerprint
+    :type sql: str
+
+    :param normalize: If True, the names of the args, the number of values in an IN list or rows in
+        a VALUES list, the numbers of a LIMIT or OFFSET, and whitespace do not change the fingerprint.
+        This groups the executions of a query for stats. Defaults to False, which is the exact sql
+        that a prepared statement is named for.
+    :type normalize: bool
+
+    :rtype: str
+    """
+    if normalize:
+        sql = PLACEHOLDER_PATTERN.sub(normalize_placeholder, sql)
+        sql = PLACEHOLDER_LIST_PATTERN.sub('(?)', sql)
+        sql = VALUES_LIST_PATTERN.sub('(?)', sql)
+        sql = LIMIT_PATTERN.sub(r'\1 ?', sql)
+        sql = ' '.join(sql.split())
+    return hashlib.sha1(sql.encode('utf-8')).hexdigest()[:20]
+
+
+def get_positional_sql(sql, sql_args=None):
+    """
+    Converts the pyformat placeholders of a query to the numbered $1, $2, etc placeholders
+    used by a PREPARE statement. A named arg that is used more than once keeps the same number.
+
+    :param sql: The sql with pyformat placeholders
+    :type sql: str
+
+    :param sql_args: The dict of named args or the list of positional args for the sql
+    :type sql_args: dict or list or None
+
+    :return: The converted sql and the list of args in positional order
+    :rtype: tuple of (str, list)
+    """
+    args = []
+    numbers = {}
+    positional_args = iter(sql_args or [])
+
+    def replace(match):
+        if match.group(0) == '%%':
+            return '%'
+        name = match.group(1)
+        if name is None:
+            args.append(next(positional_args))
+            return '${0}'.format(len(args))
+        if name not in numbers:
+            args.append(sql_args[name])
+            numbers[name] = len(args)
+        return '${0}'.format(numbers[name])
+
+    return PLACEHOLDER_PATTERN.sub(replace, sql), args
+
+
+class PreparedStatementCache(object):
+    """
+    A bounded LRU of the query shapes seen on one database session. A shape is prepared with
+    PREPARE once it has been executed ``threshold`` times, and the least recently used statement
+    is deallocated when there are more than ``max_size`` shapes. Prepared statements belong to the
+    db session, so a new cache is made whenever Django opens a new connection.
+    """
+
+    def __init__(self, raw_connection, max_size=100, threshold=2):
+        self.raw_connection = raw_connection
+        self.max_size = max_size
+        self.threshold = threshold
+        # fingerprint -> [statement name, None if not prepared yet, or False if it can not be prepared,
+        # number of executions]
+        self.statements = OrderedDict()
+
+    def get_statement_name(self, django_cursor, sql, connection=None):
+        """
+        Records an execution of the positional sql and prepares it when it has been seen
+        ``self.threshold`` times. If postgres can not prepare the sql, the shape is remembered and
+        always executed normally.
+
+        :param connection: The Django connection of the cursor. When it is in a transaction, the PREPARE
+            is run in a savepoint so a failure does not abort the transaction.
+        :type connection: :class:`DatabaseWrapper <django:django.db.backends.BaseDatabaseWrapper>`
+
+        :return: The name of the prepared statement, or None if the sql is not prepared
+        :rtype: str or None
+        """
+        fingerprint = get_sql_fingerprint(sql)
+        entry = self.statements.pop(fingerprint, None) or [None, 0]
+        entry[1] += 1
+        self.statements[fingerprint] = entry
+
+        if entry[0] is None and entry[1] >= self.threshold:
+            entry[0] = self.prepare(django_cursor, 'qb_{0}'.format(fingerprint), sql, connection)
+
+        while len(self.statements) > self.max_size:
+            evicted_name, uses = self.statements.popitem(last=False)[1]
+            if evicted_name:
+                django_cursor.execute('DEALLOCATE {0}'.format(evicted_name))
+
+        return entry[0] or None
+
+    def prepare(self, django_cursor, name, sql, connection=None):
+        """
+        Runs the PREPARE statement for the sql
+
+        :return: The name of the prepared statement, or False if postgres could not prepare the sql
+        :rtype: str or bool
+        """
+        savepoint_id = connection.savepoint() if connection is not None else None
+        try:
+            django_cursor.execute('PREPARE {0} AS {1}'.format(name, sql))
+        except DatabaseError:
+            if savepoint_id is not None:
+                connection.savepoint_rollback(savepoint_id)
+            return False
+        if savepoint_id is not None:
+            connection.savepoint_commit(savepoint_id)
+        return name
+
+    def clear(self, django_cursor=None):
+        """
+        Forgets all of the statements. If a cursor is passed, the prepared statements are also
+        deallocated on the db session.
+        """
+        if django_cursor is not None:
+            for name, uses in self.statements.values():
+                if name:
+                    django_cursor.execute('DEALLOCATE {0}'.format(name))
+        self.statements.clear()
+
+
+def get_prepared_statement_cache(connection, max_size=100, threshold=2):
+    """
+    Gets the ``PreparedStatementCache`` of a Django connection. The cache is stored on the
+    connection and replaced when the underlying db connection changes.
+
+    :type connection: :class:`DatabaseWrapper <django:django.db.backends.BaseDatabaseWrapper>`
+
+    :rtype: :class:`PreparedStatementCache <querybuilder.cursor.PreparedStatementCache>`
+    """
+    cache = getattr(connection, 'querybuilder_prepared_statements', None)
+    if cache is None or cache.raw_connection is not connection.connection:
+        cache = PreparedStatementCache(connection.connection, max_size=max_size, threshold=threshold)
+        connection.querybuilder_prepared_statements = cache
+    cache.max_size = max_size
+    cache.threshold = threshold
+    return cache
+
+
+def execute_prepared(django_cursor, connection, sql, sql_args=None, max_size=100, threshold=2):
+    """
+    Executes a query through a prepared statement once the shape of the query has been seen
+    ``threshold`` times on the connection, which skips parsing and planning the query on the server.
+    Until then, or if postgres can not prepare the query, the query is executed normally.
+
+    :param sql: The sql with pyformat placeholders
+    :type sql: str
+
+    :param sql_args: The args for the sql
+    :type sql_args: dict or list or None
+    """
+    # make sure the db connection is open so the cache can be tied to it
+    connection.ensure_connection()
+    positional_sql, args = get_positional_sql(sql, sql_args)
+    cache = get_prepared_statement_cache(connection, max_size=max_size, threshold=threshold)
+    name = cache.get_statement_name(django_cursor, positional_sql, connection)
+
+    if name is None:
+        django_cursor.execute(sql, sql_args)
+    elif args:
+        django_cursor.execute('EXECUTE {0} ({1})'.format(name, ', '.join(['%s'] * len(args))), args)
+    else:
+        django_cursor.execute('EXECUTE {0}'.format(name))
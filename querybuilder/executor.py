@@ -0,0 +1,254 @@
+import queue
+import threading
+from contextlib import ExitStack
+
+from django.db import connections
+
+from querybuilder.instrumentation import start_execution
+
+
+# The default number of worker threads, and so the number of connections per database, of ``run_many``
+DEFAULT_MAX_WORKERS = 8
+
+
+def get_worker_query(query):
+    """
+    Gets a query that can be executed in the current thread. Django connections can only be used
+    in the thread that opened them, so a query that was built with a connection of another thread
+    is copied with the current thread's connection to the same database.
+
+    :param query: The query to execute
+    :type query: :class:`Query <querybuilder.query.Query>`
+
+    :rtype: :class:`Query <querybuilder.query.Query>`
+    """
+    connection = connections[query.connection.alias]
+    if query.connection is connection:
+        return query
+    query = query.copy()
+    query.connection = connection
+    return query
+
+
+def run_many(queries, max_workers=None, method='select', return_exceptions=False, **kwargs):
+    """
+    Executes independent queries concurrently on a bounded pool of worker threads, so the time taken
+    is about the time of the slowest query instead of the sum of the query times. Each worker uses
+    its own connection to the database of each query and closes its connections when there are no
+    more queries. The queries can use different databases.
+
+    The workers' connections are separate from the connections of the calling thread, so the queries
+    do not see the uncommitted changes of the calling thread's transaction. If there is only one
+    worker, the queries are executed in the calling thread.
+
+    .. code-block:: python
+
+        from django.db import connections
+        from querybuilder.executor import run_many
+        from querybuilder.query import Query
+
+        accounts, orders = run_many([
+            Query().from_table(Account),
+            Query(connections['reporting']).from_table(Order),
+        ])
+
+    :param queries: The queries to execute
+    :type queries: iterable of :class:`Query <querybuilder.query.Query>`
+
+    :param max_workers: The maximum number of worker threads. Defaults to ``DEFAULT_MAX_WORKERS``
+    :type max_workers: int or None
+
+    :param method: The name of the query method to call, ex: 'select' or 'count'. Defaults to 'select'
+    :type method: str
+
+    :param return_exceptions: If True, the exception raised by a query is returned in place of its
+        result. Otherwise no more queries are started once one fails, and the exception of the first
+        failed query is raised after the running queries finish. Defaults to False
+    :type return_exceptions: bool
+
+    :param kwargs: The keyword arguments passed to the method of each query
+
+    :rtype: list
+    :return: The result of each query in the same order as the queries
+    """
+    queries = list(queries)
+    if max_workers is None:
+        max_workers = DEFAULT_MAX_WORKERS
+    num_workers = min(max_workers, len(queries))
+
+    results = [None] * len(queries)
+    errors = {}
+
+    def run_query(index, query, in_worker=False):
+        try:
+            if in_worker:
+                query = get_worker_query(query)
+            results[index] = getattr(query, method)(**kwargs)
+        except Exception as e:
+            errors[index] = e
+
+    if num_workers <= 1:
+        for index, query in enumerate(queries):
+            if errors and not return_exceptions:
+                break
+            run_query(index, query)
+    else:
+        tasks = queue.SimpleQueue()
+        for task in enumerate(queries):
+            tasks.put(task)
+
+        def work():
+            try:
+                while not errors or return_exceptions:
+                    try:
+                        index, query = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    run_query(index, query, in_worker=True)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=work, name='querybuilder-run-many') for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    if errors and not return_exceptions:
+        raise errors[min(errors)]
+
+    for index, error in errors.items():
+        results[index] = error
+    return results
+
+
+def supports_pipeline(connection):
+    """
+    Checks if statements can be sent on a django connection in psycopg 3 pipeline mode. This requires
+    postgres with psycopg 3 and libpq 14 or newer.
+
+    :param connection: The django database connection
+    :type connection: :class:`BaseDatabaseWrapper <django:django.db.backends.base.base.BaseDatabaseWrapper>`
+
+    :rtype: bool
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    if not is_psycopg3:
+        return False
+    import psycopg
+    return psycopg.Pipeline.is_supported()
+
+
+def run_pipeline(queries, return_models=False, nest=False, bypass_safe_limit=False, row_format='dict'):
+    """
+    Executes the selects of many queries with one round trip to each database. The statements of
+    the queries that use the same database are all sent on the connection in psycopg 3 pipeline
+    mode before any of the results are read. Connections that can not use pipeline mode execute the
+    selects one at a time. Unlike ``run_many``, the queries run on the calling thread's connections,
+    so they are part of its transaction.
+
+    .. code-block:: python
+
+        from querybuilder.executor import run_pipeline
+        from querybuilder.query import Query
+
+        accounts = run_pipeline([
+            Query().from_table(Account).where(id=account_id)
+            for account_id in account_ids
+        ])
+
+    :param queries: The queries to select
+    :type queries: iterable of :class:`Query <querybuilder.query.Query>`
+
+    :param return_models: Set to True to return lists of models instead of lists of dictionaries.
+        See :func:`select <querybuilder.query.Query.select>`. Defaults to False
+    :type return_models: bool
+
+    :param nest: Set to True to treat all double underscores in keynames as nested data.
+        See :func:`select <querybuilder.query.Query.select>`. Defaults to False
+    :type nest: bool
+
+    :param bypass_safe_limit: Ignores the safe_limit option even if the safe_limit is enabled.
+        See :func:`select <querybuilder.query.Query.select>`. Defaults to False
+    :type bypass_safe_limit: bool
+
+    :param row_format: The format of the returned rows. See :func:`select <querybuilder.query.Query.select>`.
+        Defaults to 'dict'
+    :type row_format: str
+
+    :rtype: list
+    :return: The rows of each query in the same order as the queries
+    """
+    if row_format != 'dict' and (return_models or nest):
+        raise ValueError('return_models and nest can only be used with the dict row_format')
+
+    queries = list(queries)
+    results = [None] * len(queries)
+
+    # the queries that use the same database are sent together
+    queries_by_alias = {}
+    for index, query in enumerate(queries):
+        queries_by_alias.setdefault(query.connection.alias, []).append((index, query))
+
+    for alias, indexed_queries in queries_by_alias.items():
+        connection = connections[alias]
+        if not supports_pipeline(connection):
+            for index, query in indexed_queries:
+                results[index] = query.select(
+                    return_models=return_models,
+                    nest=nest,
+                    bypass_safe_limit=bypass_safe_limit,
+                    row_format=row_format,
+                )
+            continue
+
+        # queries with cached results are not sent
+        pending = []
+        for index, query in indexed_queries:
+            execution = start_execution('select', alias)
+            sql, sql_args, safe_limit = query._get_select_sql(bypass_safe_limit, None, None)
+            execution.built(sql)
+            cache_key, rows = query._get_cached_rows(sql, sql_args, row_format)
+            if rows is None:
+                pending.append((index, query, sql, sql_args, safe_limit, cache_key, execution))
+            else:
+                execution.fetched(rows, cached=True)
+                results[index] = query._finish_select(rows, None, safe_limit, return_models, nest)
+                execution.finish()
+
+        if not pending:
+            continue
+
+        # each query is sent to the hooks as its own event once its rows are fetched
+        num_finished = 0
+        try:
+            connection.ensure_connection()
+            with connection.wrap_database_errors, connection.connection.pipeline(), ExitStack() as stack:
+                # the cursors are closed once all of the rows are fetched
+                cursors = []
+                for index, query, sql, sql_args, safe_limit, cache_key, execution in pending:
+                    cursor = stack.enter_context(connection.cursor())
+                    query._prepare_json_decoding(cursor)
+                    cursor.execute(sql, sql_args)
+                    execution.executed()
+                    cursors.append(cursor)
+
+                # the first fetch sends all of the statements and waits for their results
+                fetched_rows = []
+                for item, cursor in zip(pending, cursors):
+                    rows = item[1]._fetch_all(cursor, row_format)
+                    item[-1].fetched(rows)
+                    fetched_rows.append(rows)
+
+            for (index, query, sql, sql_args, safe_limit, cache_key, execution), rows in zip(pending, fetched_rows):
+                results[index] = query._finish_select(rows, cache_key, safe_limit, return_models, nest)
+                execution.finish()
+                num_finished += 1
+        except Exception as e:
+            for item in pending[num_finished:]:
+                item[-1].finish(e)
+            raise
+
+    return results
@@ -1,5 +1,7 @@
 import abc
 
+from querybuilder.helpers import clone_instance
+
 
 class FieldFactory(object):
     """
@@ -58,6 +60,7 @@ class Field(metaclass=abc.ABCMeta):
             This is a flag that is read when adding fields which could indicate some
             other fields need to be automatically created.
     """
+    __slots__ = ('field', 'name', 'table', 'alias', 'auto_alias', 'ignore', 'auto', 'cast', 'distinct')
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None):
         """
@@ -173,6 +176,30 @@ class Field(metaclass=abc.ABCMeta):
         """
         pass
 
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this field that copies the objects it references instead of deep copying
+        everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied field
+        :rtype: :class:`Field <querybuilder.fields.Field>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        Replaces the objects this copied field references with their clones. This is meant
+        to be extended by any subclass that references other mutable objects.
+        """
+        if self.table is not None:
+            self.table = self.table.clone(memo)
+
+    def __copy__(self):
+        return self.clone()
+
     def set_table(self, table):
         """
         Setter for the table. This is meant to be extended by any subclass that might need
@@ -186,6 +213,7 @@ class SimpleField(Field):
     """
     A field that is created with just the string name of the field
     """
+    __slots__ = ()
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None):
         """
@@ -215,6 +243,8 @@ class JsonField(SimpleField):
     """
     Used to access postgres native json fields
     """
+    __slots__ = ('key',)
+
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, key=None):
         super(JsonField, self).__init__(field, table, alias, cast, distinct)
         self.key = key
@@ -234,6 +264,7 @@ class MultiField(Field):
     """
     A field that contains one or more nested fields
     """
+    __slots__ = ()
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None):
         # TODO: implement handling of more than one nested field
@@ -250,6 +281,14 @@ class MultiField(Field):
         if self.field and self.field.table is None:
             self.field.set_table(self.table)
 
+    def clone_references(self, memo):
+        """
+        Also clones the nested field
+        """
+        super(MultiField, self).clone_references(memo)
+        if self.field is not None:
+            self.field = self.field.clone(memo)
+
     def get_field_identifier(self):
         """
         Gets the identifier of the nested field
@@ -261,7 +300,7 @@ class MultiField(Field):
 
 
 class ExpressionField(Field):
-    pass
+    __slots__ = ()
 
 
 class AggregateField(MultiField):
@@ -274,6 +313,7 @@ class AggregateField(MultiField):
             The aggregate function name. This is used to automatically generate the sql
             for simple aggregate functions.
     """
+    __slots__ = ('over',)
     function_name = None
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, over=None):
@@ -339,6 +379,14 @@ class AggregateField(MultiField):
         """
         return self.field.get_identifier()
 
+    def clone_references(self, memo):
+        """
+        Also clones the query window
+        """
+        super(AggregateField, self).clone_references(memo)
+        if self.over is not None:
+            self.over = self.over.clone(memo)
+
     def get_over(self):
         """
         Gets the over clause to be used in the window function sql
@@ -360,6 +408,7 @@ class CountField(AggregateField):
     """
     Count aggregation
     """
+    __slots__ = ()
     function_name = 'Count'
 
 
@@ -367,6 +416,7 @@ class AvgField(AggregateField):
     """
     Average aggregation
     """
+    __slots__ = ()
     function_name = 'Avg'
 
 
@@ -374,6 +424,7 @@ class MaxField(AggregateField):
     """
     Maximum aggregation
     """
+    __slots__ = ()
     function_name = 'Max'
 
 
@@ -381,6 +432,7 @@ class MinField(AggregateField):
     """
     Minimum aggregation
     """
+    __slots__ = ()
     function_name = 'Min'
 
 
@@ -388,6 +440,7 @@ class StdDevField(AggregateField):
     """
     Standard deviation aggregation
     """
+    __slots__ = ()
     function_name = 'StdDev'
 
 
@@ -395,6 +448,7 @@ class NumStdDevField(AggregateField):
     """
     Number of standard deviations from the average aggregation
     """
+    __slots__ = ()
     function_name = 'num_stddev'
 
     def get_select_sql(self):
@@ -413,6 +467,7 @@ class SumField(AggregateField):
     """
     Summation aggregation
     """
+    __slots__ = ()
     function_name = 'Sum'
 
 
@@ -420,6 +475,7 @@ class VarianceField(AggregateField):
     """
     Variance window function
     """
+    __slots__ = ()
     function_name = 'Variance'
 
 
@@ -427,6 +483,7 @@ class RowNumberField(AggregateField):
     """
     Row number window function
     """
+    __slots__ = ()
     function_name = 'row_number'
 
     def get_field_identifier(self):
@@ -437,6 +494,7 @@ class RankField(AggregateField):
     """
     Rank window function
     """
+    __slots__ = ()
     function_name = 'rank'
 
     def get_field_identifier(self):
@@ -447,6 +505,7 @@ class DenseRankField(AggregateField):
     """
     Dense rank window function
     """
+    __slots__ = ()
     function_name = 'dense_rank'
 
     def get_field_identifier(self):
@@ -457,6 +516,7 @@ class PercentRankField(AggregateField):
     """
     Percent rank window function
     """
+    __slots__ = ()
     function_name = 'percent_rank'
 
     def get_field_identifier(self):
@@ -467,6 +527,7 @@ class CumeDistField(AggregateField):
     """
     Cume dist window function
     """
+    __slots__ = ()
     function_name = 'cume_dist'
 
     def get_field_identifier(self):
@@ -477,6 +538,7 @@ class NTileField(AggregateField):
     """
     NTile window function
     """
+    __slots__ = ('num_buckets',)
     function_name = 'ntile'
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, over=None, num_buckets=1):
@@ -522,6 +584,7 @@ class LeadLagField(AggregateField):
     """
     Base class for lag and lead window functions
     """
+    __slots__ = ('offset', 'default')
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, over=None, offset=1, default=None):
         """
@@ -569,6 +632,7 @@ class LagField(LeadLagField):
     """
     Lag window function
     """
+    __slots__ = ()
     function_name = 'lag'
 
 
@@ -576,6 +640,7 @@ class LeadField(LeadLagField):
     """
     Lead window function
     """
+    __slots__ = ()
     function_name = 'lead'
 
 
@@ -583,6 +648,8 @@ class LeadLagDifferenceField(LeadLagField):
     """
     Base class for lag difference and lead difference window functions
     """
+    __slots__ = ()
+
     def get_select_sql(self):
         """
         Calculate the difference between this record's value and the lag/lead record's value
@@ -599,6 +666,7 @@ class LagDifferenceField(LeadLagDifferenceField):
     """
     Lag difference window function
     """
+    __slots__ = ()
     function_name = 'lag'
 
 
@@ -606,6 +674,7 @@ class LeadDifferenceField(LeadLagDifferenceField):
     """
     Lead difference window function
     """
+    __slots__ = ()
     function_name = 'lead'
 
 
@@ -613,6 +682,7 @@ class FirstValueField(AggregateField):
     """
     First value window function
     """
+    __slots__ = ()
     function_name = 'first_value'
 
 
@@ -620,6 +690,7 @@ class LastValueField(AggregateField):
     """
     Last value window function
     """
+    __slots__ = ()
     function_name = 'last_value'
 
 
@@ -627,6 +698,7 @@ class NthValueField(AggregateField):
     """
     Nth value window function
     """
+    __slots__ = ('n',)
     function_name = 'nth_value'
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, over=None, n=1):
@@ -677,6 +749,7 @@ class DatePartField(MultiField):
         group_name: str
             The name of the date part
     """
+    __slots__ = ('desc', 'include_datetime')
     group_name = None
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, auto=False, desc=False,
@@ -812,6 +885,7 @@ class AllTime(DatePartField):
     """
     Date group will be over the whole time range
     """
+    __slots__ = ()
     group_name = 'all'
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, auto=False, desc=False,
@@ -824,6 +898,7 @@ class NoneTime(DatePartField):
     """
     No date grouping is used
     """
+    __slots__ = ()
     group_name = 'none'
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, auto=False, desc=False,
@@ -836,6 +911,7 @@ class Year(DatePartField):
     """
     Extract the year from the datetime
     """
+    __slots__ = ()
     group_name = 'year'
 
 
@@ -843,6 +919,7 @@ class Month(DatePartField):
     """
     Extract the month from the datetime
     """
+    __slots__ = ()
     group_name = 'month'
 
 
@@ -850,6 +927,7 @@ class Day(DatePartField):
     """
     Extract the day from the datetime
     """
+    __slots__ = ()
     group_name = 'day'
 
 
@@ -857,6 +935,7 @@ class Hour(DatePartField):
     """
     Extract the hour from the datetime
     """
+    __slots__ = ()
     group_name = 'hour'
 
 
@@ -864,6 +943,7 @@ class Minute(DatePartField):
     """
     Extract the minute from the datetime
     """
+    __slots__ = ()
     group_name = 'minute'
 
 
@@ -871,6 +951,7 @@ class Second(DatePartField):
     """
     Extract the second from the datetime
     """
+    __slots__ = ()
     group_name = 'second'
 
 
@@ -878,6 +959,7 @@ class Week(DatePartField):
     """
     Extract the week from the datetime
     """
+    __slots__ = ()
     group_name = 'week'
 
 
@@ -885,6 +967,7 @@ class Epoch(DatePartField):
     """
     Extract the epoch from the datetime
     """
+    __slots__ = ('date_group_name',)
     group_name = 'epoch'
 
     def __init__(self, field=None, table=None, alias=None, cast=None, distinct=None, auto=False, desc=False,
@@ -897,6 +980,7 @@ class GroupEpoch(Epoch):
     """
     Epoch used for a date grouping
     """
+    __slots__ = ()
 
     def get_select_sql(self):
         return 'EXTRACT({0} FROM date_trunc(\'{1}\', {2}))'.format(
@@ -910,6 +994,8 @@ class AllEpoch(Epoch):
     """
     Epoch used for all grouping
     """
+    __slots__ = ()
+
     def get_select_sql(self):
         return 0
 
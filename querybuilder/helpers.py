@@ -1,3 +1,14 @@
+import base64
+import datetime
+import decimal
+import json
+import uuid
+from functools import lru_cache
+
+from django.utils.dateparse import parse_duration
+from django.utils.duration import duration_iso_string
+
+
 def value_for_keypath(dict, keypath):
     """
     Returns the value of a keypath in a dictionary
@@ -53,13 +64,158 @@ def set_value_for_keypath(item, keypath, value, create_if_needed=False, delimete
         return None
 
 
-class Empty:
-    pass
+@lru_cache(maxsize=256)
+def get_nesting_plan(keys, delimeter='__'):
+    """
+    Gets the plan used by ``nest_row`` to nest the values of rows with the keys. Each key that
+    contains the delimeter is split once into the keys of the dictionaries its value is nested in
+    and the key of the value.
+
+    :param keys: The keys of the rows
+    :type keys: tuple of str
+
+    :rtype: tuple of tuple
+    :return: A tuple of (key, parent keys, value key) for each key that contains the delimeter
+    """
+    plan = []
+    for key in keys:
+        if delimeter in key:
+            path = key.split(delimeter)
+            plan.append((key, tuple(path[:-1]), path[-1]))
+    return tuple(plan)
+
+
+def nest_row(row, plan):
+    """
+    Nests the values of a row in place using a plan from ``get_nesting_plan``. This is the same as
+    calling ``set_value_for_keypath(row, key, value, True, '__')`` and removing the key for each
+    key with double underscores. Ex: {"id": 1, "account__id": 1} becomes {"id": 1, "account": {"id": 1}}
+
+    :return: The row
+    :rtype: dict
+    """
+    for key, parent_keys, value_key in plan:
+        value = row.pop(key)
+        item = row
+        for parent_key in parent_keys:
+            item = item.setdefault(parent_key, {})
+        # an empty value key only creates the parent dictionaries, like set_value_for_keypath
+        if value_key:
+            item[value_key] = value
+    return row
+
+
+@lru_cache(maxsize=None)
+def get_slot_names(cls):
+    """
+    Gets the names of all of the ``__slots__`` declared by a class and its base classes
+    """
+    slot_names = []
+    for base in cls.__mro__:
+        slots = base.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for slot_name in slots:
+            if slot_name not in ('__dict__', '__weakref__') and slot_name not in slot_names:
+                slot_names.append(slot_name)
+    return tuple(slot_names)
 
 
 def copy_instance(instance):
-    obj = Empty()
-    obj.__class__ = instance.__class__
+    """
+    Makes a shallow copy of an instance without calling its ``__init__``. The slots of the
+    instance are copied along with its ``__dict__`` if it has one, so subclasses of slotted
+    classes that don't declare their own ``__slots__`` are copied too.
+    """
+    cls = instance.__class__
+    obj = cls.__new__(cls)
     # Copy references to everything.
-    obj.__dict__ = instance.__dict__.copy()
+    for slot_name in get_slot_names(cls):
+        try:
+            setattr(obj, slot_name, getattr(instance, slot_name))
+        except AttributeError:
+            # the slot was never set
+            pass
+    instance_dict = getattr(instance, '__dict__', None)
+    if instance_dict is not None:
+        obj.__dict__.update(instance_dict)
+    return obj
+
+
+def clone_instance(instance, memo=None):
+    """
+    Makes a structural copy of an instance. The instance is shallow copied with ``copy_instance``
+    and then its ``clone_references`` method replaces the mutable objects it references with their
+    clones. The memo maps the id of each object that has been copied to its copy, so an object that
+    is referenced more than once is only copied once and the copies reference each other.
+    """
+    if memo is None:
+        memo = {}
+    key = id(instance)
+    if key in memo:
+        return memo[key]
+    obj = copy_instance(instance)
+    memo[key] = obj
+    obj.clone_references(memo)
     return obj
+
+
+# The types of sort values that are not json types, with functions to encode them as strings and decode them
+KEYSET_VALUE_TYPES = (
+    ('datetime', datetime.datetime, datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    ('date', datetime.date, datetime.date.isoformat, datetime.date.fromisoformat),
+    ('time', datetime.time, datetime.time.isoformat, datetime.time.fromisoformat),
+    ('duration', datetime.timedelta, duration_iso_string, parse_duration),
+    ('decimal', decimal.Decimal, str, decimal.Decimal),
+    ('uuid', uuid.UUID, str, uuid.UUID),
+)
+KEYSET_VALUE_DECODERS = {tag: decode for tag, value_type, encode, decode in KEYSET_VALUE_TYPES}
+
+
+def encode_keyset_value(value):
+    """
+    Encodes a sort value as a list of its type tag and its json value. Values that are not json types,
+    like datetimes, are encoded as strings that decode to the exact same value, including microseconds.
+    """
+    # datetime is checked before date because it is a subclass of date
+    for tag, value_type, encode, decode in KEYSET_VALUE_TYPES:
+        if isinstance(value, value_type):
+            return [tag, encode(value)]
+    return [None, value]
+
+
+def decode_keyset_value(item):
+    """
+    Decodes a sort value encoded by ``encode_keyset_value``
+    """
+    tag, value = item
+    if tag is None:
+        return value
+    decode = KEYSET_VALUE_DECODERS[tag]
+    decoded = decode(value)
+    if decoded is None:
+        # parse_duration returns None instead of raising
+        raise ValueError('Invalid {0} value'.format(tag))
+    return decoded
+
+
+def encode_keyset_token(values):
+    """
+    Encodes the sort values of the last row of a page as an opaque token for keyset pagination.
+    Each value is tagged with its type so the token decodes to the exact values of the row.
+    """
+    data = json.dumps([encode_keyset_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_keyset_token(token):
+    """
+    Decodes a token created by ``encode_keyset_token`` back to the list of sort values
+    """
+    try:
+        items = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        if not isinstance(items, list):
+            raise ValueError('Expected a list of values')
+        return [decode_keyset_value(item) for item in items]
+    except (ValueError, TypeError, KeyError, UnicodeError, decimal.InvalidOperation):
+        raise ValueError('Invalid keyset pagination token')
@@ -0,0 +1,463 @@
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from querybuilder.cursor import get_sql_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# The functions that are called with a ``QueryEvent`` after each instrumented execution
+query_hooks = []
+
+
+def add_query_hook(hook):
+    """
+    Registers a function that is called with a :class:`QueryEvent <querybuilder.instrumentation.QueryEvent>`
+    each time a query is executed by ``select``, ``iter_select``, ``insert``, ``copy_insert``, ``update``,
+    ``upsert``, ``explain``, one of the aggregate methods like ``count``, their async versions, or
+    :func:`run_pipeline <querybuilder.executor.run_pipeline>`. The events do not depend on django's
+    ``DEBUG`` setting. Queries are not timed while no hooks are registered. Errors raised by a hook are
+    logged and do not fail the query.
+
+    :param hook: A function that takes an event
+    :type hook: function
+    """
+    if hook not in query_hooks:
+        query_hooks.append(hook)
+
+
+def remove_query_hook(hook):
+    """
+    Unregisters a function registered with ``add_query_hook``
+    """
+    if hook in query_hooks:
+        query_hooks.remove(hook)
+
+
+def estimate_value_bytes(value):
+    """
+    Estimates the number of bytes of a selected value. Strings and bytes count their length,
+    containers count their items, and other values count as 8 bytes. The values of a dict are read
+    without decoding the pending values of a ``LazyJsonRow``.
+
+    :rtype: int
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_value_bytes(item) for item in dict.values(value))
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_value_bytes(item) for item in value)
+    return 8
+
+
+def estimate_rows_bytes(rows):
+    """
+    Estimates the number of bytes of fetched rows in any of the row formats of ``select``
+
+    :rtype: int
+    """
+    if isinstance(rows, dict):
+        return sum(estimate_value_bytes(values) for values in rows.values())
+    return sum(estimate_value_bytes(row) for row in rows)
+
+
+def count_rows(rows):
+    """
+    Counts the fetched rows in any of the row formats of ``select``
+
+    :rtype: int
+    """
+    if isinstance(rows, dict):
+        return len(next(iter(rows.values()), []))
+    return len(rows)
+
+
+class QueryEvent(object):
+    """
+    The timings and size of one execution of a query. Times are in seconds.
+
+    Properties:
+
+        method: str
+            The name of the query method that was called, ex: 'select' or 'count'
+
+        alias: str
+            The alias of the connection the query ran on
+
+        sql: str or None
+            The sql of the first statement that was executed
+
+        fingerprint: str or None
+            The normalized fingerprint of the sql. See :func:`get_sql_fingerprint
+            <querybuilder.cursor.get_sql_fingerprint>`
+
+        build_time: float
+            The time spent building the sql
+
+        execute_time: float
+            The time spent executing the statements, including getting a cursor
+
+        fetch_time: float
+            The time spent fetching and decoding the rows
+
+        total_time: float
+            The time of the whole call
+
+        statement_count: int
+            The number of statements that were executed
+
+        row_count: int
+            The number of rows selected or returned, or the number of rows written
+
+        byte_estimate: int
+            An estimate of the size of the fetched rows. See :func:`estimate_rows_bytes
+            <querybuilder.instrumentation.estimate_rows_bytes>`
+
+        cached: bool
+            True if the rows came from the result cache
+
+        error: Exception or None
+            The exception raised by the call
+    """
+    __slots__ = (
+        'method', 'alias', 'sql', 'fingerprint', 'build_time', 'execute_time', 'fetch_time', 'total_time',
+        'statement_count', 'row_count', 'byte_estimate', 'cached', 'error',
+    )
+
+    def __init__(self, method, alias):
+        self.method = method
+        self.alias = alias
+        self.sql = None
+        self.fingerprint = None
+        self.build_time = 0.0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.total_time = 0.0
+        self.statement_count = 0
+        self.row_count = 0
+        self.byte_estimate = 0
+        self.cached = False
+        self.error = None
+
+
+class QueryExecution(object):
+    """
+    Times the steps of an instrumented call. Each step is timed from the end of the previous step.
+    Calls made while another call is instrumented, like the select of ``count``, are part of the
+    outer call's event.
+    """
+    __slots__ = ('event', 'start_time', 'mark_time')
+
+    def __init__(self, method, alias):
+        self.event = QueryEvent(method, alias)
+        self.start_time = self.mark_time = time.perf_counter()
+
+    def get_elapsed(self):
+        """
+        Gets the time since the end of the last step and starts the next step
+
+        :rtype: float
+        """
+        now = time.perf_counter()
+        elapsed = now - self.mark_time
+        self.mark_time = now
+        return elapsed
+
+    def resume(self):
+        """
+        Starts the next step without recording the time since the last step, like the time a
+        generator's caller spends on the rows it was given
+        """
+        self.mark_time = time.perf_counter()
+
+    def built(self, sql):
+        """
+        Records the time spent building a statement
+        """
+        self.event.build_time += self.get_elapsed()
+        if self.event.sql is None:
+            self.event.sql = sql
+
+    def executed(self, row_count=None):
+        """
+        Records the time spent executing a statement and the number of rows it wrote
+        """
+        self.event.execute_time += self.get_elapsed()
+        self.event.statement_count += 1
+        if row_count is not None and row_count > 0:
+            self.event.row_count += row_count
+
+    def fetched(self, rows, cached=False):
+        """
+        Records the time spent fetching rows and their count and size
+        """
+        self.event.fetch_time += self.get_elapsed()
+        self.event.row_count += count_rows(rows)
+        self.event.byte_estimate += estimate_rows_bytes(rows)
+        self.event.cached = self.event.cached or cached
+
+    def finish(self, error=None):
+        """
+        Sends the event to the hooks. An error raised by a hook is logged instead of raised, so it
+        does not fail the query or replace the query's own error.
+        """
+        event = self.event
+        event.total_time = time.perf_counter() - self.start_time
+        event.error = error
+        if event.sql is not None:
+            event.fingerprint = get_sql_fingerprint(event.sql, normalize=True)
+        for hook in list(query_hooks):
+            try:
+                hook(event)
+            except Exception:
+                logger.exception('Query hook %r raised an error', hook)
+
+
+class NullExecution(object):
+    """
+    Used in place of a ``QueryExecution`` when nothing is instrumented
+    """
+    __slots__ = ()
+
+    def built(self, sql):
+        pass
+
+    def executed(self, row_count=None):
+        pass
+
+    def fetched(self, rows, cached=False):
+        pass
+
+    def resume(self):
+        pass
+
+    def finish(self, error=None):
+        pass
+
+
+null_execution = NullExecution()
+current_execution = ContextVar('querybuilder_execution', default=null_execution)
+
+
+def get_execution():
+    """
+    Gets the execution of the instrumented call that is running, or a ``NullExecution``
+
+    :rtype: :class:`QueryExecution <querybuilder.instrumentation.QueryExecution>`
+    """
+    return current_execution.get()
+
+
+def start_execution(method, alias):
+    """
+    Starts timing an execution that can not be wrapped by ``instrumented``, like the statement of a
+    generator or one of several statements sent at once. The caller records the steps and calls
+    ``finish`` on the execution, which is always sent as its own event.
+
+    :param method: The name of the query method
+    :type method: str
+
+    :param alias: The alias of the connection the query runs on
+    :type alias: str
+
+    :rtype: :class:`QueryExecution <querybuilder.instrumentation.QueryExecution>` or
+        :class:`NullExecution <querybuilder.instrumentation.NullExecution>`
+    :return: A new execution, or the null execution if no hooks are registered
+    """
+    if not query_hooks:
+        return null_execution
+    return QueryExecution(method, alias)
+
+
+def enter_execution(method, alias):
+    """
+    Starts the execution of an instrumented call unless the call is part of another instrumented call
+
+    :rtype: tuple
+    :return: The execution and the token to reset it with, or None if the call is part of another call
+    """
+    execution = current_execution.get()
+    if execution is not null_execution:
+        return execution, None
+    execution = QueryExecution(method, alias)
+    return execution, current_execution.set(execution)
+
+
+def exit_execution(execution, token, error=None):
+    """
+    Ends the execution of an instrumented call that was started by ``enter_execution``
+    """
+    if token is not None:
+        current_execution.reset(token)
+        execution.finish(error)
+
+
+def instrumented(method):
+    """
+    Decorates a ``Query`` method to send a ``QueryEvent`` to the hooks after each call. The method
+    records its steps on ``get_execution()``. Async methods are timed until their result is awaited.
+    """
+    if inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            if not query_hooks:
+                return await method(self, *args, **kwargs)
+
+            execution, token = enter_execution(method.__name__, self.connection.alias)
+            try:
+                result = await method(self, *args, **kwargs)
+            except Exception as e:
+                exit_execution(execution, token, e)
+                raise
+            exit_execution(execution, token)
+            return result
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not query_hooks:
+            return method(self, *args, **kwargs)
+
+        execution, token = enter_execution(method.__name__, self.connection.alias)
+        try:
+            result = method(self, *args, **kwargs)
+        except Exception as e:
+            exit_execution(execution, token, e)
+            raise
+        exit_execution(execution, token)
+        return result
+    return wrapper
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    Gets a percentile of sorted values with the nearest rank method
+
+    :param percentile: The percentile from 0 to 100
+    :type percentile: float
+
+    :rtype: float or None
+    """
+    if not sorted_values:
+        return None
+    rank = max(int(-(-percentile * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+class QueryStats(object):
+    """
+    An in-process aggregate of query events by fingerprint. Register it as a hook to collect the
+    stats of every query:
+
+    .. code-block:: python
+
+        from querybuilder.instrumentation import QueryStats
+
+        stats = QueryStats().install()
+        ...
+        for fingerprint, summary in stats.get_summary().items():
+            print(summary['sql'], summary['count'], summary['p95'])
+    """
+
+    def __init__(self, max_samples=1000):
+        """
+        :param max_samples: The number of the most recent times of each fingerprint that the
+            percentiles are computed from
+        :type max_samples: int
+        """
+        self.max_samples = max_samples
+        # fingerprint -> dict of the totals and recent times
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        self.add_event(event)
+
+    def install(self):
+        """
+        Registers this as a query hook
+
+        :return: self
+        """
+        add_query_hook(self)
+        return self
+
+    def uninstall(self):
+        """
+        Unregisters this as a query hook
+        """
+        remove_query_hook(self)
+
+    def add_event(self, event):
+        """
+        Adds an event to the totals of its fingerprint. Events without sql are ignored.
+
+        :type event: :class:`QueryEvent <querybuilder.instrumentation.QueryEvent>`
+        """
+        if event.fingerprint is None:
+            return
+
+        with self.lock:
+            entry = self.entries.get(event.fingerprint)
+            if entry is None:
+                entry = self.entries[event.fingerprint] = {
+                    'sql': event.sql,
+                    'method': event.method,
+                    'count': 0,
+                    'errors': 0,
+                    'cached': 0,
+                    'rows': 0,
+                    'bytes': 0,
+                    'build_time': 0.0,
+                    'execute_time': 0.0,
+                    'fetch_time': 0.0,
+                    'total_time': 0.0,
+                    'times': deque(maxlen=self.max_samples),
+                }
+            entry['count'] += 1
+            entry['errors'] += event.error is not None
+            entry['cached'] += event.cached
+            entry['rows'] += event.row_count
+            entry['bytes'] += event.byte_estimate
+            entry['build_time'] += event.build_time
+            entry['execute_time'] += event.execute_time
+            entry['fetch_time'] += event.fetch_time
+            entry['total_time'] += event.total_time
+            entry['times'].append(event.total_time)
+
+    def get_summary(self):
+        """
+        Gets the totals and the p50, p95, and p99 of the total time of the recent calls of each fingerprint
+
+        :rtype: dict
+        :return: A dict of the stats of each fingerprint
+        """
+        with self.lock:
+            entries = {
+                fingerprint: dict(entry, times=sorted(entry['times']))
+                for fingerprint, entry in self.entries.items()
+            }
+
+        summary = {}
+        for fingerprint, entry in entries.items():
+            times = entry.pop('times')
+            entry['mean'] = entry['total_time'] / entry['count']
+            entry['p50'] = get_percentile(times, 50)
+            entry['p95'] = get_percentile(times, 95)
+            entry['p99'] = get_percentile(times, 99)
+            summary[fingerprint] = entry
+        return summary
+
+    def reset(self):
+        """
+        Removes the stats of all fingerprints
+        """
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,251 @@
+import threading
+
+from django.core.signals import setting_changed
+from django.db.models.signals import class_prepared
+
+
+model_metadata_cache = {}
+model_metadata_lock = threading.Lock()
+
+
+class ModelMetadata(object):
+    """
+    The parts of a model's meta data that are used to build queries. This is read from the model
+    once and cached by ``get_model_metadata`` so that expanding fields and building joins are
+    dict lookups instead of scans over the model's fields and relations.
+    """
+
+    def __init__(self, model):
+        """
+        :param model: The django model class
+        :type model: :class:`Model <django:django.db.models.Model>`
+        """
+        meta = model._meta
+        self.model = model
+        self.db_table = meta.db_table
+        self.fields = list(meta.fields)
+        self.concrete_fields = list(meta.concrete_fields)
+        self.concrete_attnames = [field.attname for field in self.concrete_fields]
+        self.column_names = [field.column for field in self.fields]
+        self.pk_name = meta.pk.name if meta.pk else None
+        self.pk_column = meta.pk.column if meta.pk else None
+        self.fields_by_name = {}
+        for field in meta.get_fields():
+            if field.concrete:
+                self.fields_by_name[field.name] = field
+                self.fields_by_name.setdefault(field.attname, field)
+
+        # related model -> the first reverse relation to it
+        self.all_related_objects = self.get_all_related_objects(meta)
+        self.related_objects = {}
+        for field in self.all_related_objects:
+            related_model = field.model
+            if hasattr(field, 'related_model'):
+                related_model = field.related_model
+            self.related_objects.setdefault(related_model, field)
+        self.related_objects_by_accessor = {
+            field.get_accessor_name(): field for field in self.all_related_objects
+        }
+
+        # related model -> the first foreign key or one to one field to it
+        self.foreign_keys = {}
+        for field in self.fields:
+            if field.get_internal_type() == 'OneToOneField' or field.get_internal_type() == 'ForeignKey':
+                self.foreign_keys.setdefault(field.remote_field.model, field)
+
+        # connection vendor -> field name -> db type
+        self.db_types = {}
+
+        # (connection vendor, field names) -> first row placeholders of an update
+        self.update_casts = {}
+
+        # row keys -> hydration plan
+        self.hydration_plans = {}
+
+    def get_all_related_objects(self, meta):
+        """
+        Gets the reverse one to many and one to one relations of the model
+        """
+        return [
+            f for f in meta.get_fields()
+            if (f.one_to_many or f.one_to_one) and f.auto_created and not f.concrete
+        ]
+
+    def get_field(self, field_name):
+        """
+        Gets a concrete field by its name or attname
+
+        :raises FieldDoesNotExist: if the model doesn't have the field
+        """
+        field = self.fields_by_name.get(field_name)
+        if field is None:
+            # let django raise the usual error
+            return self.model._meta.get_field(field_name)
+        return field
+
+    def get_db_type(self, field_name, connection):
+        """
+        Gets the db type of a field for the connection. Db types are cached per connection vendor.
+
+        :rtype: str
+        """
+        db_types = self.db_types.get(connection.vendor)
+        if db_types is None:
+            db_types = self.db_types.setdefault(connection.vendor, {})
+        if field_name not in db_types:
+            db_types[field_name] = self.get_field(field_name).db_type(connection)
+        return db_types[field_name]
+
+    def get_hydration_plan(self, keys):
+        """
+        Gets the plan used by ``hydrate`` to build instances from rows with the keys. Each key is
+        matched to the concrete field with that attname or column once for all of the rows.
+
+        :param keys: The keys of the rows
+        :type keys: tuple of str
+
+        :rtype: tuple
+        :return: A tuple of the (key or None, field) of each concrete field in the order the model's
+            ``__init__`` takes them, and the keys that are not fields
+        """
+        plan = self.hydration_plans.get(keys)
+        if plan is None:
+            fields_by_key = {}
+            for field in self.concrete_fields:
+                fields_by_key.setdefault(field.column, field)
+            for field in self.concrete_fields:
+                fields_by_key[field.attname] = field
+
+            field_keys = {}
+            extra_keys = []
+            for key in keys:
+                field = fields_by_key.get(key)
+                if field is None or field.attname in field_keys:
+                    extra_keys.append(key)
+                else:
+                    field_keys[field.attname] = key
+
+            plan = (
+                tuple((field_keys.get(field.attname), field) for field in self.concrete_fields),
+                tuple(extra_keys),
+            )
+            self.hydration_plans[keys] = plan
+        return plan
+
+    def hydrate(self, row, db, plan=None):
+        """
+        Builds a model instance from a row with the model's ``from_db``, so the instance is marked as
+        loaded from the db. Fields that are not in the row are set to their defaults, and keys that
+        are not fields are set as attributes.
+
+        :param row: The row selected from the db
+        :type row: dict
+
+        :param db: The alias of the connection the row was selected from
+        :type db: str
+
+        :param plan: The plan from ``get_hydration_plan`` for the keys of the row
+        :type plan: tuple or None
+
+        :rtype: :class:`Model <django:django.db.models.Model>`
+        """
+        if plan is None:
+            plan = self.get_hydration_plan(tuple(row))
+        field_keys, extra_keys = plan
+        instance = self.model.from_db(
+            db,
+            self.concrete_attnames,
+            [row[key] if key is not None else field.get_default() for key, field in field_keys]
+        )
+        for key in extra_keys:
+            setattr(instance, key, row[key])
+        return instance
+
+    def get_related_cache(self, name, related_model):
+        """
+        Gets how an instance of a related model selected with a join is attached to an instance of
+        this model, so it is returned by the relation's descriptor without another query.
+
+        :param name: The name of the forward relation or the accessor of the reverse relation
+        :type name: str
+
+        :rtype: tuple
+        :return: The relation field and the reverse relation field if the related instance can be
+            cached on both instances, otherwise (None, None)
+        """
+        field = self.fields_by_name.get(name)
+        if field is not None and field.is_relation and (field.many_to_one or field.one_to_one):
+            if issubclass(related_model, field.remote_field.model):
+                return field, field.remote_field if field.one_to_one else None
+            return None, None
+
+        field = self.related_objects_by_accessor.get(name)
+        if field is not None and field.one_to_one and issubclass(related_model, field.related_model):
+            return field, field.field
+        return None, None
+
+
+def set_related_instance(instance, related_instance, field, remote_field=None):
+    """
+    Attaches a related instance selected with a join to an instance like the relation's descriptor does,
+    without its checks. The foreign key attname is set from the related instance when it was not selected,
+    and the related instance is stored in the related object cache of both instances.
+
+    :param field: The relation field from ``ModelMetadata.get_related_cache``
+    :param remote_field: The reverse relation field from ``ModelMetadata.get_related_cache``
+    """
+    if field.concrete:
+        # a forward relation, so the instance has the foreign key
+        for local_field, related_field in field.related_fields:
+            value = getattr(related_instance, related_field.attname)
+            if value is not None:
+                setattr(instance, local_field.attname, value)
+    else:
+        # a reverse one to one relation, so the related instance has the foreign key
+        for local_field, related_field in field.field.related_fields:
+            value = getattr(instance, related_field.attname)
+            if value is not None:
+                setattr(related_instance, local_field.attname, value)
+
+    field.set_cached_value(instance, related_instance)
+    if remote_field is not None:
+        remote_field.set_cached_value(related_instance, instance)
+
+
+def get_model_metadata(model):
+    """
+    Gets the cached meta data of a model. The cache is cleared whenever the app registry changes.
+
+    :param model: The django model class
+    :type model: :class:`Model <django:django.db.models.Model>`
+
+    :rtype: :class:`ModelMetadata <querybuilder.metadata.ModelMetadata>`
+    """
+    metadata = model_metadata_cache.get(model)
+    if metadata is None:
+        metadata = ModelMetadata(model)
+        with model_metadata_lock:
+            metadata = model_metadata_cache.setdefault(model, metadata)
+    return metadata
+
+
+def clear_model_metadata_cache(**kwargs):
+    """
+    Clears the meta data of all models
+    """
+    with model_metadata_lock:
+        model_metadata_cache.clear()
+
+
+def on_class_prepared(sender, **kwargs):
+    # a new model can add reverse relations to models that are already cached
+    clear_model_metadata_cache()
+
+
+def on_setting_changed(setting, **kwargs):
+    if setting == 'INSTALLED_APPS':
+        clear_model_metadata_cache()
+
+
+class_prepared.connect(on_class_prepared, dispatch_uid='querybuilder_metadata_class_prepared')
+setting_changed.connect(on_setting_changed, dispatch_uid='querybuilder_metadata_setting_changed')
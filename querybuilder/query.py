@@ -1,21 +1,38 @@
-from copy import deepcopy
+import json
+import re
+from contextlib import nullcontext
+from itertools import islice
 
+from asgiref.sync import sync_to_async
 from django import VERSION
-from django.db import connection as default_django_connection
+from django.db import connection as default_django_connection, transaction
 from django.db.models import Q, AutoField
 from django.db.models.query import QuerySet
 from django.db.models.constants import LOOKUP_SEP
 from django.apps import apps
 get_model = apps.get_model
 
+from querybuilder import aio
+from querybuilder.cache import get_result_cache_key
+from querybuilder.cursor import copy_rows, execute_prepared, jsonify_cursor
 from querybuilder.fields import FieldFactory, CountField, MaxField, MinField, SumField, AvgField
-from querybuilder.helpers import set_value_for_keypath, copy_instance
+from querybuilder.helpers import (
+    copy_instance, clone_instance, decode_keyset_token, encode_keyset_token, get_nesting_plan, nest_row
+)
+from querybuilder.instrumentation import get_execution, instrumented, start_execution
+from querybuilder.metadata import get_model_metadata, set_related_instance
 from querybuilder.tables import TableFactory, ModelTable, QueryTable
-from querybuilder.utils import json_fetch_all_as_dict
+from querybuilder.utils import (
+    json_fetch_all, json_fetch_all_as_dict, json_fetch_many_as_dict, json_format_rows, json_rows_as_lazy_dict,
+    json_rows_as_dict, get_json_decoder
+)
 
 
 SERIAL_DTYPES = ['serial', 'bigserial']
 
+# Splits a json field like data->'a'->>'b' into its column and keys
+JSON_PATH_PATTERN = re.compile(r'\s*(->>?)\s*')
+
 
 class Join(object):
     """
@@ -90,6 +107,32 @@ class Join(object):
             field_prefix=field_prefix,
         ))
 
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this join that copies its tables instead of deep copying
+        everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied join
+        :rtype: :class:`Join <querybuilder.query.Join>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        Replaces the owner and tables of this copied join with their clones
+        """
+        self.owner = memo.get(id(self.owner), self.owner)
+        if self.left_table is not None:
+            self.left_table = self.left_table.clone(memo)
+        if self.right_table is not None:
+            self.right_table = self.right_table.clone(memo)
+
+    def __copy__(self):
+        return self.clone()
+
     def get_sql(self):
         """
         Generates the JOIN sql for the join tables and join condition
@@ -132,17 +175,10 @@ class Join(object):
 
     def get_all_related_objects(self, table):
         """
-        Fix for django 1.10 to replace deprecated code. Keep support for django 1.7
+        Gets the reverse one to many and one to one relations of a table's model from the cached
+        model meta data. See :class:`ModelMetadata <querybuilder.metadata.ModelMetadata>`
         """
-        # Django 1.7 method
-        if hasattr(table.model._meta, 'get_all_related_objects'):
-            return table.model._meta.get_all_related_objects()
-        else:
-            # Django > 1.7
-            return [
-                f for f in table.model._meta.get_fields()
-                if (f.one_to_many or f.one_to_one) and f.auto_created and not f.concrete
-            ]
+        return list(get_model_metadata(table.model).all_related_objects)
 
     def set_right_table(self, table):
         """
@@ -157,27 +193,23 @@ class Join(object):
         if type(self.left_table) is ModelTable and type(self.right_table) is ModelTable:
             # loop through fields to find the field for this model
 
+            left_metadata = get_model_metadata(self.left_table.model)
+
             # check if this join type is for a related field
-            for field in self.get_all_related_objects(self.left_table):
-                related_model = field.model
-                if hasattr(field, 'related_model'):
-                    related_model = field.related_model
-                if related_model == self.right_table.model:
-                    if self.right_table.field_prefix is None:
-                        self.right_table.field_prefix = field.get_accessor_name()
-                        if len(self.right_table.field_prefix) > 4 and self.right_table.field_prefix[-4:] == '_set':
-                            self.right_table.field_prefix = self.right_table.field_prefix[:-4]
-                    return
+            field = left_metadata.related_objects.get(self.right_table.model)
+            if field is not None:
+                if self.right_table.field_prefix is None:
+                    self.right_table.field_prefix = field.get_accessor_name()
+                    if len(self.right_table.field_prefix) > 4 and self.right_table.field_prefix[-4:] == '_set':
+                        self.right_table.field_prefix = self.right_table.field_prefix[:-4]
+                return
 
             # check if this join type is for a foreign key
-            for field in self.left_table.model._meta.fields:
-                if (
-                    field.get_internal_type() == 'OneToOneField' or field.get_internal_type() == 'ForeignKey'
-                ):
-                    if field.remote_field.model == self.right_table.model:
-                        if self.right_table.field_prefix is None:
-                            self.right_table.field_prefix = field.name
-                        return
+            field = left_metadata.foreign_keys.get(self.right_table.model)
+            if field is not None:
+                if self.right_table.field_prefix is None:
+                    self.right_table.field_prefix = field.name
+                return
 
     def get_condition(self):
         """
@@ -192,37 +224,33 @@ class Join(object):
         if type(self.right_table) is ModelTable and type(self.right_table) is ModelTable:
             # loop through fields to find the field for this model
 
+            right_metadata = get_model_metadata(self.right_table.model)
+
             # check if this join type is for a related field
-            for field in self.get_all_related_objects(self.right_table):
-                related_model = field.model
-                if hasattr(field, 'related_model'):
-                    related_model = field.related_model
-                if related_model == self.left_table.model:
-                    table_join_field = field.field.column
-                    # self.table_join_name = field.get_accessor_name()
-                    condition = '{0}.{1} = {2}.{3}'.format(
-                        self.right_table.get_identifier(),
-                        self.right_table.model._meta.pk.name,
-                        self.left_table.get_identifier(),
-                        table_join_field,
-                    )
-                    return condition
+            field = right_metadata.related_objects.get(self.left_table.model)
+            if field is not None:
+                table_join_field = field.field.column
+                # self.table_join_name = field.get_accessor_name()
+                condition = '{0}.{1} = {2}.{3}'.format(
+                    self.right_table.get_identifier(),
+                    right_metadata.pk_name,
+                    self.left_table.get_identifier(),
+                    table_join_field,
+                )
+                return condition
 
             # check if this join type is for a foreign key
-            for field in self.right_table.model._meta.fields:
-                if (
-                    field.get_internal_type() == 'OneToOneField' or field.get_internal_type() == 'ForeignKey'
-                ):
-                    if field.remote_field.model == self.left_table.model:
-                        table_join_field = field.column
-                        # self.table_join_name = field.name
-                        condition = '{0}.{1} = {2}.{3}'.format(
-                            self.right_table.get_identifier(),
-                            table_join_field,
-                            self.left_table.get_identifier(),
-                            self.left_table.model._meta.pk.name
-                        )
-                        return condition
+            field = right_metadata.foreign_keys.get(self.left_table.model)
+            if field is not None:
+                table_join_field = field.column
+                # self.table_join_name = field.name
+                condition = '{0}.{1} = {2}.{3}'.format(
+                    self.right_table.get_identifier(),
+                    table_join_field,
+                    self.left_table.get_identifier(),
+                    get_model_metadata(self.left_table.model).pk_name
+                )
+                return condition
         return None
 
 
@@ -233,6 +261,13 @@ class Expression(object):
         self.str = str
 
 
+class RowValues(tuple):
+    """
+    A row of values that a row of fields is compared to, ex: (a, b) > (1, 2). Each value is a
+    separate arg. Other tuple values are passed to the db as a single arg.
+    """
+
+
 class Where(object):
     """
     Represents the WHERE clause of a Query. The filter data is contained inside of django
@@ -278,6 +313,43 @@ class Where(object):
         self.args = {}
         self.wheres = Q()
 
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this where that copies its Q objects instead of deep copying
+        everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied where
+        :rtype: :class:`Where <querybuilder.query.Where>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        Replaces the args and the Q tree of this copied where with copies. The values of
+        the conditions are not copied.
+        """
+        self.args = self.args.copy()
+        self.wheres = self.clone_q(self.wheres)
+
+    def clone_q(self, q):
+        """
+        Copies a Q object and all of its nested Q objects
+
+        :rtype: :class:`Q <django:django.db.models.Q>`
+        """
+        copied_q = copy_instance(q)
+        copied_q.children = [
+            self.clone_q(child) if isinstance(child, Q) else child
+            for child in q.children
+        ]
+        return copied_q
+
+    def __copy__(self):
+        return self.clone()
+
     def get_sql(self):
         """
         Builds and returns the WHERE portion of the sql
@@ -400,10 +472,19 @@ class Where(object):
                         condition = condition.replace('?', '({0})'.format(','.join(named_args)), 1)
                 else:
                     # get the value based on the operator
-                    value = self.get_condition_value(operator_str, value)
-
-                    if type(value) is Expression:
+                    if value is not None:
+                        value = self.get_condition_value(operator_str, value)
+
+                    if value is None:
+                        # write NULL in the sql instead of an arg, because postgres can not prepare
+                        # a placeholder after IS
+                        condition = condition.replace('?', 'NULL', 1)
+                    elif type(value) is Expression:
                         condition = condition.replace('?', value.str)
+                    elif type(value) is RowValues:
+                        # compare to a row of values, ex: (a, b) > (1, 2)
+                        named_args = ['%({0})s'.format(self.set_arg(value_item)) for value_item in value]
+                        condition = condition.replace('?', '({0})'.format(', '.join(named_args)), 1)
                     else:
                         named_arg = self.set_arg(value)
                         # replace the ? in the query with the arg placeholder
@@ -436,6 +517,7 @@ class Group(object):
     """
     Represents a group by clause used in a Query
     """
+    __slots__ = ('field', 'table')
 
     def __init__(self, field=None, table=None):
         """
@@ -453,6 +535,30 @@ class Group(object):
         if self.table and self.field.table is None:
             self.field.set_table(self.table)
 
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this group that copies its field instead of deep copying
+        everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied group
+        :rtype: :class:`Group <querybuilder.query.Group>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        Replaces the field and table of this copied group with their clones
+        """
+        self.field = self.field.clone(memo)
+        if self.table is not None:
+            self.table = self.table.clone(memo)
+
+    def __copy__(self):
+        return self.clone()
+
     def get_name(self):
         """
         Gets the name to reference the grouped field
@@ -467,6 +573,7 @@ class Sorter(object):
     """
     Used internally by the Query class to set ORDER BY clauses on the query.
     """
+    __slots__ = ('desc', 'field', 'table')
 
     def __init__(self, field=None, table=None, desc=False):
         """
@@ -502,6 +609,30 @@ class Sorter(object):
             self.field.field = self.field.field[1:]
             self.field.name = self.field.name[1:]
 
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this sorter that copies its field instead of deep copying
+        everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied sorter
+        :rtype: :class:`Sorter <querybuilder.query.Sorter>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        Replaces the field and table of this copied sorter with their clones
+        """
+        self.field = self.field.clone(memo)
+        if self.table is not None:
+            self.table = self.table.clone(memo)
+
+    def __copy__(self):
+        return self.clone()
+
     def get_name(self, use_alias=True):
         """
         Gets the name to reference the sorted field
@@ -523,6 +654,7 @@ class Limit(object):
     """
     Used internally by the Query class to set a limit and/or offset on the query.
     """
+    __slots__ = ('limit', 'offset')
 
     def __init__(self, limit=None, offset=None):
         """
@@ -537,6 +669,28 @@ class Limit(object):
         self.limit = limit
         self.offset = offset
 
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this limit that copies nothing else instead of deep copying
+        everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied limit
+        :rtype: :class:`Limit <querybuilder.query.Limit>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        A limit does not reference any mutable objects
+        """
+        pass
+
+    def __copy__(self):
+        return self.clone()
+
     def get_sql(self):
         """
         Generates the sql used for the limit clause of a Query
@@ -565,6 +719,25 @@ class Query(object):
             The query generated by calling ``self.get_sql()`` This is used for
             caching purposes.
 
+        _sql_version: int
+            A counter that is incremented by ``self.mark_dirty()`` whenever the structure
+            of the query changes
+
+        _sql_cache: tuple
+            The cached (sql, args, cache key) generated by the last call to ``self.get_sql()``
+
+        _cache_results: bool
+            Whether ``self.select()`` reads and stores its rows in ``Query.result_cache``
+
+        _result_cache_timeout: int
+            The number of seconds the rows are cached. None uses the timeout of the result cache
+
+        _limited_sql_cache: tuple
+            The cached (cache key, (sql, args)) generated by the last call to ``self.get_limited_sql()``
+
+        safe_limit_truncated: bool
+            Whether the rows of the last call to ``self.select()`` were truncated by the safe limit
+
         tables: list of Table
             A list of ``Table`` instances this query is selecting from
 
@@ -589,6 +762,28 @@ class Query(object):
     """
     enable_safe_limit = False
     safe_limit = 1000
+    # A function that is called with the query when a select is truncated by the safe limit
+    safe_limit_callback = None
+    # The maximum number of parameters in a single insert, update, or upsert statement. Postgres
+    # does not allow more than 65535 bind parameters in one statement.
+    max_params = 65535
+    # Opt in to running repeated select shapes through server-side prepared statements. A shape is
+    # prepared after it has run ``prepared_statement_threshold`` times on a connection, and each
+    # connection keeps at most ``max_prepared_statements`` shapes.
+    enable_prepared_statements = False
+    prepared_statement_threshold = 2
+    max_prepared_statements = 100
+    # The ``ResultCache`` used by queries that call ``cache_results()``. Results are not cached
+    # unless this is set, ex: Query.result_cache = LocMemResultCache(timeout=30)
+    result_cache = None
+    # Set to True to have psycopg decode jsonb columns of selects with the decoder from
+    # ``querybuilder.utils.get_json_decoder`` instead of decoding the fetched rows afterwards
+    native_json_decoding = False
+    # A psycopg_pool ``AsyncConnectionPool`` that the async methods get their connections from, or a
+    # dict of connection alias to pool for more than one database. Without a pool for the query's
+    # connection, each async call opens and closes its own connection, which costs a connection
+    # handshake and authentication per call.
+    async_connection_pool = None
 
     def init_defaults(self):
         """
@@ -609,6 +804,12 @@ class Query(object):
         self.field_names = []
         self.field_names_pk = None
         self.values = []
+        self._sql_version = 0
+        self._sql_cache = None
+        self._cache_results = False
+        self._result_cache_timeout = None
+        self._limited_sql_cache = None
+        self.safe_limit_truncated = False
 
     def __init__(self, connection=None):
         """
@@ -646,6 +847,16 @@ class Query(object):
         # jsonify_cursor(cursor)
         return cursor
 
+    def get_chunked_cursor(self):
+        """
+        Get a cursor for the Query's connection that streams results from the db instead of
+        loading the whole result set into memory. On PostgreSQL this is a named server-side cursor.
+
+        :rtype: :class:`CursorWrapper <django:django.db.backends.util.CursorWrapper>`
+        :returns: A database cursor
+        """
+        return self.connection.chunked_cursor()
+
     def from_table(self, table=None, fields='*', schema=None, **kwargs):
         """
         Adds a ``Table`` and any optional fields to the list of tables
@@ -671,7 +882,7 @@ class Query(object):
         :return: self
         :rtype: :class:`Query <querybuilder.query.Query>`
         """
-        # self.mark_dirty()
+        self.mark_dirty()
 
         self.tables.append(TableFactory(
             table=table,
@@ -704,6 +915,7 @@ class Query(object):
         :return: self
         :rtype: :class:`Query <querybuilder.query.Query>`
         """
+        self.mark_dirty()
         table = TableFactory(
             table=table,
             **kwargs
@@ -739,6 +951,7 @@ class Query(object):
         :rtype: :class:`Query <querybuilder.query.Query>`
         :return: self
         """
+        self.mark_dirty()
         table = TableFactory(
             table=table,
             **kwargs
@@ -757,6 +970,7 @@ class Query(object):
         :return: self
         :rtype: :class:`Query <querybuilder.query.Query>`
         """
+        self.mark_dirty()
         self.with_tables.append(TableFactory(query, alias=alias))
         return self
 
@@ -810,7 +1024,7 @@ class Query(object):
         :rtype: :class:`Query <querybuilder.query.Query>`
         :return: self
         """
-        # self.mark_dirty()
+        self.mark_dirty()
         # TODO: fix bug when joining from simple table to model table with no condition
         # it assumes left_table.model
 
@@ -924,7 +1138,7 @@ class Query(object):
         :return: self
         :rtype: :class:`Query <querybuilder.query.Query>`
         """
-        # self.mark_dirty()
+        self.mark_dirty()
         if q is not None:
             self._where.wheres.add(q, where_type)
         if len(kwargs):
@@ -952,6 +1166,7 @@ class Query(object):
         :return: self
         :rtype: :class:`Query <querybuilder.query.Query>`
         """
+        self.mark_dirty()
         new_group_item = Group(
             field=field,
             table=table,
@@ -987,6 +1202,7 @@ class Query(object):
         :rtype: :class:`Query <querybuilder.query.Query>`
         :return: self
         """
+        self.mark_dirty()
         self.sorters.append(Sorter(
             field=field,
             table=table,
@@ -1007,12 +1223,159 @@ class Query(object):
         :rtype: :class:`Query <querybuilder.query.Query>`
         :return: self
         """
+        self.mark_dirty()
         self._limit = Limit(
             limit=limit,
             offset=offset
         )
         return self
 
+    def after(self, after):
+        """
+        Filters the query to the rows that come after a row in the order of the query's sorters.
+        This is keyset pagination, which can use an index on the sorted fields instead of scanning
+        and skipping every row before an OFFSET. The sorters should end with a unique field, like
+        the pk, so no two rows have the same sort values, and the sorted fields should not be null.
+
+        .. code-block:: python
+
+            Query().from_table(Order).order_by('-time').order_by('id').after(token)
+            # WHERE ((time < %(A0)s) OR (time = %(A1)s AND id > %(A2)s))
+
+        :type after: str or list
+        :param after: A token from ``self.get_after_token()`` or the list of sort values of the row
+
+        :rtype: :class:`Query <querybuilder.query.Query>`
+        :return: self
+        """
+        if isinstance(after, str):
+            after = decode_keyset_token(after)
+
+        if not self.sorters:
+            raise ValueError('Keyset pagination requires the query to be ordered')
+        if len(after) != len(self.sorters):
+            raise ValueError('Expected {0} values to paginate after but received {1}'.format(
+                len(self.sorters),
+                len(after)
+            ))
+
+        names = [sorter.field.get_select_sql() for sorter in self.sorters]
+        operators = ['lt' if sorter.desc else 'gt' for sorter in self.sorters]
+
+        if len(names) == 1:
+            q = Q(**{'{0}__{1}'.format(names[0], operators[0]): after[0]})
+        elif len(set(operators)) == 1:
+            # every field is sorted in the same direction, so a single row comparison can be used
+            q = Q(**{'({0})__{1}'.format(', '.join(names), operators[0]): RowValues(after)})
+        else:
+            # a row comes after if it is equal on the first fields and after on the next field
+            q = Q()
+            for index, operator in enumerate(operators):
+                part = Q()
+                for name, value in zip(names[:index], after[:index]):
+                    part &= Q(**{name: value})
+                part &= Q(**{'{0}__{1}'.format(names[index], operator): after[index]})
+                q |= part
+
+        return self.where(q)
+
+    def get_after_token(self, row):
+        """
+        Gets the keyset pagination token of a row to pass to ``self.after()`` to get the rows after it.
+        The sorted fields must be selected in the row.
+
+        :type row: dict or :class:`Model <django:django.db.models.Model>`
+        :param row: A row or model instance returned by the query
+
+        :rtype: str
+        :return: An opaque token of the sort values of the row
+        """
+        return encode_keyset_token([self.get_sort_value(row, sorter) for sorter in self.sorters])
+
+    def get_sort_value(self, row, sorter):
+        """
+        Gets the value of a sorted field from a row. The value of a json sorter like ``data->>'a'`` is
+        read from the selected json column when it is not selected by its own name.
+
+        :type row: dict or :class:`Model <django:django.db.models.Model>`
+        :param row: A row or model instance returned by the query
+
+        :type sorter: :class:`Sorter <querybuilder.query.Sorter>`
+        :param sorter: One of the query's sorters
+
+        :return: The value of the sorted field
+        :raises ValueError: if the sorted field or its json column is not selected, or the json sorter
+            does not select text with ``->>``
+        """
+        name = sorter.field.get_name()
+        if isinstance(row, dict) and name in row:
+            return row[name]
+
+        parts = JSON_PATH_PATTERN.split(name)
+        column_name = parts[0].split('.')[-1]
+        if isinstance(row, dict):
+            if column_name not in row:
+                raise ValueError('The sorted field {0} must be selected to paginate'.format(name))
+            value = row[column_name]
+        else:
+            if not hasattr(row, column_name):
+                raise ValueError('The sorted field {0} must be selected to paginate'.format(name))
+            value = getattr(row, column_name)
+
+        if len(parts) == 1:
+            return value
+        if parts[-2] != '->>':
+            raise ValueError('The json sorter {0} must select text with ->> to paginate'.format(name))
+
+        for key in parts[2::2]:
+            key = key.strip("'")
+            if isinstance(value, dict):
+                value = value.get(key)
+            elif isinstance(value, list) and key.lstrip('-').isdigit() and -len(value) <= int(key) < len(value):
+                value = value[int(key)]
+            else:
+                value = None
+        if value is None or isinstance(value, str):
+            return value
+        # ->> compares the json text of the value
+        return json.dumps(value)
+
+    def paginate(self, page_size, after=None, return_models=False):
+        """
+        Selects one page of rows with keyset pagination. See ``self.after()``. The query is not modified.
+
+        .. code-block:: python
+
+            query = Query().from_table(Order).order_by('id')
+            rows, token = query.paginate(100)
+            while token:
+                rows, token = query.paginate(100, after=token)
+
+        :type page_size: int
+        :param page_size: The number of rows in a page
+
+        :type after: str or list or None
+        :param after: The token of the previous page. If None, the first page is selected
+
+        :type return_models: bool
+        :param return_models: Set to True to return model instances instead of dictionaries
+
+        :rtype: tuple of (list, str or None)
+        :return: The rows of the page and the token of the next page, or None if this is the last page
+        """
+        query = self.copy()
+        if after is not None:
+            query.after(after)
+
+        # select one extra row to know if there is another page
+        rows = query.limit(page_size + 1).select(return_models=return_models, bypass_safe_limit=True)
+
+        next_token = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_token = self.get_after_token(rows[-1])
+        return rows, next_token
+
     def distinct(self, use_distinct=True):
         """
         Adds a distinct clause to the query
@@ -1023,10 +1386,31 @@ class Query(object):
         :rtype: :class:`Query <querybuilder.query.Query>`
         :return: self
         """
+        self.mark_dirty()
         self._distinct = use_distinct
         return self
 
+    def cache_results(self, use_cache=True, timeout=None):
+        """
+        Caches the rows returned by ``self.select()`` and the aggregate methods in ``Query.result_cache``.
+        The rows are keyed by a hash of the sql and args, and are invalidated when rows are inserted,
+        updated, or upserted into any of the tables the query selects from.
+
+        :type use_cache: bool
+        :param use_cache: Whether or not to cache the results
+
+        :type timeout: int or None
+        :param timeout: The number of seconds to cache the results. Defaults to the timeout of the result cache
+
+        :rtype: :class:`Query <querybuilder.query.Query>`
+        :return: self
+        """
+        self._cache_results = use_cache
+        self._result_cache_timeout = timeout
+        return self
+
     def distinct_on(self, *fields):
+        self.mark_dirty()
         for field in fields:
             self.distinct_ons.append(FieldFactory(field))
         return self
@@ -1051,7 +1435,9 @@ class Query(object):
             # prefix inner query args and update self args
             if type(table) is QueryTable:
                 table.query.prefix_args(auto_alias)
-                table.query.table_prefix = auto_alias
+                if table.query.table_prefix != auto_alias:
+                    table.query.table_prefix = auto_alias
+                    table.query.mark_dirty()
 
             table_index += 1
 
@@ -1060,7 +1446,81 @@ class Query(object):
         Adds an argument prefix to the query's ``Where`` object. This should only
         be called internally.
         """
-        self._where.arg_prefix = prefix
+        if self._where.arg_prefix != prefix:
+            self._where.arg_prefix = prefix
+            self.mark_dirty()
+
+    def mark_dirty(self):
+        """
+        Flags the query as changed so the next call to ``self.get_sql()`` regenerates the sql
+        and args instead of returning the cached values. This is called by every method that
+        changes the structure of the query. Adding, removing, or replacing the tables, joins, fields,
+        groups, and sorters of the query, and changing a table alias, sort direction, or the limit
+        are also seen by ``self.get_cache_key()``. Other direct changes to the query's objects, like
+        changing the conditions of ``self._where`` or the name of a field, should call this method.
+        """
+        self._sql_version += 1
+
+    def get_structure_key(self):
+        """
+        Builds a key from the parts of this query that are often changed directly instead of
+        through its methods. The objects are compared by identity, and the key keeps them
+        referenced so their ids can not be reused while the key is cached.
+
+        :rtype: tuple
+        :return: the tables, fields, joins, groups, sorters, and limit of this query
+        """
+        tables = self.tables + self.with_tables + [join_item.right_table for join_item in self.joins]
+        return (
+            tuple((table, table.alias, tuple(table.fields)) for table in tables),
+            tuple(self.joins),
+            tuple(self.groups),
+            tuple((sorter, sorter.desc) for sorter in self.sorters),
+            (self._limit.limit, self._limit.offset) if self._limit else None,
+        )
+
+    def get_dependent_queries(self):
+        """
+        Gets the queries that are used to build the sql of this query. These are the queries of the
+        from, with, and joined ``QueryTable`` objects and the windows of the fields of every table.
+
+        :rtype: list of :class:`Query <querybuilder.query.Query>`
+        :return: the inner queries and query windows of this query
+        """
+        tables = self.tables + self.with_tables + [join_item.right_table for join_item in self.joins]
+        inner_queries = []
+        for table in tables:
+            if type(table) is QueryTable:
+                inner_queries.append(table.query)
+            for field in table.fields:
+                over = getattr(field, 'over', None)
+                if over is not None:
+                    inner_queries.append(over)
+        return inner_queries
+
+    def get_cache_key(self):
+        """
+        Builds a key that identifies the current state of this query and all of its inner
+        queries and query windows. The cached sql is only used while this key is unchanged.
+
+        :rtype: tuple
+        :return: the version and structure of this query and the cache keys of its inner queries
+        """
+        return (
+            self._sql_version,
+            self.get_structure_key(),
+            tuple(query.get_cache_key() for query in self.get_dependent_queries()),
+        )
+
+    def is_dirty(self):
+        """
+        Checks if this query or any of its inner queries have changed since the sql was
+        last generated
+
+        :rtype: bool
+        :return: True if the sql needs to be generated again
+        """
+        return self._sql_cache is None or self._sql_cache[2] != self.get_cache_key()
 
     def get_sql(self, debug=False, use_cache=True):
         """
@@ -1077,9 +1537,8 @@ class Query(object):
         :rtype: str
         :return: The generated sql for this query
         """
-        # TODO: enable caching
-        # if self.sql and use_cache and not debug:
-        #     return self.sql
+        if use_cache and not debug and not self.is_dirty():
+            return self._sql_cache[0]
 
         # auto alias any naming collisions
         self.check_name_collisions()
@@ -1101,6 +1560,7 @@ class Query(object):
 
         # remove any whitespace from the beginning and end of the sql
         self.sql = sql.strip()
+        self._sql_cache = (self.sql, self.build_args(), self.get_cache_key())
 
         return self.sql
 
@@ -1124,12 +1584,32 @@ class Query(object):
 
         return self.sql, sql_args
 
+    def get_copy_sql(self):
+        """
+        Returns the postgres COPY FROM STDIN sql used to bulk insert rows with ``self.copy_insert``
+
+        .. code-block:: sql
+
+            COPY table_name (field1, field2) FROM STDIN
+
+        :rtype: str
+        :return: The COPY sql for this query's table and field names
+        """
+        self.sql = 'COPY {0} ({1}) FROM STDIN'.format(
+            self.tables[0].get_identifier(),
+            ', '.join(self.get_field_names())
+        )
+        return self.sql
+
     def should_not_cast_value(self, field_object):
         """
         In Django 4.1 on PostgreSQL, AutoField, BigAutoField, and SmallAutoField are now created as identity
         columns rather than serial columns with sequences.
         """
-        db_type = field_object.db_type(self.connection)
+        if getattr(field_object, 'concrete', False) and hasattr(field_object, 'model'):
+            db_type = get_model_metadata(field_object.model).get_db_type(field_object.name, self.connection)
+        else:
+            db_type = field_object.db_type(self.connection)
         if db_type in SERIAL_DTYPES:
             return True
         if (VERSION[0] == 4 and VERSION[1] >= 1) or VERSION[0] >= 5:
@@ -1137,7 +1617,47 @@ class Query(object):
                 return True
         return False
 
-    def get_update_sql(self, rows):
+    def get_array_db_type(self, field_object):
+        """
+        Gets the db type used to cast an array of values for a field. Serial and identity columns
+        are cast to the integer type they reference.
+
+        :rtype: str
+        :return: The array type of the field. Ex: 'varchar(64)[]'
+        """
+        if self.should_not_cast_value(field_object):
+            return '{0}[]'.format(field_object.rel_db_type(self.connection))
+        return '{0}[]'.format(field_object.db_type(self.connection))
+
+    def get_update_casts(self, field_names):
+        """
+        Gets the placeholders of the first row of an update, which cast each value to the db type
+        of its field so the db knows the types of the values. Serial fields are not cast. The
+        placeholders are cached per model, connection vendor, and field names so repeated updates
+        don't have to inspect the model's fields.
+
+        :param field_names: The names of the fields being updated, starting with the pk
+        :type field_names: list of str
+
+        :rtype: list of str
+        :return: The placeholder of each field. Ex: ['%s', '%s::varchar(64)']
+        """
+        metadata = get_model_metadata(self.tables[0].model)
+        key = (self.connection.vendor, tuple(field_names))
+        placeholders = metadata.update_casts.get(key)
+        if placeholders is None:
+            placeholders = []
+            for field_name in field_names:
+                field_object = metadata.get_field(field_name)
+                if self.should_not_cast_value(field_object):
+                    placeholders.append('%s')
+                else:
+                    # Cast the placeholder to the data type
+                    placeholders.append('%s::{0}'.format(metadata.get_db_type(field_name, self.connection)))
+            metadata.update_casts[key] = placeholders
+        return placeholders
+
+    def get_update_sql(self, rows, use_unnest=False):
         """
         Returns SQL UPDATE for rows ``rows``
 
@@ -1154,7 +1674,11 @@ class Query(object):
             ) AS new_values (id, field1, field2)
             WHERE table_name.id = new_values.id;
 
+        If ``use_unnest`` is True, see ``self.get_update_unnest_sql``
         """
+        if use_unnest:
+            return self.get_update_unnest_sql(rows)
+
         field_names = self.get_field_names()
         pk = field_names[0]
         update_field_names = field_names[1:]
@@ -1181,20 +1705,8 @@ class Query(object):
 
             # If this is the first row, add casting information so the db knows the field types
             if i == 0 and hasattr(self.tables[0], 'model'):
-                for field_index, value in enumerate(row):
-                    # Append the value
-                    sql_args.append(value)
-
-                    # Figure out how to cast it
-                    field_object = self.tables[0].model._meta.get_field(field_names[field_index])
-                    db_type = field_object.db_type(self.connection)
-
-                    # Don't cast serial types
-                    if self.should_not_cast_value(field_object):
-                        placeholders.append('%s')
-                    else:
-                        # Cast the placeholder to the data type
-                        placeholders.append('%s::{0}'.format(db_type))
+                sql_args.extend(row)
+                placeholders = self.get_update_casts(field_names[:len(row)])
             else:
                 for value in row:
                     sql_args.append(value)
@@ -1220,6 +1732,58 @@ class Query(object):
 
         return self.sql, sql_args
 
+    def get_update_unnest_sql(self, rows):
+        """
+        Returns SQL UPDATE for rows ``rows`` that binds one typed array of values per column
+        instead of one placeholder per value. The sql is the same for any number of rows, so it
+        can be reused by statement caches. The query's table must be a ``ModelTable`` so the
+        column types can be determined.
+
+        .. code-block:: sql
+
+            UPDATE table_name
+            SET
+                field1 = new_values.field1
+                field2 = new_values.field2
+            FROM unnest(%s::integer[], %s::varchar(64)[], %s::varchar(64)[]) AS new_values (id, field1, field2)
+            WHERE table_name.id = new_values.id;
+
+        """
+        field_names = self.get_field_names()
+        pk = field_names[0]
+        update_field_names = field_names[1:]
+
+        if len(field_names) < 2:
+            raise Exception('At least 2 fields must be passed to get_update_sql')
+
+        if not hasattr(self.tables[0], 'model'):
+            raise ValueError('A model table is required to determine the array types of an unnest update')
+
+        metadata = get_model_metadata(self.tables[0].model)
+        array_placeholders = [
+            '%s::{0}'.format(self.get_array_db_type(metadata.get_field(field_name)))
+            for field_name in field_names
+        ]
+        sql_args = [
+            [row[index] for row in rows]
+            for index in range(len(field_names))
+        ]
+
+        set_field_list_sql = ', '.join([
+            '{0} = new_values.{0}'.format(field_name)
+            for field_name in update_field_names
+        ])
+
+        self.sql = 'UPDATE {0} SET {1} FROM unnest({2}) AS new_values ({3}) WHERE {0}.{4} = new_values.{4}'.format(
+            self.tables[0].get_identifier(),
+            set_field_list_sql,
+            ', '.join(array_placeholders),
+            ', '.join(field_names),
+            pk
+        )
+
+        return self.sql, sql_args
+
     def get_upsert_sql(
         self,
         rows,
@@ -1227,7 +1791,8 @@ class Query(object):
         update_fields,
         auto_field_name=None,
         only_insert=False,
-        return_rows=True
+        return_rows=True,
+        use_unnest=False
     ):
         """
         Generates the postgres specific sql necessary to perform an upsert (ON CONFLICT)
@@ -1235,6 +1800,13 @@ class Query(object):
         INSERT INTO table_name (field1, field2)
         VALUES (1, 'two')
         ON CONFLICT (unique_field) DO UPDATE SET field2 = EXCLUDED.field2;
+
+        If ``use_unnest`` is True, one typed array of values is bound per column so the sql is
+        the same for any number of rows
+
+        INSERT INTO table_name (field1, field2)
+        SELECT * FROM unnest(%s::integer[], %s::varchar(64)[])
+        ON CONFLICT (unique_field) DO UPDATE SET field2 = EXCLUDED.field2;
         """
         ModelClass = self.tables[0].model
 
@@ -1265,21 +1837,33 @@ class Query(object):
             for field in update_fields
         ])
 
-        row_values = []
-        sql_args = []
+        if use_unnest:
+            # Convert field values to db values, one list per column
+            # Use attname here to support fields with custom db_column names
+            sql_args = [
+                [field.get_db_prep_save(getattr(row, field.attname), self.connection) for row in rows]
+                for field in all_fields
+            ]
+            row_values_sql = 'SELECT * FROM unnest({0})'.format(', '.join([
+                '%s::{0}'.format(self.get_array_db_type(field))
+                for field in all_fields
+            ]))
+        else:
+            row_values = []
+            sql_args = []
 
-        for row in rows:
-            placeholders = []
-            for field in all_fields:
-                # Convert field value to db value
-                # Use attname here to support fields with custom db_column names
-                sql_args.append(field.get_db_prep_save(getattr(row, field.attname), self.connection))
-                placeholders.append('%s')
-            row_values.append('({0})'.format(', '.join(placeholders)))
-        row_values_sql = ', '.join(row_values)
+            for row in rows:
+                placeholders = []
+                for field in all_fields:
+                    # Convert field value to db value
+                    # Use attname here to support fields with custom db_column names
+                    sql_args.append(field.get_db_prep_save(getattr(row, field.attname), self.connection))
+                    placeholders.append('%s')
+                row_values.append('({0})'.format(', '.join(placeholders)))
+            row_values_sql = 'VALUES {0}'.format(', '.join(row_values))
 
         if update_fields:
-            self.sql = 'INSERT INTO {0} ({1}) VALUES {2} ON CONFLICT ({3}) DO UPDATE SET {4} {5}'.format(
+            self.sql = 'INSERT INTO {0} ({1}) {2} ON CONFLICT ({3}) DO UPDATE SET {4} {5}'.format(
                 self.tables[0].get_identifier(),
                 all_field_names_sql,
                 row_values_sql,
@@ -1288,7 +1872,7 @@ class Query(object):
                 'RETURNING *' if return_rows else ''
             )
         else:
-            self.sql = 'INSERT INTO {0} ({1}) VALUES {2} ON CONFLICT ({3}) {4} {5}'.format(
+            self.sql = 'INSERT INTO {0} ({1}) {2} ON CONFLICT ({3}) {4} {5}'.format(
                 self.tables[0].get_identifier(),
                 all_field_names_sql,
                 row_values_sql,
@@ -1556,6 +2140,7 @@ class Query(object):
         field_names = self.get_field_names()
         query = Query(self.connection).from_table(copy_instance(self), alias=alias)
         self.__dict__.update(query.__dict__)
+        self.tables[0].owner = self
 
         # set explicit field names
         self.tables[0].set_fields(field_names)
@@ -1565,20 +2150,64 @@ class Query(object):
 
     def copy(self):
         """
-        Deeply copies everything in the query object except the connection object is shared
+        Copies everything in the query object that can be changed by building the query. The
+        connection, models, and the values of where conditions are shared with the copy.
+        See ``self.clone()``
+
+        :rtype: :class:`Query <querybuilder.query.Query>`
+        :return: The copied query
+        """
+        return self.clone()
+
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this query that copies its tables, joins, conditions, groups, and sorters
+        instead of deep copying everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied query
+        :rtype: :class:`Query <querybuilder.query.Query>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        Replaces the mutable objects of this copied query with their clones
         """
-        connection = self.connection
-        del self.connection
-        copied_query = deepcopy(self)
-        copied_query.connection = connection
-        self.connection = connection
-        return copied_query
+        self.tables = [table.clone(memo) for table in self.tables]
+        self.joins = [join_item.clone(memo) for join_item in self.joins]
+        self.with_tables = [table.clone(memo) for table in self.with_tables]
+        self._where = self._where.clone(memo)
+        self.groups = [group.clone(memo) for group in self.groups]
+        self.sorters = [sorter.clone(memo) for sorter in self.sorters]
+        if self._limit is not None:
+            self._limit = self._limit.clone(memo)
+        self.distinct_ons = [field.clone(memo) for field in self.distinct_ons]
+        self.field_names = list(self.field_names)
+        self.values = list(self.values)
+
+    def __copy__(self):
+        return self.clone()
 
     def get_args(self):
         """
         Gets the args for the query which will be escaped when being executed by the
         db. All inner queries are inspected and their args are combined with this
-        query's args.
+        query's args. The sql is generated first if the query has changed.
+
+        :return: all args for this query as a dict
+        :rtype: dict
+        """
+        if self.is_dirty():
+            self.get_sql()
+        return self._sql_cache[1]
+
+    def build_args(self):
+        """
+        Combines the args of this query's ``Where`` with the args of all inner queries.
+        This should only be called internally after the sql has been built.
 
         :return: all args for this query as a dict
         :rtype: dict
@@ -1589,7 +2218,8 @@ class Query(object):
 
         return self._where.args
 
-    def explain(self, sql=None, sql_args=None):
+    @instrumented
+    def explain(self, sql=None, sql_args=None, row_format='dict', options=None):
         """
         Runs EXPLAIN on this query
 
@@ -1601,37 +2231,81 @@ class Query(object):
         :param sql_args: A dictionary of the arguments to be escaped in the query. If None and
             sql is None, the query will use ``self.get_args()``
 
+        :type row_format: str
+        :param row_format: The format of the returned rows: 'dict', 'tuple', 'namedtuple', or 'columns'.
+            See :func:`json_fetch_all <querybuilder.utils.json_fetch_all>`. Defaults to 'dict'
+
+        :type options: str or None
+        :param options: Options for the EXPLAIN statement, ex: 'FORMAT JSON'. Defaults to None
+
         :rtype: list of str
         :return: list of each line of output from the EXPLAIN statement
         """
         cursor = self.get_cursor()
+        self._prepare_json_decoding(cursor)
         if sql is None:
             sql = self.get_sql()
             sql_args = self.get_args()
         elif sql_args is None:
             sql_args = {}
 
-        cursor.execute('EXPLAIN {0}'.format(sql), sql_args)
-        rows = self._fetch_all_as_dict(cursor)
+        if options:
+            sql = '({0}) {1}'.format(options, sql)
+
+        execution = get_execution()
+        sql = 'EXPLAIN {0}'.format(sql)
+        execution.built(sql)
+        cursor.execute(sql, sql_args)
+        execution.executed()
+        rows = self._fetch_all(cursor, row_format)
+        execution.fetched(rows)
         return rows
 
-    def select(self, return_models=False, nest=False, bypass_safe_limit=False, sql=None, sql_args=None):
+    def get_count_estimate(self):
         """
-        Executes the SELECT statement and returns the rows as a list of dictionaries or a list of
-        model instances
+        Gets the planner's estimate of the number of rows the query will return from
+        EXPLAIN (FORMAT JSON). This does not run the query, but the estimate is only as good
+        as the table statistics from the last ANALYZE.
 
-        :type return_models: bool
-        :param return_models: Set to True to return a list of models instead of a list of dictionaries.
-            Defaults to False
+        :return: The estimated number of rows
+        :rtype: int
+        """
+        rows = self.explain(row_format='tuple', options='FORMAT JSON')
+        return self._get_plan_rows(rows)
 
-        :type nest: bool
-        :param nest: Set to True to treat all double underscores in keynames as nested data. This will
+    def _get_plan_rows(self, rows):
+        """
+        Gets the estimated number of rows from the rows of EXPLAIN (FORMAT JSON)
+
+        :rtype: int
+        """
+        plan = rows[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @instrumented
+    def select(self, return_models=False, nest=False, bypass_safe_limit=False, sql=None, sql_args=None,
+               row_format='dict', prepare=None, lazy_json=False):
+        """
+        Executes the SELECT statement and returns the rows as a list of dictionaries or a list of
+        model instances
+
+        :type return_models: bool
+        :param return_models: Set to True to return a list of models instead of a list of dictionaries.
+            Defaults to False
+
+        :type nest: bool
+        :param nest: Set to True to treat all double underscores in keynames as nested data. This will
             convert all keys with double underscores to dictionaries keyed off of the left side of
             the underscores. Ex: {"id": 1", "account__id": 1, "account__name": "Name"} becomes
             {"id": 1, "account": {"id": 1, "name": "Name"}}
 
         :type bypass_safe_limit: bool
-        :param bypass_safe_limit: Ignores the safe_limit option even if the safe_limit is enabled
+        :param bypass_safe_limit: Ignores the safe_limit option even if the safe_limit is enabled. When the
+            safe limit is enabled, at most ``Query.safe_limit`` rows are returned, and
+            ``self.safe_limit_truncated`` is set if there were more rows. The safe limit is not applied
+            when the sql is passed in
 
         :type sql: str or None
         :param sql: The sql to execute in the SELECT statement. If one is not specified, then the
@@ -1641,14 +2315,83 @@ class Query(object):
         :param sql_args: The sql args to be used in the SELECT statement. If none are specified, then
             the query wil use ``self.get_args()``
 
+        :type row_format: str
+        :param row_format: The format of the returned rows: 'dict', 'tuple', 'namedtuple', or 'columns'.
+            See :func:`json_fetch_all <querybuilder.utils.json_fetch_all>`. Only 'dict' can be used
+            with ``return_models`` and ``nest``. Defaults to 'dict'
+
+        :type prepare: bool or None
+        :param prepare: Set to True to run the query through a prepared statement once its shape
+            has been seen ``self.prepared_statement_threshold`` times on the connection. Only used
+            on postgres. Defaults to ``Query.enable_prepared_statements``
+
+        :type lazy_json: bool
+        :param lazy_json: Set to True to return rows that decode their jsonb values the first time
+            each value is read. See :class:`LazyJsonRow <querybuilder.utils.LazyJsonRow>`. Rows that
+            are nested, turned into models, or stored in the result cache are fully decoded.
+            Only the 'dict' row_format can be used. Defaults to False
+
         :rtype: list of dict
         :return: list of dictionaries of the rows
         """
-        # Check if we need to set a safe limit
-        if bypass_safe_limit is False:
-            if Query.enable_safe_limit:
-                if self.count() > Query.safe_limit:
-                    self.limit(Query.safe_limit)
+        if row_format != 'dict' and (return_models or nest or lazy_json):
+            raise ValueError('return_models, nest, and lazy_json can only be used with the dict row_format')
+
+        execution = get_execution()
+        sql, sql_args, safe_limit = self._get_select_sql(bypass_safe_limit, sql, sql_args)
+        execution.built(sql)
+
+        # check for cached results
+        cache_key, rows = self._get_cached_rows(sql, sql_args, row_format)
+        if rows is not None:
+            execution.fetched(rows, cached=True)
+            return self._finish_select(rows, None, safe_limit, return_models, nest)
+
+        # get the cursor to execute the query
+        cursor = self.get_cursor()
+        if not lazy_json:
+            self._prepare_json_decoding(cursor)
+
+        # execute the query
+        if prepare is None:
+            prepare = Query.enable_prepared_statements
+        if prepare and self.connection.vendor == 'postgresql':
+            execute_prepared(
+                cursor,
+                self.connection,
+                sql,
+                sql_args,
+                max_size=self.max_prepared_statements,
+                threshold=self.prepared_statement_threshold,
+            )
+        else:
+            cursor.execute(sql, sql_args)
+        execution.executed()
+
+        # get the results in the requested format
+        if lazy_json:
+            rows = json_rows_as_lazy_dict(cursor, cursor.fetchall())
+        else:
+            rows = self._fetch_all(cursor, row_format)
+        execution.fetched(rows)
+
+        return self._finish_select(rows, cache_key, safe_limit, return_models, nest)
+
+    def _get_select_sql(self, bypass_safe_limit, sql, sql_args):
+        """
+        Gets the sql and args of a select and the safe limit to apply to its rows. See ``self.select()``
+
+        :rtype: tuple of (str, dict, int or None)
+        :return: The sql, the args, and the safe limit or None
+        """
+        # Check if we need to set a safe limit. One more row than the safe limit is selected
+        # to know if the rows were truncated without running a count first.
+        self.safe_limit_truncated = False
+        safe_limit = None
+        if bypass_safe_limit is False and Query.enable_safe_limit and sql is None:
+            if self._limit is None or not self._limit.limit or self._limit.limit > Query.safe_limit:
+                safe_limit = Query.safe_limit
+                sql, sql_args = self.get_limited_sql(safe_limit + 1)
 
         # determine which sql to use
         if sql is None:
@@ -1658,92 +2401,410 @@ class Query(object):
         if sql_args is None:
             sql_args = self.get_args()
 
-        # get the cursor to execute the query
-        cursor = self.get_cursor()
+        return sql, sql_args, safe_limit
 
-        # execute the query
-        cursor.execute(sql, sql_args)
+    def _get_cached_rows(self, sql, sql_args, row_format):
+        """
+        Gets the result cache key of a select and its cached rows. See ``self.cache_results()``
+
+        :rtype: tuple
+        :return: The cache key and versioned key or None if the results of this query are not cached,
+            and the cached rows or None if there are none. The versioned key is read before the select
+            executes so that rows fetched before a write are not stored as the results after the write.
+        """
+        if not self._cache_results or Query.result_cache is None:
+            return None, None
+        key = get_result_cache_key(sql, sql_args, self.connection.alias, row_format)
+        table_names = self.get_table_names()
+        versioned_key = Query.result_cache.get_versioned_key(key, table_names)
+        rows = Query.result_cache.get(key, table_names, versioned_key=versioned_key)
+        return (key, versioned_key), rows
+
+    def _finish_select(self, rows, cache_key, safe_limit, return_models, nest):
+        """
+        Caches the fetched rows of a select if there is a cache key, then applies the safe limit and
+        formats the rows. See ``self.select()``
+        """
+        if cache_key is not None:
+            key, versioned_key = cache_key
+            Query.result_cache.set(
+                key, rows, self.get_table_names(), self._result_cache_timeout, versioned_key=versioned_key
+            )
+
+        rows = self._apply_safe_limit(rows, safe_limit)
+        return self._format_rows(rows, return_models=return_models, nest=nest)
+
+    def get_limited_sql(self, limit):
+        """
+        Gets the sql and args of this query with a different LIMIT without changing the query.
+        The sql is cached until the query changes.
+
+        :type limit: int
+        :param limit: The number of rows to limit the query to
+
+        :rtype: tuple of (str, dict)
+        :return: The sql and args of the limited query
+        """
+        cache_key = (self.get_cache_key(), limit)
+        if self._limited_sql_cache is not None and self._limited_sql_cache[0] == cache_key:
+            return self._limited_sql_cache[1]
+
+        # build the sql with the limit swapped in, then restore the limit and the sql cache of the query
+        query_limit, query_sql, sql_cache = self._limit, self.sql, self._sql_cache
+        self._limit = Limit(limit, query_limit.offset if query_limit else None)
+        try:
+            limited_sql = (self.get_sql(use_cache=False), self._sql_cache[1])
+        finally:
+            self._limit, self.sql, self._sql_cache = query_limit, query_sql, sql_cache
+
+        self._limited_sql_cache = (cache_key, limited_sql)
+        return limited_sql
+
+    def _apply_safe_limit(self, rows, safe_limit):
+        """
+        Truncates rows selected with one more row than the safe limit to the safe limit and reports
+        the truncation with ``self.safe_limit_truncated`` and ``Query.safe_limit_callback``
+
+        :rtype: list or dict of list
+        :return: The rows truncated to the safe limit
+        """
+        if safe_limit is None:
+            return rows
+
+        # the columns row format is a dict of lists of column values
+        if isinstance(rows, dict):
+            num_rows = len(next(iter(rows.values()), []))
+        else:
+            num_rows = len(rows)
+
+        if num_rows <= safe_limit:
+            return rows
+
+        self.safe_limit_truncated = True
+        if Query.safe_limit_callback is not None:
+            Query.safe_limit_callback(self)
+
+        if isinstance(rows, dict):
+            return {name: values[:safe_limit] for name, values in rows.items()}
+        return rows[:safe_limit]
+
+    def iter_select(self, return_models=False, nest=False, chunk_size=2000, sql=None, sql_args=None):
+        """
+        Executes the SELECT statement with a server-side cursor and yields the rows one at a time
+        as dictionaries or model instances. Rows are fetched from the db ``chunk_size`` at a time,
+        so the memory used is bounded by the chunk size instead of the size of the result set.
+        The safe limit is not applied when streaming results.
+
+        :type return_models: bool
+        :param return_models: Set to True to return model instances instead of dictionaries.
+            Defaults to False
+
+        :type nest: bool
+        :param nest: Set to True to treat all double underscores in keynames as nested data. See
+            ``self.select()``
+
+        :type chunk_size: int
+        :param chunk_size: The number of rows to fetch from the db at a time. Defaults to 2000
+
+        :type sql: str or None
+        :param sql: The sql to execute in the SELECT statement. If one is not specified, then the
+            query will use ``self.get_sql()``
+
+        :type sql_args: str or None
+        :param sql_args: The sql args to be used in the SELECT statement. If none are specified, then
+            the query wil use ``self.get_args()``
+
+        :rtype: generator of dict
+        :return: generator of dictionaries of the rows
+        """
+        execution = start_execution('iter_select', self.connection.alias)
 
-        # get the results as a list of dictionaries
-        rows = self._fetch_all_as_dict(cursor)
+        # determine which sql to use
+        if sql is None:
+            sql = self.get_sql()
 
+        # determine which sql args to use
+        if sql_args is None:
+            sql_args = self.get_args()
+        execution.built(sql)
+
+        # get a server-side cursor to stream the results
+        cursor = self.get_chunked_cursor()
+        error = None
+        try:
+            self._prepare_json_decoding(cursor)
+            cursor.execute(sql, sql_args)
+            execution.executed()
+            for rows in self._fetch_many_as_dict(cursor, chunk_size):
+                execution.fetched(rows)
+                for row in self._format_rows(rows, return_models=return_models, nest=nest):
+                    yield row
+                # the time spent by the caller on the rows is not fetch time
+                execution.resume()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            cursor.close()
+            execution.finish(error)
+
+    def get_table_names(self):
+        """
+        Gets the names of all of the tables this query selects from, including joined tables
+        and the tables of inner queries
+
+        :rtype: list of str
+        :return: The table names
+        """
+        table_names = []
+        tables = self.tables + self.with_tables + [join_item.right_table for join_item in self.joins]
+        for table in tables:
+            if isinstance(table, QueryTable):
+                table_names.extend(table.query.get_table_names())
+            else:
+                table_names.append(table.name)
+        return table_names
+
+    def invalidate_result_cache(self):
+        """
+        Removes the cached results of all queries that select from the table this query writes to
+        """
+        if Query.result_cache is not None and self.tables:
+            Query.result_cache.invalidate_tables([self.tables[0].name])
+
+    def _format_rows(self, rows, return_models=False, nest=False):
+        """
+        Converts the row dictionaries returned from the db to nested dictionaries or model
+        instances. See ``self.select()``
+
+        :type rows: list of dict
+        :param rows: The rows returned from the db
+
+        :rtype: list of dict
+        :return: list of dictionaries or model instances of the rows
+        """
         # check if models should be returned instead of dictionaries
         if return_models:
 
             # set nesting to true, so the nested models can easily load the data
             nest = True
 
-            # build model map of map name to model
-            model_map = {}
-            for join_item in self.joins:
-                model_map[join_item.right_table.field_prefix] = join_item.right_table.model
-
         # check if results should be nested
         if nest:
 
-            # convert keys with double underscores to dictionaries
-            for row in rows:
-                _row = row.copy()
-                for key, value in _row.items():
-                    set_value_for_keypath(row, key, value, True, '__')
-                    if '__' in key:
-                        row.pop(key)
+            # convert keys with double underscores to dictionaries. All of the rows have the same keys,
+            # so the keys are only split once.
+            if rows:
+                plan = get_nesting_plan(tuple(rows[0]))
+                for row in rows:
+                    nest_row(row, plan)
 
             # create models if needed
             if return_models:
-                model_class = self.tables[0].model
-                new_rows = []
-                for row in rows:
-                    model = model_class()
-                    # assign all non-model keys first because django 1.5 requires
-                    # that the model has an id set before setting a property that is
-                    # a foreign key
-                    for key, value in row.items():
-                        if key not in model_map:
-                            setattr(model, key, value)
-                    # assign all model instances
-                    for key, value in row.items():
-                        if key in model_map:
-                            child_model = model_map[key]()
-                            for child_key, child_value in value.items():
-                                setattr(child_model, child_key, child_value)
-                            value = child_model
-                        setattr(model, key, value)
-                    new_rows.append(model)
-                rows = new_rows
+                rows = self._hydrate_models(rows)
 
         return rows
 
-    def insert(self, rows):
+    def _hydrate_models(self, rows):
         """
-        Inserts records into the db
-        # TODO: implement this
+        Builds model instances from nested rows like ``Model.from_db``. The keys of the rows are mapped
+        to the fields of the models once for all of the rows. The instances of joined models are set
+        on the instance with the prefix of the join, and are stored in the related object cache when
+        the prefix is the name of a foreign key or one to one relation.
+
+        :type rows: list of dict
+        :param rows: The nested rows returned from the db
+
+        :rtype: list of :class:`Model <django:django.db.models.Model>`
+        :return: The model instances
+        """
+        if not rows:
+            return []
+
+        # build model map of map name to model
+        model_map = {}
+        for join_item in self.joins:
+            model_map[join_item.right_table.field_prefix] = join_item.right_table.model
+
+        db = self.connection.alias
+        metadata = get_model_metadata(self.tables[0].model)
+        first_row = rows[0]
+        plan = metadata.get_hydration_plan(tuple(key for key in first_row if key not in model_map))
+
+        # (prefix, metadata, plan, relation field, reverse relation field) of each joined model
+        joined_models = []
+        for prefix, model in model_map.items():
+            if prefix in first_row:
+                joined_metadata = get_model_metadata(model)
+                field, remote_field = metadata.get_related_cache(prefix, model)
+                joined_models.append((
+                    prefix,
+                    joined_metadata,
+                    joined_metadata.get_hydration_plan(tuple(first_row[prefix])),
+                    field,
+                    remote_field,
+                ))
+
+        instances = []
+        for row in rows:
+            instance = metadata.hydrate(row, db, plan)
+            for prefix, joined_metadata, joined_plan, field, remote_field in joined_models:
+                joined_instance = joined_metadata.hydrate(row[prefix], db, joined_plan)
+                if field is None:
+                    setattr(instance, prefix, joined_instance)
+                else:
+                    set_related_instance(instance, joined_instance, field, remote_field)
+            instances.append(instance)
+        return instances
+
+    def get_batches(self, rows, num_params, batch_size=None):
+        """
+        Splits rows into batches so that a single statement never has more than ``batch_size`` rows
+        or more than ``self.max_params`` parameters
+
+        :type rows: list
+        :param rows: The rows to split into batches
+
+        :type num_params: int
+        :param num_params: The number of parameters each row uses in the statement. Use 0 if the number
+            of parameters does not depend on the number of rows.
+
+        :type batch_size: int or None
+        :param batch_size: The maximum number of rows in each batch. If None, the batches are
+            only limited by ``self.max_params``
+
+        :rtype: list of list
+        :return: The list of batches of rows
         """
+        rows_per_batch = max(len(rows), 1)
+        if num_params:
+            rows_per_batch = max(self.max_params // num_params, 1)
+        if batch_size:
+            rows_per_batch = min(rows_per_batch, batch_size)
+        return [rows[index:index + rows_per_batch] for index in range(0, len(rows), rows_per_batch)]
+
+    def get_batch_transaction(self, num_batches):
+        """
+        Gets the context manager to execute the batches of a statement in. More than one batch
+        is run in a single transaction so a failing batch rolls back the others.
+
+        :type num_batches: int
+        :param num_batches: The number of statements that will be executed
+
+        :return: A transaction context manager if there is more than one batch
+        """
+        if num_batches > 1:
+            return transaction.atomic(using=self.connection.alias)
+        return nullcontext()
+
+    @instrumented
+    def insert(self, rows, use_copy=False, batch_size=None):
+        """
+        Inserts records into the db. The rows are split into batches so that no statement uses
+        more than ``self.max_params`` parameters, and all batches are run in one transaction.
+
+        :type rows: list of list
+        :param rows: A list of each values list with the values in the same order as the field names.
+            If ``use_copy`` is True, this can be any iterable of rows.
+
+        :type use_copy: bool
+        :param use_copy: If True and the connection is PostgreSQL, the rows are streamed to the db with
+            COPY FROM STDIN instead of building an INSERT statement. Other databases fall back to the
+            INSERT statement. Defaults to False.
+
+        :type batch_size: int or None
+        :param batch_size: The maximum number of rows to insert in one statement. Defaults to None
+        """
+        if use_copy:
+            if self.connection.vendor == 'postgresql':
+                self.copy_insert(rows)
+                return
+            rows = list(rows)
+
         if len(rows) == 0:
             return
 
-        sql, sql_args = self.get_insert_sql(rows)
+        batches = self.get_batches(rows, len(rows[0]), batch_size)
 
         # get the cursor to execute the query
         cursor = self.get_cursor()
+        execution = get_execution()
 
-        # execute the query
-        cursor.execute(sql, sql_args)
+        with self.get_batch_transaction(len(batches)):
+            for batch in batches:
+                sql, sql_args = self.get_insert_sql(batch)
+                execution.built(sql)
+
+                # execute the query
+                cursor.execute(sql, sql_args)
+                execution.executed(cursor.rowcount)
+
+        self.invalidate_result_cache()
+
+    @instrumented
+    def copy_insert(self, rows):
+        """
+        Bulk inserts records into a postgres db with COPY FROM STDIN. The rows are formatted and
+        sent to the db as they are read from the iterable, so the rows never need to be in memory
+        all at once.
+
+        :type rows: iterable of list
+        :param rows: An iterable of each values list with the values in the same order as the field names
+
+        :rtype: int
+        :return: The number of rows inserted
+        """
+        execution = get_execution()
+        sql = self.get_copy_sql()
+        execution.built(sql)
+
+        # get the cursor to execute the query
+        cursor = self.get_cursor()
 
-    def update(self, rows):
+        # stream the rows to the db
+        with self.connection.wrap_database_errors:
+            num_rows = copy_rows(cursor, sql, rows)
+        execution.executed(num_rows)
+
+        self.invalidate_result_cache()
+        return num_rows
+
+    @instrumented
+    def update(self, rows, batch_size=None, use_unnest=False):
         """
-        Updates records in the db
+        Updates records in the db. The rows are split into batches so that no statement uses
+        more than ``self.max_params`` parameters, and all batches are run in one transaction.
+
+        :type rows: list of list
+        :param rows: A list of each values list with the values in the same order as the field names
+
+        :type batch_size: int or None
+        :param batch_size: The maximum number of rows to update in one statement. Defaults to None
+
+        :type use_unnest: bool
+        :param use_unnest: If True, one array of values is bound per column so the sql is the same
+            for any number of rows. See ``self.get_update_unnest_sql``. Defaults to False
         """
         if len(rows) == 0:
             return
 
-        sql, sql_args = self.get_update_sql(rows)
+        num_params = 0 if use_unnest else len(rows[0])
+        batches = self.get_batches(rows, num_params, batch_size)
 
         # get the cursor to execute the query
         cursor = self.get_cursor()
+        execution = get_execution()
 
-        # execute the query
-        cursor.execute(sql, sql_args)
+        with self.get_batch_transaction(len(batches)):
+            for batch in batches:
+                sql, sql_args = self.get_update_sql(batch, use_unnest=use_unnest)
+                execution.built(sql)
+
+                # execute the query
+                cursor.execute(sql, sql_args)
+                execution.executed(cursor.rowcount)
+
+        self.invalidate_result_cache()
 
     def get_auto_field_name(self, model_class):
         """
@@ -1756,81 +2817,151 @@ class Query(object):
 
         return None
 
-    def upsert(self, rows, unique_fields, update_fields, return_rows=False, return_models=False):
+    @instrumented
+    def upsert(self, rows, unique_fields, update_fields, return_rows=False, return_models=False, batch_size=None,
+               use_unnest=False):
         """
         Performs an upsert with the set of models defined in rows. If the unique field which is meant
         to cause a conflict is an auto increment field, then the field should be excluded when its value is null.
         In this case, an upsert will be performed followed by a bulk_create
+
+        The rows are split into batches so that no statement uses more than ``self.max_params``
+        parameters, and all batches are run in one transaction. Returned rows are in the same
+        order as the passed rows. A row that postgres does not return, like one skipped by a trigger,
+        is left out.
+
+        :type batch_size: int or None
+        :param batch_size: The maximum number of rows to upsert in one statement. Defaults to None
+
+        :type use_unnest: bool
+        :param use_unnest: If True, one array of values is bound per column so the sql is the same
+            for any number of rows. See ``self.get_upsert_sql``. Defaults to False
         """
         if len(rows) == 0:
             return
 
-        ModelClass = self.tables[0].model
+        fetch_rows = return_rows or return_models
+        auto_field_name, batches = self._get_upsert_batches(rows, unique_fields, batch_size, use_unnest)
 
-        rows_with_null_auto_field_value = []
+        return_indexes = []
+        return_value = []
+
+        # get the cursor to execute the query
+        cursor = self.get_cursor()
+        self._prepare_json_decoding(cursor)
+        execution = get_execution()
+
+        with self.get_batch_transaction(len(batches)):
+            for only_insert, batch in batches:
+                sql, sql_args = self.get_upsert_sql(
+                    [row for index, row in batch],
+                    unique_fields,
+                    update_fields,
+                    auto_field_name=auto_field_name,
+                    only_insert=only_insert,
+                    return_rows=fetch_rows,
+                    use_unnest=use_unnest
+                )
+                execution.built(sql)
+
+                # execute the upsert query
+                cursor.execute(sql, sql_args)
+
+                if fetch_rows:
+                    execution.executed()
+                    batch_rows = self._fetch_all_as_dict(cursor)
+                    execution.fetched(batch_rows)
+                    return_indexes.extend(self._get_upsert_batch_indexes(batch, batch_rows, unique_fields))
+                    return_value.extend(batch_rows)
+                else:
+                    execution.executed(cursor.rowcount)
+
+        self.invalidate_result_cache()
+
+        return self._get_upsert_return_value(return_indexes, return_value, return_models)
+
+    def _get_upsert_batches(self, rows, unique_fields, batch_size, use_unnest):
+        """
+        Splits the rows of an upsert into batches. See ``self.upsert()``
+
+        :rtype: tuple of (str or None, list of tuple)
+        :return: The name of the model's auto field and a list of (only insert, batch) for each
+            batch, where each batch is a list of (index, row)
+        """
+        ModelClass = self.tables[0].model
 
         # Get auto field name (a model can only have one AutoField)
         auto_field_name = self.get_auto_field_name(ModelClass)
 
+        # Keep the index of each row so the returned rows can be put back in the original order
+        indexed_rows = list(enumerate(rows))
+        indexed_rows_with_null_auto_field_value = []
+
         # Check if unique fields list contains an auto field
         if auto_field_name in unique_fields:
             # Separate the rows that need to be inserted vs the rows that need to be upserted
-            rows_with_null_auto_field_value = [row for row in rows if getattr(row, auto_field_name) is None]
-            rows = [row for row in rows if getattr(row, auto_field_name) is not None]
+            indexed_rows_with_null_auto_field_value = [
+                (index, row) for index, row in indexed_rows if getattr(row, auto_field_name) is None
+            ]
+            indexed_rows = [
+                (index, row) for index, row in indexed_rows if getattr(row, auto_field_name) is not None
+            ]
 
-        return_value = []
+        num_params = 0 if use_unnest else len(ModelClass._meta.fields)
+        batches = [
+            (False, batch) for batch in self.get_batches(indexed_rows, num_params, batch_size)
+        ] + [
+            (True, batch) for batch in self.get_batches(indexed_rows_with_null_auto_field_value, num_params, batch_size)
+        ]
+        return auto_field_name, batches
 
-        if rows:
-            sql, sql_args = self.get_upsert_sql(
-                rows,
-                unique_fields,
-                update_fields,
-                auto_field_name=auto_field_name,
-                return_rows=return_rows or return_models
-            )
+    def _get_upsert_batch_indexes(self, batch, batch_rows, unique_fields):
+        """
+        Gets the index in the passed rows of each row returned by one upsert statement. Conflicting rows
+        are updated, even without update fields, so RETURNING gives one row for each row of values unless
+        postgres skips a row, like when a trigger returns null. Then the returned rows are matched to the
+        passed rows by the values of their unique fields. See ``self.upsert()``
 
-            # get the cursor to execute the query
-            cursor = self.get_cursor()
+        :param batch: The list of (index, row) of the statement
+        :type batch: list of tuple
 
-            # execute the upsert query
-            cursor.execute(sql, sql_args)
+        :param batch_rows: The rows returned by the statement
+        :type batch_rows: list of dict
 
-            if return_rows or return_models:
-                return_value.extend(self._fetch_all_as_dict(cursor))
+        :rtype: list of int or None
+        :return: The index of each returned row, or None if it does not match a passed row
+        """
+        if len(batch_rows) == len(batch):
+            return [index for index, row in batch]
 
-        if rows_with_null_auto_field_value:
-            sql, sql_args = self.get_upsert_sql(
-                rows_with_null_auto_field_value,
-                unique_fields,
-                update_fields,
-                auto_field_name=auto_field_name,
-                only_insert=True,
-                return_rows=return_rows or return_models
+        ModelClass = self.tables[0].model
+        fields = [ModelClass._meta.get_field(field_name) for field_name in unique_fields]
+        indexes = {
+            tuple(getattr(row, field.attname) for field in fields): index
+            for index, row in batch
+        }
+        return [indexes.get(tuple(row_dict[field.column] for field in fields)) for row_dict in batch_rows]
+
+    def _get_upsert_return_value(self, return_indexes, return_value, return_models):
+        """
+        Puts the rows returned by the batches of an upsert back in the order of the passed rows and
+        builds the models if needed. Returned rows that do not match a passed row are put last in the
+        order they were returned. See ``self.upsert()``
+        """
+        return_value = [
+            row for index, row in sorted(
+                zip(return_indexes, return_value), key=lambda item: (item[0] is None, item[0] or 0)
             )
-
-            # get the cursor to execute the query
-            cursor = self.get_cursor()
-
-            # execute the upsert query
-            cursor.execute(sql, sql_args)
-
-            if return_rows or return_models:
-                return_value.extend(self._fetch_all_as_dict(cursor))
+        ]
 
         if return_models:
-            ModelClass = self.tables[0].model
-            model_objects = [
-                ModelClass(**row_dict)
+            metadata = get_model_metadata(self.tables[0].model)
+            plan = metadata.get_hydration_plan(tuple(return_value[0])) if return_value else None
+            return_value = [
+                metadata.hydrate(row_dict, self.connection.alias, plan)
                 for row_dict in return_value
             ]
 
-            # Set the state to indicate the object has been loaded from db
-            for model_object in model_objects:
-                model_object._state.adding = False
-                model_object._state.db = 'default'
-
-            return_value = model_objects
-
         return return_value
 
     def sql_delete(self):
@@ -1853,9 +2984,11 @@ class Query(object):
 
         query_copy.tables[0].add_field(CountField('*'))
         del query_copy.sorters[:]
+        query_copy.mark_dirty()
         return query_copy
 
-    def count(self, field='*'):
+    @instrumented
+    def count(self, field='*', estimate=False, exact_threshold=None):
         """
         Returns a COUNT of the query by wrapping the query and performing a COUNT
         aggregate of the specified field
@@ -1863,12 +2996,27 @@ class Query(object):
         :param field: the field to pass to the COUNT aggregate. Defaults to '*'
         :type field: str
 
+        :param estimate: Set to True to return the planner's estimate of the number of rows
+            instead of running a COUNT. The field is ignored by the estimate. See ``self.get_count_estimate()``.
+            Defaults to False
+        :type estimate: bool
+
+        :param exact_threshold: When estimating, a COUNT is still run if the estimate is less than
+            this number, so small counts are exact and large counts are cheap. Defaults to None
+        :type exact_threshold: int or None
+
         :return: The number of rows that the query will return
         :rtype: int
         """
+        if estimate:
+            num_rows = self.get_count_estimate()
+            if exact_threshold is None or num_rows >= exact_threshold:
+                return num_rows
+
         rows = self.get_count_query().select(bypass_safe_limit=True)
         return list(rows[0].values())[0]
 
+    @instrumented
     def max(self, field):
         """
         Returns the maximum value of a field in the result set of the query
@@ -1881,10 +3029,11 @@ class Query(object):
         """
         q = Query(self.connection).from_table(self, fields=[
             MaxField(field)
-        ])
+        ]).cache_results(self._cache_results, self._result_cache_timeout)
         rows = q.select(bypass_safe_limit=True)
         return list(rows[0].values())[0]
 
+    @instrumented
     def min(self, field):
         """
         Returns the minimum value of a field in the result set of the query
@@ -1897,10 +3046,11 @@ class Query(object):
         """
         q = Query(self.connection).from_table(self, fields=[
             MinField(field)
-        ])
+        ]).cache_results(self._cache_results, self._result_cache_timeout)
         rows = q.select(bypass_safe_limit=True)
         return list(rows[0].values())[0]
 
+    @instrumented
     def sum(self, field):
         """
         Returns the sum of the field in the result set of the query
@@ -1913,10 +3063,11 @@ class Query(object):
         """
         q = Query(self.connection).from_table(self, fields=[
             SumField(field)
-        ])
+        ]).cache_results(self._cache_results, self._result_cache_timeout)
         rows = q.select(bypass_safe_limit=True)
         return list(rows[0].values())[0]
 
+    @instrumented
     def avg(self, field):
         """
         Returns the average of the field in the result set of the query
@@ -1929,10 +3080,356 @@ class Query(object):
         """
         q = Query(self.connection).from_table(self, fields=[
             AvgField(field)
-        ])
+        ]).cache_results(self._cache_results, self._result_cache_timeout)
         rows = q.select(bypass_safe_limit=True)
         return list(rows[0].values())[0]
 
+    @instrumented
+    def aggregate(self, **aggregates):
+        """
+        Performs several aggregates over the result set of the query in one statement by wrapping
+        the query and selecting every aggregate field
+
+        .. code-block:: python
+
+            Query().from_table(Order).where(margin__gt=0).aggregate(
+                count='*',
+                total=SumField('revenue'),
+                mean=AvgField('margin'),
+            )
+            # {'count': 5, 'total': 1000.0, 'mean': 23.5}
+
+        :param aggregates: The aggregates keyed by the name to return them as. Each value is an
+            ``AggregateField`` or the name of a field to COUNT
+        :type aggregates: dict of str to :class:`AggregateField <querybuilder.fields.AggregateField>` or str
+
+        :return: The value of each aggregate keyed by its name
+        :rtype: dict
+        """
+        if not aggregates:
+            raise ValueError('At least one aggregate is required')
+
+        fields = []
+        for alias, field in aggregates.items():
+            if isinstance(field, str):
+                field = CountField(field)
+            fields.append({alias: field})
+
+        q = Query(self.connection).from_table(
+            self, fields=fields
+        ).cache_results(self._cache_results, self._result_cache_timeout)
+        rows = q.select(bypass_safe_limit=True)
+        return rows[0]
+
+    def get_async_connection(self):
+        """
+        Gets an async context manager of a psycopg async connection to the database of the query's
+        connection. The connection comes from the pool of ``Query.async_connection_pool`` for the
+        connection's alias if there is one. See :func:`async_connection <querybuilder.aio.async_connection>`
+        """
+        pool = Query.async_connection_pool
+        if isinstance(pool, dict):
+            pool = pool.get(self.connection.alias)
+        return aio.async_connection(self.connection, pool)
+
+    @instrumented
+    async def aselect(self, return_models=False, nest=False, bypass_safe_limit=False, sql=None, sql_args=None,
+                      row_format='dict', lazy_json=False):
+        """
+        Async version of ``self.select()``. On postgres with psycopg 3 the query runs on a psycopg async
+        connection, which is separate from the django connection, so it does not see uncommitted
+        changes of the django connection's transaction. The connection comes from
+        ``Query.async_connection_pool``. Without a pool, each call opens and closes its own connection,
+        which can cost more than a short query. Other connections run ``self.select()`` in a thread.
+        Prepared statements are not used.
+
+        :rtype: list of dict
+        :return: list of dictionaries of the rows
+        """
+        if not aio.supports_async(self.connection):
+            return await sync_to_async(self.select)(
+                return_models=return_models,
+                nest=nest,
+                bypass_safe_limit=bypass_safe_limit,
+                sql=sql,
+                sql_args=sql_args,
+                row_format=row_format,
+                lazy_json=lazy_json,
+            )
+
+        if row_format != 'dict' and (return_models or nest or lazy_json):
+            raise ValueError('return_models, nest, and lazy_json can only be used with the dict row_format')
+
+        execution = get_execution()
+        sql, sql_args, safe_limit = self._get_select_sql(bypass_safe_limit, sql, sql_args)
+        execution.built(sql)
+
+        # check for cached results
+        cache_key, rows = self._get_cached_rows(sql, sql_args, row_format)
+        if rows is not None:
+            execution.fetched(rows, cached=True)
+            return self._finish_select(rows, None, safe_limit, return_models, nest)
+
+        async with self.get_async_connection() as conn:
+            async with conn.cursor() as cursor:
+                if not lazy_json:
+                    self._prepare_json_decoding(cursor)
+                await cursor.execute(sql, sql_args)
+                execution.executed()
+                rows = await cursor.fetchall()
+                if lazy_json:
+                    rows = json_rows_as_lazy_dict(cursor, rows)
+                else:
+                    rows = json_format_rows(cursor, rows, row_format, not self._uses_native_json_decoding())
+                execution.fetched(rows)
+
+        return self._finish_select(rows, cache_key, safe_limit, return_models, nest)
+
+    async def aiter_select(self, return_models=False, nest=False, chunk_size=2000, sql=None, sql_args=None):
+        """
+        Async version of ``self.iter_select()``. On postgres with psycopg 3 the rows are streamed from a
+        server-side cursor of a psycopg async connection, see ``self.aselect()``. Other connections run
+        ``self.iter_select()`` in a thread one chunk at a time.
+
+        .. code-block:: python
+
+            async for row in Query().from_table(Account).aiter_select():
+                print(row)
+
+        :rtype: async generator of dict
+        :return: async generator of dictionaries of the rows
+        """
+        if not aio.supports_async(self.connection):
+            rows_iter = self.iter_select(
+                return_models=return_models, nest=nest, chunk_size=chunk_size, sql=sql, sql_args=sql_args
+            )
+            try:
+                while True:
+                    rows = await sync_to_async(list)(islice(rows_iter, chunk_size))
+                    if not rows:
+                        return
+                    for row in rows:
+                        yield row
+            finally:
+                await sync_to_async(rows_iter.close)()
+
+        execution = start_execution('aiter_select', self.connection.alias)
+        if sql is None:
+            sql = self.get_sql()
+        if sql_args is None:
+            sql_args = self.get_args()
+        execution.built(sql)
+
+        error = None
+        try:
+            async with self.get_async_connection() as conn:
+                # server-side cursors only exist inside a transaction
+                async with conn.transaction():
+                    async with conn.cursor(name='querybuilder_aiter_select') as cursor:
+                        self._prepare_json_decoding(cursor)
+                        await cursor.execute(sql, sql_args)
+                        execution.executed()
+                        while True:
+                            rows = await cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+                            rows = json_rows_as_dict(cursor, rows, not self._uses_native_json_decoding())
+                            execution.fetched(rows)
+                            for row in self._format_rows(rows, return_models=return_models, nest=nest):
+                                yield row
+                            # the time spent by the caller on the rows is not fetch time
+                            execution.resume()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            execution.finish(error)
+
+    @instrumented
+    async def ainsert(self, rows, use_copy=False, batch_size=None):
+        """
+        Async version of ``self.insert()``. See ``self.aselect()`` for how the query is run.
+        """
+        if not aio.supports_async(self.connection):
+            return await sync_to_async(self.insert)(rows, use_copy=use_copy, batch_size=batch_size)
+
+        execution = get_execution()
+        if use_copy:
+            sql = self.get_copy_sql()
+            execution.built(sql)
+            async with self.get_async_connection() as conn:
+                async with conn.cursor() as cursor:
+                    num_rows = await aio.copy_rows(cursor, sql, rows)
+                    execution.executed(num_rows)
+            self.invalidate_result_cache()
+            return
+
+        if len(rows) == 0:
+            return
+
+        batches = self.get_batches(rows, len(rows[0]), batch_size)
+
+        async with self.get_async_connection() as conn:
+            async with aio.get_batch_transaction(conn, len(batches)):
+                async with conn.cursor() as cursor:
+                    for batch in batches:
+                        sql, sql_args = self.get_insert_sql(batch)
+                        execution.built(sql)
+                        await cursor.execute(sql, sql_args)
+                        execution.executed(cursor.rowcount)
+
+        self.invalidate_result_cache()
+
+    @instrumented
+    async def aupdate(self, rows, batch_size=None, use_unnest=False):
+        """
+        Async version of ``self.update()``. See ``self.aselect()`` for how the query is run.
+        """
+        if not aio.supports_async(self.connection):
+            return await sync_to_async(self.update)(rows, batch_size=batch_size, use_unnest=use_unnest)
+
+        if len(rows) == 0:
+            return
+
+        num_params = 0 if use_unnest else len(rows[0])
+        batches = self.get_batches(rows, num_params, batch_size)
+        execution = get_execution()
+
+        async with self.get_async_connection() as conn:
+            async with aio.get_batch_transaction(conn, len(batches)):
+                async with conn.cursor() as cursor:
+                    for batch in batches:
+                        sql, sql_args = self.get_update_sql(batch, use_unnest=use_unnest)
+                        execution.built(sql)
+                        await cursor.execute(sql, sql_args)
+                        execution.executed(cursor.rowcount)
+
+        self.invalidate_result_cache()
+
+    @instrumented
+    async def aupsert(self, rows, unique_fields, update_fields, return_rows=False, return_models=False,
+                      batch_size=None, use_unnest=False):
+        """
+        Async version of ``self.upsert()``. See ``self.aselect()`` for how the query is run.
+        """
+        if not aio.supports_async(self.connection):
+            return await sync_to_async(self.upsert)(
+                rows,
+                unique_fields,
+                update_fields,
+                return_rows=return_rows,
+                return_models=return_models,
+                batch_size=batch_size,
+                use_unnest=use_unnest,
+            )
+
+        if len(rows) == 0:
+            return
+
+        fetch_rows = return_rows or return_models
+        auto_field_name, batches = self._get_upsert_batches(rows, unique_fields, batch_size, use_unnest)
+
+        return_indexes = []
+        return_value = []
+        execution = get_execution()
+
+        async with self.get_async_connection() as conn:
+            async with aio.get_batch_transaction(conn, len(batches)):
+                async with conn.cursor() as cursor:
+                    self._prepare_json_decoding(cursor)
+                    for only_insert, batch in batches:
+                        sql, sql_args = self.get_upsert_sql(
+                            [row for index, row in batch],
+                            unique_fields,
+                            update_fields,
+                            auto_field_name=auto_field_name,
+                            only_insert=only_insert,
+                            return_rows=fetch_rows,
+                            use_unnest=use_unnest
+                        )
+                        execution.built(sql)
+                        await cursor.execute(sql, sql_args)
+
+                        if fetch_rows:
+                            execution.executed()
+                            batch_rows = json_rows_as_dict(
+                                cursor, await cursor.fetchall(), not self._uses_native_json_decoding()
+                            )
+                            execution.fetched(batch_rows)
+                            return_indexes.extend(self._get_upsert_batch_indexes(batch, batch_rows, unique_fields))
+                            return_value.extend(batch_rows)
+                        else:
+                            execution.executed(cursor.rowcount)
+
+        self.invalidate_result_cache()
+
+        return self._get_upsert_return_value(return_indexes, return_value, return_models)
+
+    @instrumented
+    async def acount(self, field='*', estimate=False, exact_threshold=None):
+        """
+        Async version of ``self.count()``. See ``self.aselect()`` for how the query is run.
+
+        :return: The number of rows that the query will return
+        :rtype: int
+        """
+        if estimate:
+            rows = await self.aexplain(row_format='tuple', options='FORMAT JSON')
+            num_rows = self._get_plan_rows(rows)
+            if exact_threshold is None or num_rows >= exact_threshold:
+                return num_rows
+
+        rows = await self.get_count_query().aselect(bypass_safe_limit=True)
+        return list(rows[0].values())[0]
+
+    @instrumented
+    async def aexplain(self, sql=None, sql_args=None, row_format='dict', options=None):
+        """
+        Async version of ``self.explain()``. See ``self.aselect()`` for how the query is run.
+
+        :rtype: list of str
+        :return: list of each line of output from the EXPLAIN statement
+        """
+        if not aio.supports_async(self.connection):
+            return await sync_to_async(self.explain)(
+                sql=sql, sql_args=sql_args, row_format=row_format, options=options
+            )
+
+        if sql is None:
+            sql = self.get_sql()
+            sql_args = self.get_args()
+        elif sql_args is None:
+            sql_args = {}
+
+        if options:
+            sql = '({0}) {1}'.format(options, sql)
+
+        execution = get_execution()
+        sql = 'EXPLAIN {0}'.format(sql)
+        execution.built(sql)
+        async with self.get_async_connection() as conn:
+            async with conn.cursor() as cursor:
+                self._prepare_json_decoding(cursor)
+                await cursor.execute(sql, sql_args)
+                execution.executed()
+                rows = await cursor.fetchall()
+                rows = json_format_rows(cursor, rows, row_format, not self._uses_native_json_decoding())
+                execution.fetched(rows)
+                return rows
+
+    def _prepare_json_decoding(self, cursor):
+        """
+        Registers the json decoder on the cursor if ``Query.native_json_decoding`` is enabled
+        """
+        if self._uses_native_json_decoding():
+            jsonify_cursor(cursor, loads=get_json_decoder())
+
+    def _uses_native_json_decoding(self):
+        """
+        Checks if the cursors of this query decode jsonb values, so the fetched rows are not decoded again
+        """
+        return self.native_json_decoding and self.connection.vendor == 'postgresql'
+
     def _fetch_all_as_dict(self, cursor):
         """
         Iterates over the result set and converts each row to a dictionary
@@ -1940,7 +3437,27 @@ class Query(object):
         :return: A list of dictionaries where each row is a dictionary
         :rtype: list of dict
         """
-        return json_fetch_all_as_dict(cursor)
+        return json_fetch_all_as_dict(cursor, decode_json=not self._uses_native_json_decoding())
+
+    def _fetch_all(self, cursor, row_format='dict'):
+        """
+        Iterates over the result set and converts each row to the requested format
+
+        :return: The rows in the requested format
+        :rtype: list of dict or list of tuple or dict of list
+        """
+        if row_format == 'dict':
+            return self._fetch_all_as_dict(cursor)
+        return json_fetch_all(cursor, row_format, decode_json=not self._uses_native_json_decoding())
+
+    def _fetch_many_as_dict(self, cursor, chunk_size):
+        """
+        Iterates over the result set ``chunk_size`` rows at a time and converts each row to a dictionary
+
+        :return: A generator of lists of dictionaries where each row is a dictionary
+        :rtype: generator of list of dict
+        """
+        return json_fetch_many_as_dict(cursor, chunk_size, decode_json=not self._uses_native_json_decoding())
 
 
 class QueryWindow(Query):
@@ -1984,7 +3501,10 @@ class QueryWindow(Query):
         :rtype: str
         :return: The generated sql for this query window
         """
-        # TODO: implement caching and debug
+        # TODO: implement debug
+        if use_cache and not self.is_dirty():
+            return self._sql_cache[0]
+
         sql = ''
         sql += self.build_partition_by_fields()
         sql += self.build_order_by(use_alias=False)
@@ -1992,6 +3512,7 @@ class QueryWindow(Query):
         sql = sql.strip()
         sql = 'OVER ({0})'.format(sql)
         self.sql = sql
+        self._sql_cache = (self.sql, self.build_args(), self.get_cache_key())
 
         return self.sql
 
@@ -2023,6 +3544,13 @@ class QueryBuilderQuerySet(QuerySet):
     def __getitem__(self, k):
         if isinstance(k, int):
             return self.get_model_queryset(self._queryset, k, 1)[0]
+        elif hasattr(k, 'start') and isinstance(k.start, str):
+            # a slice starting with a keyset pagination token, ex: queryset[token:100]
+            return self.get_model_queryset_after(
+                self._queryset,
+                k.start,
+                k.stop
+            )
         elif hasattr(k, 'start'):
             return self.get_model_queryset(
                 self._queryset,
@@ -2034,6 +3562,12 @@ class QueryBuilderQuerySet(QuerySet):
     def get_model_queryset(self, queryset, offset, limit):
         raise NotImplementedError
 
+    def get_model_queryset_after(self, queryset, after, limit):
+        raise NotImplementedError
+
+    def get_after_token(self, model):
+        raise NotImplementedError
+
     def get_field_name_from_filter(self, filter):
         filter_bits = filter.split(LOOKUP_SEP)
         field_name = filter_bits.pop(0)
@@ -2109,6 +3643,13 @@ class JsonQueryset(QueryBuilderQuerySet):
     def get_model_queryset(self, queryset, offset, limit):
         return [self.model(**fields) for fields in self.json_query.limit(limit, offset).select()]
 
+    def get_model_queryset_after(self, queryset, after, limit):
+        query = self.json_query.copy().after(after).limit(limit)
+        return [self.model(**fields) for fields in query.select()]
+
+    def get_after_token(self, model):
+        return self.json_query.get_after_token(model)
+
     def count(self):
         return self.json_query.count()
 
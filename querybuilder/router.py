@@ -0,0 +1,466 @@
+import heapq
+import json
+import zlib
+from functools import cmp_to_key
+
+from django.db import connections
+from django.db.models import Q
+
+from querybuilder.executor import run_many
+from querybuilder.fields import AggregateField, CountField, MaxField, MinField, SumField
+from querybuilder.query import Where
+
+
+def sum_values(values):
+    """
+    Adds the values that are not null like SUM. Returns None if all of the values are null
+    """
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return sum(values)
+
+
+def min_value(values):
+    """
+    Gets the smallest value that is not null like MIN. Returns None if all of the values are null
+    """
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+def max_value(values):
+    """
+    Gets the largest value that is not null like MAX. Returns None if all of the values are null
+    """
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def freeze_value(value):
+    """
+    Gets a hashable value that is equal for equal values, so grouped jsonb dicts and lists can be
+    used in a group key
+    """
+    if isinstance(value, (dict, list)):
+        return ('json', json.dumps(value, sort_keys=True, default=str))
+    return value
+
+
+def compare_values(a, b):
+    """
+    Compares two sort values the way postgres does in ascending order, where nulls come last
+
+    :rtype: int
+    """
+    if a == b:
+        return 0
+    if a is None:
+        return 1
+    if b is None:
+        return -1
+    return -1 if a < b else 1
+
+
+class ShardRouter(object):
+    """
+    Routes the queries of tables that are sharded across several databases by a shard key, ex: a
+    tenant id. A query that filters the shard key to the values of one shard is routed to that
+    shard's database. Other queries are scattered to every shard that can have matching rows, and
+    the rows of the shards are gathered into one result.
+
+    .. code-block:: python
+
+        from querybuilder.router import ShardRouter
+
+        router = ShardRouter('tenant_id', ['shard0', 'shard1', 'shard2'])
+
+        router.route(Query().from_table(Order).where(tenant_id=5)).select()
+        router.select(Query().from_table(Order).order_by('-time').limit(10))
+        router.count(Query().from_table(Order))
+    """
+
+    # The aggregate fields that can be computed from the aggregates of each shard and the
+    # function that combines the values of the shards
+    reaggregate_functions = {
+        CountField: sum_values,
+        SumField: sum_values,
+        MinField: min_value,
+        MaxField: max_value,
+    }
+
+    def __init__(self, shard_key, shards, shard_function=None, max_workers=None):
+        """
+        :param shard_key: The name of the field whose value picks the shard of a row
+        :type shard_key: str
+
+        :param shards: The django database aliases of the shards
+        :type shards: list of str
+
+        :param shard_function: A function that takes a shard key value and the list of shards and
+            returns the alias of the value's shard. Defaults to ``self.get_default_shard``
+        :type shard_function: function or None
+
+        :param max_workers: The maximum number of shards that are queried at the same time.
+            Defaults to the number of shards
+        :type max_workers: int or None
+        """
+        if not shards:
+            raise ValueError('At least one shard is required')
+        self.shard_key = shard_key
+        self.shards = list(shards)
+        self.shard_function = shard_function
+        self.max_workers = max_workers or len(self.shards)
+
+    def get_default_shard(self, value):
+        """
+        Gets the shard of a shard key value. Integers are assigned to shards by modulo and other
+        values by a crc32 of their string, so the shard of a value never changes between processes.
+
+        :rtype: str
+        """
+        if isinstance(value, int):
+            index = value
+        else:
+            index = zlib.crc32(str(value).encode('utf-8'))
+        return self.shards[index % len(self.shards)]
+
+    def get_shard(self, value):
+        """
+        Gets the alias of the shard database of a shard key value
+
+        :rtype: str
+        """
+        if self.shard_function is not None:
+            return self.shard_function(value, self.shards)
+        return self.get_default_shard(value)
+
+    def get_shard_values(self, query):
+        """
+        Gets the shard key values that the where conditions of a query filter to. Conditions of the
+        shard key with the exact, eq, or in operators restrict the values. Values are intersected
+        for AND conditions and combined for OR conditions.
+
+        :param query: The query to route
+        :type query: :class:`Query <querybuilder.query.Query>`
+
+        :rtype: set or None
+        :return: The shard key values, or None if the query is not filtered by the shard key
+        """
+        return self.get_q_values(query._where.wheres)
+
+    def get_q_values(self, q):
+        """
+        Gets the shard key values that a Q object filters to. See ``self.get_shard_values()``
+
+        :rtype: set or None
+        """
+        if q.negated:
+            return None
+
+        child_values = []
+        for child in q.children:
+            if isinstance(child, Q):
+                child_values.append(self.get_q_values(child))
+            else:
+                child_values.append(self.get_condition_values(*child))
+
+        if q.connector == Q.OR:
+            if not child_values or None in child_values:
+                return None
+            return set().union(*child_values)
+
+        values = None
+        for child_value in child_values:
+            if child_value is not None:
+                values = child_value if values is None else values & child_value
+        return values
+
+    def get_condition_values(self, key, value):
+        """
+        Gets the shard key values that a where condition filters to
+
+        :rtype: set or None
+        :return: The values, or None if the condition does not filter the shard key to known values
+        """
+        field_parts = key.split('__')
+        operator = 'exact'
+        if len(field_parts) > 1 and field_parts[-1] in Where.comparison_map:
+            operator = field_parts[-1]
+            field_parts = field_parts[:-1]
+        field_name = '__'.join(field_parts).split('.')[-1]
+
+        if field_name != self.shard_key:
+            return None
+        if operator in ('exact', 'eq') and value is not None:
+            return {value}
+        if operator == 'in' and isinstance(value, (list, tuple, set)):
+            return set(value)
+        return None
+
+    def get_shards(self, query):
+        """
+        Gets the aliases of the shards that can have rows of a query
+
+        :rtype: list of str
+        """
+        values = self.get_shard_values(query)
+        if values is None:
+            return list(self.shards)
+        aliases = {self.get_shard(value) for value in values}
+        return [alias for alias in self.shards if alias in aliases]
+
+    def get_shard_query(self, query, alias):
+        """
+        Copies a query to run on the database of a shard
+
+        :rtype: :class:`Query <querybuilder.query.Query>`
+        """
+        shard_query = query.copy()
+        shard_query.connection = connections[alias]
+        return shard_query
+
+    def route(self, query):
+        """
+        Gets a copy of a query that runs on the database of the shard of the query's shard key values.
+        The query must filter the shard key to values that are all on one shard.
+
+        :param query: The query to route
+        :type query: :class:`Query <querybuilder.query.Query>`
+
+        :rtype: :class:`Query <querybuilder.query.Query>`
+        :raises ValueError: if the rows of the query can be on more than one shard
+        """
+        aliases = self.get_shards(query)
+        if len(aliases) != 1:
+            raise ValueError('The query must filter {0} to the values of one shard to be routed'.format(
+                self.shard_key
+            ))
+        return self.get_shard_query(query, aliases[0])
+
+    def run(self, query, method, **kwargs):
+        """
+        Calls a method of the copies of a query on each of its shards at the same time.
+        See :func:`run_many <querybuilder.executor.run_many>`
+
+        :rtype: list
+        :return: The result of each shard in the order of ``self.shards``. See ``self.get_shards()``
+        """
+        shard_queries = [self.get_shard_query(query, alias) for alias in self.get_shards(query)]
+        return run_many(shard_queries, max_workers=self.max_workers, method=method, **kwargs)
+
+    def get_reaggregate_functions(self, query):
+        """
+        Gets the function that combines the values of each aggregate field that is selected by
+        a query. Window functions are not aggregates.
+
+        :rtype: dict
+        :return: The function of each aggregate field keyed by the field's name
+        :raises ValueError: if an aggregate can not be computed from the aggregates of each shard
+        """
+        tables = query.tables + [join_item.right_table for join_item in query.joins]
+        functions = {}
+        for table in tables:
+            for field in table.fields:
+                if not isinstance(field, AggregateField) or field.over is not None:
+                    continue
+                function = self.reaggregate_functions.get(type(field))
+                if function is None or field.distinct:
+                    raise ValueError('{0} can not be combined across shards'.format(field.get_select_sql()))
+                functions[field.get_name()] = function
+        return functions
+
+    def select(self, query, return_models=False, nest=False, bypass_safe_limit=False):
+        """
+        Selects the rows of a query from each of its shards at the same time and gathers them into
+        one result. The rows of the shards are
+
+        * concatenated in the order of the shards if the query is not sorted
+        * merged in the order of the query's sorters, which must be selected
+        * grouped by the fields that are not aggregates with the Count, Sum, Min, and Max aggregates
+          combined if the query selects aggregates
+
+        A limit and offset are applied to the gathered rows. Strings are compared with python's
+        ordering instead of the database collation when merging, and the safe limit applies to
+        the rows of each shard.
+
+        :param query: The query to select
+        :type query: :class:`Query <querybuilder.query.Query>`
+
+        :type return_models: bool
+        :param return_models: Set to True to return a list of models instead of a list of dictionaries.
+            Defaults to False
+
+        :type nest: bool
+        :param nest: Set to True to treat all double underscores in keynames as nested data.
+            See :func:`select <querybuilder.query.Query.select>`. Defaults to False
+
+        :type bypass_safe_limit: bool
+        :param bypass_safe_limit: Ignores the safe_limit option even if the safe_limit is enabled.
+            Defaults to False
+
+        :rtype: list of dict
+        :return: list of dictionaries of the rows
+        """
+        reaggregate_functions = self.get_reaggregate_functions(query)
+        sort_keys = [(sorter.field.get_name(), sorter.desc) for sorter in query.sorters]
+
+        # each shard selects the rows up to the end of the limit, since any of them can be in the
+        # gathered rows. Grouped aggregates are only complete once all of the shards are combined.
+        limit = query._limit.limit if query._limit else None
+        offset = (query._limit.offset if query._limit else None) or 0
+        shard_query = query
+        if offset or (limit and reaggregate_functions):
+            shard_query = query.copy()
+            shard_query.limit(limit + offset if limit and not reaggregate_functions else None)
+
+        aliases = self.get_shards(query)
+        shard_queries = [self.get_shard_query(shard_query, alias) for alias in aliases]
+        shard_rows = run_many(
+            shard_queries,
+            max_workers=self.max_workers,
+            bypass_safe_limit=bypass_safe_limit,
+        )
+
+        for rows in shard_rows:
+            for name, desc in sort_keys:
+                if rows and name not in rows[0]:
+                    raise ValueError('The sorted field {0} must be selected to gather the rows of shards'.format(name))
+
+        # tag each row with the index of its shard to build models with the shard's alias
+        tagged_rows = [[(index, row) for row in rows] for index, rows in enumerate(shard_rows)]
+        sort_key = self.get_sort_key(sort_keys)
+        if reaggregate_functions:
+            rows = self.reaggregate([row for rows in shard_rows for row in rows], reaggregate_functions)
+            if sort_keys:
+                rows.sort(key=sort_key)
+            rows = [(None, row) for row in rows]
+        elif sort_keys:
+            rows = list(heapq.merge(*tagged_rows, key=lambda item: sort_key(item[1])))
+        else:
+            rows = [item for rows in tagged_rows for item in rows]
+
+        if offset or limit:
+            rows = rows[offset:offset + limit if limit else None]
+
+        return self.format_rows(query, shard_queries, rows, return_models, nest)
+
+    def get_sort_key(self, sort_keys):
+        """
+        Gets a key function that sorts rows like the ORDER BY of the sorted fields
+
+        :param sort_keys: The name of each sorted field and if it is sorted in descending order
+        :type sort_keys: list of tuple
+        """
+        def compare_rows(a, b):
+            for name, desc in sort_keys:
+                result = compare_values(a[name], b[name])
+                if result:
+                    return -result if desc else result
+            return 0
+        return cmp_to_key(compare_rows)
+
+    def reaggregate(self, rows, reaggregate_functions):
+        """
+        Combines the rows of the shards that have the same values of the fields that are not aggregates
+
+        :param reaggregate_functions: The function of each aggregate field. See ``self.get_reaggregate_functions()``
+        :type reaggregate_functions: dict
+
+        :rtype: list of dict
+        :return: One row for each group in the order the groups were first seen
+        """
+        groups = {}
+        for row in rows:
+            group_key = tuple(
+                freeze_value(value) for name, value in row.items() if name not in reaggregate_functions
+            )
+            groups.setdefault(group_key, []).append(row)
+
+        combined_rows = []
+        for group_rows in groups.values():
+            row = dict(group_rows[0])
+            for name, function in reaggregate_functions.items():
+                if name in row:
+                    row[name] = function([group_row[name] for group_row in group_rows])
+            combined_rows.append(row)
+        return combined_rows
+
+    def format_rows(self, query, shard_queries, tagged_rows, return_models, nest):
+        """
+        Formats the gathered rows with the query of the shard each row came from, so models are
+        marked with the alias of their shard. Combined rows are formatted with the original query.
+
+        :rtype: list
+        """
+        if not return_models and not nest:
+            return [row for index, row in tagged_rows]
+
+        positions_by_index = {}
+        for position, (index, row) in enumerate(tagged_rows):
+            positions_by_index.setdefault(index, []).append(position)
+
+        formatted_rows = [None] * len(tagged_rows)
+        for index, positions in positions_by_index.items():
+            format_query = query if index is None else shard_queries[index]
+            rows = format_query._format_rows(
+                [tagged_rows[position][1] for position in positions],
+                return_models=return_models,
+                nest=nest,
+            )
+            for position, row in zip(positions, rows):
+                formatted_rows[position] = row
+        return formatted_rows
+
+    def count(self, query, field='*'):
+        """
+        Counts the rows of a query on each of its shards and adds the counts
+
+        :rtype: int
+        """
+        return sum(self.run(query, 'count', field=field))
+
+    def sum(self, query, field):
+        """
+        Gets the sum of a field over the rows of a query on all of its shards
+
+        :rtype: int or float or None
+        """
+        return sum_values(self.run(query, 'sum', field=field))
+
+    def min(self, query, field):
+        """
+        Gets the minimum value of a field over the rows of a query on all of its shards
+        """
+        return min_value(self.run(query, 'min', field=field))
+
+    def max(self, query, field):
+        """
+        Gets the maximum value of a field over the rows of a query on all of its shards
+        """
+        return max_value(self.run(query, 'max', field=field))
+
+    def aggregate(self, query, **aggregates):
+        """
+        Performs several aggregates over the rows of a query on all of its shards.
+        See :func:`aggregate <querybuilder.query.Query.aggregate>`. Only the Count, Sum, Min, and Max
+        aggregates can be combined across shards.
+
+        :return: The value of each aggregate keyed by its name
+        :rtype: dict
+        """
+        functions = {}
+        for alias, field in aggregates.items():
+            if isinstance(field, str):
+                functions[alias] = sum_values
+                continue
+            function = self.reaggregate_functions.get(type(field))
+            if function is None or field.distinct:
+                raise ValueError('{0} can not be combined across shards'.format(field.get_select_sql()))
+            functions[alias] = function
+
+        shard_rows = self.run(query, 'aggregate', **aggregates)
+        return {
+            alias: function([row[alias] for row in shard_rows])
+            for alias, function in functions.items()
+        }
@@ -4,6 +4,8 @@ from django.db.models.base import ModelBase
 
 import querybuilder
 from querybuilder.fields import FieldFactory
+from querybuilder.helpers import clone_instance
+from querybuilder.metadata import get_model_metadata
 
 
 class TableFactory(object):
@@ -59,6 +61,10 @@ class Table(object, metaclass=ABCMeta):
             An alias that is set automatically by the Query if needed for inner query
             namespacing
     """
+    __slots__ = (
+        'table', 'owner', 'name', 'alias', 'auto_alias', 'fields', 'schema', 'extract_fields', 'prefix_fields',
+        'field_prefix',
+    )
 
     def __init__(self, table=None, fields=None, schema=None, extract_fields=False, prefix_fields=False,
                  field_prefix=None, owner=None, alias=None):
@@ -182,6 +188,38 @@ class Table(object, metaclass=ABCMeta):
             return alias
         return self.get_name()
 
+    def mark_dirty(self):
+        """
+        Marks the query that owns this table as dirty so its cached sql is generated again
+        """
+        if self.owner is not None:
+            self.owner.mark_dirty()
+
+    def clone(self, memo=None):
+        """
+        Makes a structural copy of this table that copies its fields instead of deep copying
+        everything. See :func:`clone_instance <querybuilder.helpers.clone_instance>`
+
+        :param memo: A dict of the id of each object that has been copied to its copy
+        :type memo: dict or None
+
+        :return: The copied table
+        :rtype: :class:`Table <querybuilder.tables.Table>`
+        """
+        return clone_instance(self, memo)
+
+    def clone_references(self, memo):
+        """
+        Replaces the objects this copied table references with their clones. If the owner is
+        being copied, the copied table is owned by the copied owner. This is meant to be extended
+        by any subclass that references other mutable objects.
+        """
+        self.owner = memo.get(id(self.owner), self.owner)
+        self.fields = [field.clone(memo) for field in self.fields]
+
+    def __copy__(self):
+        return self.clone()
+
     def add_field(self, field):
         """
         Adds a field to this table
@@ -201,6 +239,8 @@ class Table(object, metaclass=ABCMeta):
             if existing_field.get_name() == field_name:
                 return None
 
+        self.mark_dirty()
+
         self.before_add_field(field)
         field.before_add()
 
@@ -225,6 +265,7 @@ class Table(object, metaclass=ABCMeta):
         for field in self.fields:
             if field.get_identifier() == new_field_identifier:
                 self.fields.remove(field)
+                self.mark_dirty()
                 return field
         return None
 
@@ -246,6 +287,7 @@ class Table(object, metaclass=ABCMeta):
             or ``Field`` instance
         :type fields: str or tuple or list of str or list of Field or :class:`Field <querybuilder.fields.Field>`
         """
+        self.mark_dirty()
         self.fields = []
         self.add_fields(fields)
 
@@ -331,6 +373,7 @@ class SimpleTable(Table):
     """
     A table that is created with just the string name of the table
     """
+    __slots__ = ()
 
     def init_defaults(self):
         """
@@ -345,6 +388,7 @@ class ModelTable(Table):
     A table that is created by passing a django model for the table field. This allows
     fields to be extract and for joins to be made without specifying a condition.
     """
+    __slots__ = ('model',)
 
     def init_defaults(self):
         """
@@ -353,7 +397,7 @@ class ModelTable(Table):
         """
         super(ModelTable, self).init_defaults()
         self.model = self.table
-        self.name = self.model._meta.db_table
+        self.name = get_model_metadata(self.model).db_table
 
     def before_add_field(self, field):
         """
@@ -362,8 +406,7 @@ class ModelTable(Table):
         """
         if self.extract_fields and field.name == '*':
             field.ignore = True
-            fields = [model_field.column for model_field in self.model._meta.fields]
-            self.add_fields(fields)
+            self.add_fields(get_model_metadata(self.model).column_names)
 
 
 class QueryTable(Table):
@@ -371,6 +414,7 @@ class QueryTable(Table):
     A table that contains a Query object. This is used for inner queries in more complex
     queries, usually involving window functions or some sort of aggregation.
     """
+    __slots__ = ('query',)
 
     def init_defaults(self):
         """
@@ -379,6 +423,15 @@ class QueryTable(Table):
         super(QueryTable, self).init_defaults()
         self.query = self.table
         self.query.is_inner = True
+        self.query.mark_dirty()
+
+    def clone_references(self, memo):
+        """
+        Also clones the inner query
+        """
+        super(QueryTable, self).clone_references(memo)
+        self.query = self.query.clone(memo)
+        self.table = self.query
 
     def get_sql(self):
         return self.get_identifier()
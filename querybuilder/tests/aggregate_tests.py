@@ -1,4 +1,10 @@
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import override_settings
+
 from querybuilder.fields import CountField, AvgField, MaxField, MinField, StdDevField, SumField, VarianceField
+from querybuilder.logger import Logger
 from querybuilder.query import Query
 from querybuilder.tests.models import Order, User
 from querybuilder.tests.query_tests import QueryTestCase, get_comparison_str
@@ -152,6 +158,27 @@ class AggregateTest(QueryTestCase):
         self.assertEqual(len(query.tables[0].fields), 2)
         self.assertEqual(len(query.sorters), 1)
 
+    def test_count_estimate(self):
+        """
+        Tests that count() returns the planner's estimate from the table statistics
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE {0}'.format(Order._meta.db_table))
+
+        query = Query().from_table(Order)
+        self.assertEqual(query.count(estimate=True), Order.objects.count())
+        self.assertIsInstance(query.where(margin__gt=1000).count(estimate=True), int)
+
+    def test_count_estimate_threshold(self):
+        """
+        Tests that an exact count is only run when the estimate is less than the threshold
+        """
+        query = Query().from_table(Order)
+        with patch.object(Query, 'get_count_estimate', return_value=1000):
+            self.assertEqual(query.count(estimate=True, exact_threshold=100), 1000)
+            self.assertEqual(query.count(estimate=True, exact_threshold=10000), Order.objects.count())
+            self.assertEqual(query.count(exact_threshold=100), Order.objects.count())
+
     def test_max(self):
         """
         Tests that the max() function properly gets the max value from the query
@@ -225,3 +252,36 @@ class AggregateTest(QueryTestCase):
                 received
             )
         )
+
+    @override_settings(DEBUG=True)
+    def test_aggregate(self):
+        """
+        Tests that aggregate() gets several aggregates in one query
+        """
+        query = Query().from_table(
+            Order
+        ).where(
+            margin__gt=0
+        )
+        logger = Logger()
+        logger.start_logging()
+        received = query.aggregate(
+            count='*',
+            total=SumField('revenue'),
+            max_margin=MaxField('margin'),
+            mean=AvgField('margin'),
+        )
+        logger.stop_logging()
+
+        orders = list(Order.objects.filter(margin__gt=0))
+        self.assertEqual(received, {
+            'count': len(orders),
+            'total': sum([order.revenue for order in orders]),
+            'max_margin': max([order.margin for order in orders]),
+            'mean': sum([order.margin for order in orders]) / len(orders),
+        })
+        self.assertEqual(logger.count(), 1)
+
+    def test_aggregate_requires_fields(self):
+        with self.assertRaises(ValueError):
+            Query().from_table(Order).aggregate()
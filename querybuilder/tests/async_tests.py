@@ -0,0 +1,141 @@
+import asyncio
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.test import TransactionTestCase
+from django_dynamic_fixture import G
+
+from querybuilder import aio
+from querybuilder.cache import LocMemResultCache
+from querybuilder.query import Query
+from querybuilder.tests.models import Account, MetricRecord, Uniques, User
+
+
+class AsyncQueryTest(TransactionTestCase):
+    """
+    The native async methods run on their own connections, so the rows they read and write have to
+    be committed instead of being in the transaction of a django TestCase
+    """
+    databases = ['default', 'mock-second-database']
+
+    def setUp(self):
+        super(AsyncQueryTest, self).setUp()
+        self.user = G(User, email='one@example.com')
+        G(User, email='two@example.com')
+
+    def tearDown(self):
+        Query.result_cache = None
+        super(AsyncQueryTest, self).tearDown()
+
+    def get_query(self):
+        return Query().from_table(User, fields=['id', 'email']).order_by('id')
+
+    def test_supports_async(self):
+        self.assertTrue(aio.supports_async(Query().connection))
+
+    def test_connection_pool_by_alias(self):
+        default_pool = object()
+        Query.async_connection_pool = {'default': default_pool}
+        self.addCleanup(setattr, Query, 'async_connection_pool', None)
+        with patch('querybuilder.aio.async_connection') as async_connection:
+            Query().get_async_connection()
+            Query(connection=connections['mock-second-database']).get_async_connection()
+        self.assertIs(async_connection.call_args_list[0][0][1], default_pool)
+        self.assertIsNone(async_connection.call_args_list[1][0][1])
+
+        Query.async_connection_pool = default_pool
+        with patch('querybuilder.aio.async_connection') as async_connection:
+            Query(connection=connections['mock-second-database']).get_async_connection()
+        self.assertIs(async_connection.call_args[0][1], default_pool)
+
+    def test_aselect(self):
+        query = self.get_query()
+        self.assertEqual(asyncio.run(query.aselect()), query.select())
+        self.assertEqual(
+            asyncio.run(query.aselect(row_format='tuple')),
+            [(self.user.id, 'one@example.com'), (self.user.id + 1, 'two@example.com')]
+        )
+        models = asyncio.run(query.aselect(return_models=True))
+        self.assertEqual([user.email for user in models], ['one@example.com', 'two@example.com'])
+
+    def test_aselect_json(self):
+        G(MetricRecord, data={'one': 1})
+        query = Query().from_table(MetricRecord, fields=['data'])
+        self.assertEqual(asyncio.run(query.aselect()), [{'data': {'one': 1}}])
+        rows = asyncio.run(query.aselect(lazy_json=True))
+        self.assertEqual(rows[0]['data'], {'one': 1})
+
+    def test_aselect_cached(self):
+        Query.result_cache = LocMemResultCache()
+        rows = asyncio.run(self.get_query().cache_results().aselect())
+        with patch.object(Query, 'get_async_connection') as get_async_connection:
+            self.assertEqual(asyncio.run(self.get_query().cache_results().aselect()), rows)
+        self.assertEqual(get_async_connection.call_count, 0)
+
+    def test_aiter_select(self):
+        async def collect(query):
+            return [row async for row in query.aiter_select(chunk_size=1)]
+
+        query = self.get_query()
+        self.assertEqual(asyncio.run(collect(query)), query.select())
+
+    def test_ainsert(self):
+        query = Query().from_table(Account, fields=['user_id', 'first_name', 'last_name'])
+        asyncio.run(query.ainsert([[self.user.id, 'Test', 'User']]))
+        asyncio.run(query.ainsert([[self.user.id + 1, 'Copy', 'User']], use_copy=True))
+        self.assertEqual(
+            list(Account.objects.order_by('id').values_list('first_name', flat=True)),
+            ['Test', 'Copy']
+        )
+
+    def test_aupdate(self):
+        query = Query().from_table(User, fields=['id', 'email'])
+        asyncio.run(query.aupdate([[self.user.id, 'new@example.com']], use_unnest=True))
+        self.assertEqual(User.objects.get(id=self.user.id).email, 'new@example.com')
+
+    def test_aupsert(self):
+        items = [
+            Uniques(field1=value, field2=value, field3=value, field6=value, field7=value)
+            for value in ['1', '2']
+        ]
+        rows = asyncio.run(Query().from_table(Uniques).aupsert(
+            items,
+            unique_fields=['field1'],
+            update_fields=['field3'],
+            return_models=True,
+            batch_size=1,
+        ))
+        self.assertEqual([row.field1 for row in rows], ['1', '2'])
+        self.assertFalse(rows[0]._state.adding)
+        self.assertEqual(Uniques.objects.count(), 2)
+
+    def test_acount(self):
+        query = self.get_query()
+        self.assertEqual(asyncio.run(query.acount()), 2)
+        self.assertGreaterEqual(asyncio.run(query.acount(estimate=True)), 1)
+        self.assertEqual(asyncio.run(query.acount(estimate=True, exact_threshold=1000)), 2)
+
+    def test_aexplain(self):
+        rows = asyncio.run(self.get_query().aexplain(row_format='tuple'))
+        self.assertIn('cost=', rows[0][0])
+
+    def test_sync_fallback(self):
+        async def run(query):
+            return (
+                await query.aselect(),
+                [row async for row in query.aiter_select(chunk_size=1)],
+                await query.acount(),
+            )
+
+        # the fallback runs on the django connections of the sync_to_async thread
+        self.addCleanup(lambda: asyncio.run(sync_to_async(connections.close_all)()))
+
+        query = self.get_query()
+        with patch('querybuilder.aio.supports_async', return_value=False):
+            with patch.object(Query, 'get_async_connection') as get_async_connection:
+                rows, iter_rows, count = asyncio.run(run(query))
+        self.assertEqual(get_async_connection.call_count, 0)
+        self.assertEqual(rows, query.select())
+        self.assertEqual(iter_rows, rows)
+        self.assertEqual(count, 2)
@@ -0,0 +1,170 @@
+from unittest.mock import patch
+
+from django_dynamic_fixture import G
+
+from querybuilder.cache import DjangoResultCache, LocMemResultCache, get_result_cache_key
+from querybuilder.query import Query
+from querybuilder.tests.base import QuerybuilderTestCase
+from querybuilder.tests.models import Account, User
+
+
+class ResultCacheKeyTests(QuerybuilderTestCase):
+    def test_key(self):
+        key = get_result_cache_key('SELECT 1 WHERE a = %(A0)s', {'A0': 1})
+        self.assertEqual(key, get_result_cache_key('SELECT 1 WHERE a = %(A0)s', {'A0': 1}))
+        self.assertNotEqual(key, get_result_cache_key('SELECT 1 WHERE a = %(A0)s', {'A0': 2}))
+        self.assertNotEqual(key, get_result_cache_key('SELECT 1 WHERE a = %(A0)s', {'A0': 1}, alias='other'))
+        self.assertNotEqual(key, get_result_cache_key('SELECT 1 WHERE a = %(A0)s', {'A0': 1}, row_format='tuple'))
+
+
+class LocMemResultCacheTests(QuerybuilderTestCase):
+    def test_get_set(self):
+        cache = LocMemResultCache()
+        rows = [{'id': 1}]
+        cache.set('a', rows, ['t'])
+        rows[0]['id'] = 2
+        cached_rows = cache.get('a', ['t'])
+        self.assertEqual(cached_rows, [{'id': 1}])
+        cached_rows[0]['id'] = 3
+        self.assertEqual(cache.get('a', ['t']), [{'id': 1}])
+        self.assertIsNone(cache.get('b', ['t']))
+
+    def test_timeout(self):
+        cache = LocMemResultCache(timeout=10)
+        with patch('querybuilder.cache.time.monotonic', return_value=100):
+            cache.set('a', [], ['t'])
+            cache.set('b', [], ['t'], timeout=30)
+        with patch('querybuilder.cache.time.monotonic', return_value=120):
+            self.assertIsNone(cache.get('a', ['t']))
+            self.assertEqual(cache.get('b', ['t']), [])
+        self.assertEqual(list(cache.entries.keys()), ['b'])
+
+    def test_lru(self):
+        cache = LocMemResultCache(max_size=2)
+        cache.set('a', 1, ['t'])
+        cache.set('b', 2, ['t'])
+        cache.get('a', ['t'])
+        cache.set('c', 3, ['t'])
+        self.assertEqual(cache.get('a', ['t']), 1)
+        self.assertIsNone(cache.get('b', ['t']))
+        self.assertEqual(cache.get('c', ['t']), 3)
+
+    def test_invalidate_tables(self):
+        cache = LocMemResultCache()
+        cache.set('a', 1, ['t1'])
+        cache.set('b', 2, ['t1', 't2'])
+        cache.set('c', 3, ['t3'])
+        cache.invalidate_tables(['t2'])
+        self.assertEqual(cache.get('a', ['t1']), 1)
+        self.assertIsNone(cache.get('b', ['t1', 't2']))
+        cache.invalidate_tables(['t1'])
+        self.assertIsNone(cache.get('a', ['t1']))
+        self.assertEqual(cache.get('c', ['t3']), 3)
+        cache.clear()
+        self.assertIsNone(cache.get('c', ['t3']))
+
+    def test_invalidate_before_set(self):
+        cache = LocMemResultCache()
+        versioned_key = cache.get_versioned_key('a', ['t1'])
+        cache.invalidate_tables(['t1'])
+        cache.set('a', 1, ['t1'], versioned_key=versioned_key)
+        self.assertIsNone(cache.get('a', ['t1']))
+
+        versioned_key = cache.get_versioned_key('a', ['t1'])
+        cache.set('a', 2, ['t1'], versioned_key=versioned_key)
+        self.assertEqual(cache.get('a', ['t1']), 2)
+
+
+class DjangoResultCacheTests(QuerybuilderTestCase):
+    def setUp(self):
+        super(DjangoResultCacheTests, self).setUp()
+        self.cache = DjangoResultCache(key_prefix='querybuilder_tests')
+        self.cache.cache.clear()
+
+    def test_invalidate_tables(self):
+        self.cache.set('a', 1, ['t1'])
+        self.cache.set('b', 2, ['t1', 't2'])
+        self.cache.set('c', 3, ['t3'])
+        self.cache.invalidate_tables(['t2'])
+        self.assertEqual(self.cache.get('a', ['t1']), 1)
+        self.assertIsNone(self.cache.get('b', ['t1', 't2']))
+        self.cache.invalidate_tables(['t1'])
+        self.cache.invalidate_tables(['t1'])
+        self.assertIsNone(self.cache.get('a', ['t1']))
+        self.assertEqual(self.cache.get('c', ['t3']), 3)
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('c', ['t3']))
+
+    def test_invalidate_before_set(self):
+        versioned_key = self.cache.get_versioned_key('a', ['t1'])
+        self.cache.invalidate_tables(['t1'])
+        self.cache.set('a', 1, ['t1'], versioned_key=versioned_key)
+        self.assertIsNone(self.cache.get('a', ['t1']))
+
+    def test_write_during_select(self):
+        Query.result_cache = self.cache
+        self.addCleanup(setattr, Query, 'result_cache', None)
+        user = G(User, email='one@example.com')
+        query = Query().from_table(User, fields=['email']).where(id=user.id).cache_results()
+        finish_select = Query._finish_select
+
+        def write_then_finish_select(query, *args):
+            # the table is written to after the rows are fetched and before they are cached
+            User.objects.filter(id=user.id).update(email='two@example.com')
+            self.cache.invalidate_tables([User._meta.db_table])
+            return finish_select(query, *args)
+
+        with patch.object(Query, '_finish_select', autospec=True, side_effect=write_then_finish_select):
+            self.assertEqual(query.select(), [{'email': 'one@example.com'}])
+        self.assertEqual(query.select(), [{'email': 'two@example.com'}])
+
+
+class QueryResultCacheTests(QuerybuilderTestCase):
+    def setUp(self):
+        super(QueryResultCacheTests, self).setUp()
+        Query.result_cache = LocMemResultCache()
+        self.user = G(User, email='one@example.com')
+        G(User, email='two@example.com')
+
+    def tearDown(self):
+        Query.result_cache = None
+        super(QueryResultCacheTests, self).tearDown()
+
+    def get_query(self):
+        return Query().from_table(User, fields=['id', 'email']).order_by('id').cache_results()
+
+    def test_select(self):
+        rows = self.get_query().select()
+        with patch.object(Query, 'get_cursor') as get_cursor:
+            self.assertEqual(self.get_query().select(), rows)
+            self.assertEqual(self.get_query().select(nest=True), rows)
+        self.assertEqual(get_cursor.call_count, 0)
+
+    def test_select_not_enabled(self):
+        Query().from_table(User).select()
+        self.assertEqual(len(Query.result_cache.entries), 0)
+
+    def test_aggregates(self):
+        query = self.get_query()
+        self.assertEqual(query.count(), 2)
+        self.assertEqual(query.max('id'), self.user.id + 1)
+        with patch.object(Query, 'get_cursor') as get_cursor:
+            self.assertEqual(query.count(), 2)
+            self.assertEqual(query.max('id'), self.user.id + 1)
+        self.assertEqual(get_cursor.call_count, 0)
+
+    def test_invalidate_on_write(self):
+        query = Query().from_table(User, fields=['id']).join(Account, fields=['id']).cache_results()
+        self.assertEqual(query.select(), [])
+        self.assertEqual(query.select(), [])
+
+        account = Account(user=self.user, first_name='Test', last_name='User')
+        Query().from_table(Account, fields=['user_id', 'first_name', 'last_name']).insert([
+            [account.user_id, account.first_name, account.last_name]
+        ])
+        self.assertEqual(len(query.select()), 1)
+
+        other_query = Query().from_table(User, fields=['email']).where(id=self.user.id).cache_results()
+        self.assertEqual(other_query.select(), [{'email': 'one@example.com'}])
+        Query().from_table(User, fields=['id', 'email']).update([[self.user.id, 'new@example.com']])
+        self.assertEqual(other_query.select(), [{'email': 'new@example.com'}])
@@ -1,6 +1,6 @@
 from django.db import connection
 
-from querybuilder.cursor import json_cursor
+from querybuilder.cursor import CopyRowsFile, format_copy_row, get_positional_sql, json_cursor
 from querybuilder.tests.base import QuerybuilderTestCase
 from querybuilder.tests.models import MetricRecord
 
@@ -13,3 +13,32 @@ class JsonCursorTests(QuerybuilderTestCase):
             cursor.execute(f'select data from {MetricRecord._meta.db_table}')
             record = cursor.fetchone()
             self.assertEqual(record[0], data)
+
+
+class CopyRowsFileTests(QuerybuilderTestCase):
+    def test_format_copy_row(self):
+        self.assertEqual(
+            format_copy_row([1, None, True, False, 'a\tb\nc\\d\re', {'one': 1}]),
+            '1\t\\N\tt\tf\ta\\tb\\nc\\\\d\\re\t{"one": 1}\n'
+        )
+
+    def test_read(self):
+        rows_file = CopyRowsFile([[1, 'one'], [2, 'two']])
+        self.assertEqual(rows_file.read(3), '1\to')
+        self.assertEqual(rows_file.read(), 'ne\n2\ttwo\n')
+        self.assertEqual(rows_file.read(10), '')
+
+
+class PositionalSqlTests(QuerybuilderTestCase):
+    def test_named_args(self):
+        sql, args = get_positional_sql(
+            'SELECT * FROM t WHERE a = %(A0)s AND b LIKE %(A1)s AND c = %(A0)s AND d LIKE \'%%x\'',
+            {'A0': 1, 'A1': 'b', 'A2': 'unused'},
+        )
+        self.assertEqual(sql, 'SELECT * FROM t WHERE a = $1 AND b LIKE $2 AND c = $1 AND d LIKE \'%x\'')
+        self.assertEqual(args, [1, 'b'])
+
+    def test_positional_args(self):
+        sql, args = get_positional_sql('INSERT INTO t (a, b) VALUES (%s, %s)', [1, 2])
+        self.assertEqual(sql, 'INSERT INTO t (a, b) VALUES ($1, $2)')
+        self.assertEqual(args, [1, 2])
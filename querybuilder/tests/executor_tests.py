@@ -0,0 +1,198 @@
+import threading
+from unittest.mock import patch
+
+from django.db import connection, connections
+from django.db.utils import ProgrammingError
+from django.test import TransactionTestCase
+from django_dynamic_fixture import G
+
+from querybuilder.cache import LocMemResultCache
+from querybuilder.executor import get_worker_query, run_many, run_pipeline, supports_pipeline
+from querybuilder.query import Query
+from querybuilder.tests.base import QuerybuilderTestCase
+from querybuilder.tests.models import Account, MetricRecord, User
+
+
+class RunManyTest(TransactionTestCase):
+    """
+    The queries run on the connections of the worker threads, so the rows they read have to be
+    committed instead of being in the transaction of a django TestCase
+    """
+    databases = ['default', 'mock-second-database']
+
+    def setUp(self):
+        super(RunManyTest, self).setUp()
+        self.user1 = G(User, email='one@example.com')
+        self.user2 = G(User, email='two@example.com')
+
+    def get_query(self, user, connection=None):
+        return Query(connection).from_table(User, fields=['email']).where(id=user.id)
+
+    def test_results_in_order(self):
+        queries = [self.get_query(user) for user in [self.user2, self.user1, self.user2]]
+        self.assertEqual(run_many(queries), [
+            [{'email': 'two@example.com'}],
+            [{'email': 'one@example.com'}],
+            [{'email': 'two@example.com'}],
+        ])
+        self.assertEqual(run_many([]), [])
+
+    def test_connections(self):
+        other_connection = connections['mock-second-database']
+        queries = [self.get_query(self.user1), self.get_query(self.user2, other_connection)]
+        self.assertEqual(run_many(queries, method='count'), [1, 1])
+
+        query = self.get_query(self.user1, other_connection)
+        self.assertIs(get_worker_query(query), query)
+        self.assertEqual(run_many([query, query], max_workers=1), [[{'email': 'one@example.com'}]] * 2)
+
+    def test_worker_query(self):
+        query = self.get_query(self.user1)
+        results = []
+
+        def work():
+            worker_query = get_worker_query(query)
+            results.append((worker_query, worker_query.connection))
+            connections.close_all()
+
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+
+        worker_query, worker_connection = results[0]
+        self.assertIsNot(worker_query, query)
+        self.assertIsNot(worker_connection, connections['default'])
+        self.assertEqual(worker_connection.alias, 'default')
+        self.assertEqual(worker_query.get_sql(), query.get_sql())
+        self.assertIs(query.connection, connection)
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def select(query):
+            barrier.wait()
+            return threading.get_ident()
+
+        with patch.object(Query, 'select', autospec=True, side_effect=select):
+            thread_ids = run_many([self.get_query(self.user1) for _ in range(3)], max_workers=3)
+        self.assertEqual(len(set(thread_ids)), 3)
+        self.assertNotIn(threading.get_ident(), thread_ids)
+
+    def test_errors(self):
+        queries = [
+            self.get_query(self.user1),
+            Query().from_table('missing_table'),
+            self.get_query(self.user2),
+        ]
+        with self.assertRaises(ProgrammingError):
+            run_many(queries)
+
+        results = run_many(queries, return_exceptions=True)
+        self.assertEqual(results[0], [{'email': 'one@example.com'}])
+        self.assertIsInstance(results[1], ProgrammingError)
+        self.assertEqual(results[2], [{'email': 'two@example.com'}])
+
+        results = run_many(queries, max_workers=1, return_exceptions=True)
+        self.assertIsInstance(results[1], ProgrammingError)
+        self.assertEqual(results[2], [{'email': 'two@example.com'}])
+
+        with patch.object(Query, 'select', autospec=True) as select:
+            select.side_effect = ValueError
+            with self.assertRaises(ValueError):
+                run_many(queries, max_workers=1)
+        self.assertEqual(select.call_count, 1)
+
+
+class RunPipelineTest(QuerybuilderTestCase):
+    def setUp(self):
+        super(RunPipelineTest, self).setUp()
+        self.user1 = G(User, email='one@example.com')
+        self.user2 = G(User, email='two@example.com')
+
+    def tearDown(self):
+        Query.result_cache = None
+        super(RunPipelineTest, self).tearDown()
+
+    def get_queries(self):
+        return [
+            Query().from_table(User, fields=['email']).where(id=self.user2.id),
+            Query().from_table(User, fields=['id', 'email']).order_by('id'),
+            Query(connections['mock-second-database']).from_table(User, fields=['email']).where(id=self.user1.id),
+            Query().from_table(Account),
+        ]
+
+    def get_pipeline(self):
+        return patch.object(
+            type(connection.connection), 'pipeline', autospec=True, side_effect=type(connection.connection).pipeline
+        )
+
+    def test_results(self):
+        queries = self.get_queries()
+        connection.ensure_connection()
+        with self.get_pipeline() as pipeline:
+            results = run_pipeline(queries)
+        self.assertEqual(pipeline.call_count, 2)
+        self.assertEqual(results, [query.select() for query in queries])
+        self.assertEqual(results[0], [{'email': 'two@example.com'}])
+        self.assertEqual(results[3], [])
+
+        self.assertEqual(
+            run_pipeline(queries[:2], row_format='tuple'),
+            [[('two@example.com',)], [(self.user1.id, 'one@example.com'), (self.user2.id, 'two@example.com')]]
+        )
+        models = run_pipeline(queries[:1], return_models=True)
+        self.assertEqual(models[0][0].email, 'two@example.com')
+        self.assertEqual(run_pipeline([]), [])
+
+    def test_cursors_closed(self):
+        cursors = []
+        connection_type = type(connections['default'])
+        get_cursor = connection_type.cursor
+
+        def cursor(connection):
+            cursors.append(get_cursor(connection))
+            return cursors[-1]
+
+        with patch.object(connection_type, 'cursor', autospec=True, side_effect=cursor):
+            run_pipeline(self.get_queries()[:2])
+            self.assertEqual(len(cursors), 2)
+            self.assertTrue(all(cursor.closed for cursor in cursors))
+
+            with self.assertRaises(ProgrammingError):
+                run_pipeline([Query().from_table(User), Query().from_table('missing_table')])
+            self.assertEqual(len(cursors), 4)
+            self.assertTrue(all(cursor.closed for cursor in cursors))
+
+    def test_json(self):
+        G(MetricRecord, data={'one': 1})
+        query = Query().from_table(MetricRecord, fields=['data'])
+        self.assertEqual(run_pipeline([query, query]), [[{'data': {'one': 1}}]] * 2)
+
+    def test_not_supported(self):
+        queries = self.get_queries()
+        with patch('querybuilder.executor.supports_pipeline', return_value=False):
+            with patch.object(Query, 'select', autospec=True, return_value=[]) as select:
+                self.assertEqual(run_pipeline(queries, nest=True), [[]] * 4)
+        self.assertEqual(select.call_count, 4)
+        self.assertTrue(supports_pipeline(connection))
+
+    def test_cached(self):
+        Query.result_cache = LocMemResultCache()
+        queries = [query.cache_results() for query in self.get_queries()]
+        results = run_pipeline(queries)
+        connection.ensure_connection()
+        with self.get_pipeline() as pipeline:
+            self.assertEqual(run_pipeline(queries), results)
+        self.assertEqual(pipeline.call_count, 0)
+
+    def test_safe_limit(self):
+        with patch.object(Query, 'enable_safe_limit', True), patch.object(Query, 'safe_limit', 1):
+            queries = [Query().from_table(User), Query().from_table(User).where(id=self.user1.id)]
+            results = run_pipeline(queries)
+        self.assertEqual([len(rows) for rows in results], [1, 1])
+        self.assertTrue(queries[0].safe_limit_truncated)
+        self.assertFalse(queries[1].safe_limit_truncated)
+
+    def test_error(self):
+        with self.assertRaises(ProgrammingError):
+            run_pipeline([Query().from_table('missing_table'), Query().from_table(User)])
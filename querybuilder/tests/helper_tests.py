@@ -1,5 +1,25 @@
-from querybuilder.helpers import value_for_keypath, set_value_for_keypath
+import datetime
+import decimal
+import uuid
+
+from querybuilder.fields import SimpleField, SumField
+from querybuilder.helpers import (
+    value_for_keypath, set_value_for_keypath, copy_instance, get_slot_names, get_nesting_plan, nest_row,
+    decode_keyset_token, encode_keyset_token
+)
+from querybuilder.tables import ModelTable
 from querybuilder.tests.base import QuerybuilderTestCase
+from querybuilder.tests.models import Order
+
+
+class CustomField(SimpleField):
+    """
+    A field subclass that doesn't declare __slots__
+    """
+
+    def __init__(self, field, label=None, **kwargs):
+        super(CustomField, self).__init__(field, **kwargs)
+        self.label = label
 
 
 class HelperTest(QuerybuilderTestCase):
@@ -83,3 +103,140 @@ class HelperTest(QuerybuilderTestCase):
                 create_if_needed=True
             )
         )
+
+
+class NestRowTest(QuerybuilderTestCase):
+    """
+    Tests nesting rows with a nesting plan
+    """
+
+    def nest_row_with_keypaths(self, row):
+        """
+        How rows were nested before nesting plans
+        """
+        _row = row.copy()
+        for key, value in _row.items():
+            set_value_for_keypath(row, key, value, True, '__')
+            if '__' in key:
+                row.pop(key)
+        return row
+
+    def assert_nested(self, row, expected_row):
+        nested_row = nest_row(dict(row), get_nesting_plan(tuple(row)))
+        self.assertEqual(nested_row, expected_row)
+        self.assertEqual(list(nested_row), list(expected_row))
+        self.assertEqual(nested_row, self.nest_row_with_keypaths(dict(row)))
+        self.assertEqual(list(nested_row), list(self.nest_row_with_keypaths(dict(row))))
+
+    def test_get_nesting_plan(self):
+        self.assertEqual(
+            get_nesting_plan(('id', 'account__id', 'account__user__email')),
+            (('account__id', ('account',), 'id'), ('account__user__email', ('account', 'user'), 'email'))
+        )
+        self.assertEqual(get_nesting_plan(('id', 'name')), ())
+
+    def test_nest_row(self):
+        self.assert_nested(
+            {'account__id': 1, 'id': 2, 'account__user__email': 'a', 'account__name': 'b', 'name': 'c'},
+            {'id': 2, 'name': 'c', 'account': {'id': 1, 'user': {'email': 'a'}, 'name': 'b'}},
+        )
+
+    def test_nest_row_edge_cases(self):
+        # values are nested into existing dictionaries
+        self.assert_nested(
+            {'data': {'a': 1}, 'data__b': 2},
+            {'data': {'a': 1, 'b': 2}},
+        )
+        # an empty key after the last delimeter only creates the parent dictionary
+        self.assert_nested(
+            {'id': 1, 'account__': 2, '__name': 3, 'a____b': 4},
+            {'id': 1, 'account': {}, '': {'name': 3}, 'a': {'': {'b': 4}}},
+        )
+
+
+class CopyInstanceTest(QuerybuilderTestCase):
+    """
+    Tests copying instances of slotted classes
+    """
+
+    def test_slots(self):
+        """
+        Verifies fields and tables don't have an instance __dict__
+        """
+        table = ModelTable(Order, fields=['id', SumField('margin')])
+        self.assertFalse(hasattr(table, '__dict__'))
+        self.assertFalse(hasattr(table.fields[0], '__dict__'))
+        self.assertFalse(hasattr(table.fields[1], '__dict__'))
+        self.assertEqual(get_slot_names(SumField)[-1], 'distinct')
+        self.assertIn('over', get_slot_names(SumField))
+
+    def test_copy_slotted_instance(self):
+        """
+        Verifies all of the slots are copied without calling __init__
+        """
+        table = ModelTable(Order, fields=['id', SumField('margin')])
+        copied_table = copy_instance(table)
+        self.assertIsNot(copied_table, table)
+        self.assertIs(copied_table.model, Order)
+        self.assertIs(copied_table.fields, table.fields)
+        self.assertEqual(copied_table.get_identifier(), table.get_identifier())
+
+        field = table.fields[1]
+        copied_field = copy_instance(field)
+        self.assertIs(copied_field.table, table)
+        self.assertIsNone(copied_field.over)
+        self.assertEqual(copied_field.get_sql(), field.get_sql())
+
+    def test_copy_unset_slot(self):
+        """
+        Verifies slots that were never set stay unset on the copy
+        """
+        field = SimpleField.__new__(SimpleField)
+        field.name = 'id'
+        copied_field = copy_instance(field)
+        self.assertEqual(copied_field.name, 'id')
+        self.assertFalse(hasattr(copied_field, 'alias'))
+
+    def test_copy_subclass_without_slots(self):
+        """
+        Verifies the slots and the __dict__ of a subclass without __slots__ are copied
+        """
+        field = CustomField('id', label='Id')
+        table = ModelTable(Order, fields=[field])
+        copied_field = copy_instance(field)
+        self.assertEqual(copied_field.label, 'Id')
+        self.assertIs(copied_field.table, table)
+        self.assertEqual(copied_field.get_sql(), field.get_sql())
+
+        cloned_field = field.clone()
+        self.assertEqual(cloned_field.label, 'Id')
+        self.assertIsNot(cloned_field.table, table)
+
+
+class KeysetTokenTest(QuerybuilderTestCase):
+    def test_round_trip(self):
+        """
+        Verifies every value decodes to exactly the value that was encoded
+        """
+        values = [
+            datetime.datetime(2012, 10, 19, 1, 2, 3, 123456),
+            datetime.datetime(2012, 10, 19, 1, 2, 3, 1, tzinfo=datetime.timezone.utc),
+            datetime.date(2012, 10, 19),
+            datetime.time(1, 2, 3, 4),
+            datetime.timedelta(days=1, microseconds=5),
+            decimal.Decimal('1.10'),
+            uuid.UUID('12345678123456781234567812345678'),
+            1,
+            1.5,
+            'text',
+            None,
+            [1, 'a'],
+        ]
+        decoded_values = decode_keyset_token(encode_keyset_token(values))
+        self.assertEqual(decoded_values, values)
+        self.assertEqual([type(value) for value in decoded_values], [type(value) for value in values])
+
+    def test_invalid(self):
+        for token in ['not a token', encode_keyset_token([1])[:-4], 'eyJhIjoxfQ==', 'W1siZGF0ZSIsIngiXV0=']:
+            with self.assertRaises(ValueError):
+                decode_keyset_token(token)
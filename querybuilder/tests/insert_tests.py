@@ -1,3 +1,4 @@
+from django.db import IntegrityError
 from django.test.utils import override_settings
 from django_dynamic_fixture import G
 
@@ -91,3 +92,105 @@ class InsertTest(QueryTestCase):
             ("INSERT INTO querybuilder_tests_account (user_id, first_name, last_name) "
              "VALUES (1, 'Test', 'User'), (2, 'Test2', 'User2')")
         )
+
+    def test_insert_copy(self):
+        G(User, id=1)
+        G(User, id=2)
+
+        query = Query().from_table(
+            table=Account,
+            fields=[
+                'user_id',
+                'first_name',
+                'last_name'
+            ]
+        )
+
+        self.assertEqual(
+            query.get_copy_sql(),
+            'COPY querybuilder_tests_account (user_id, first_name, last_name) FROM STDIN'
+        )
+
+        rows = (
+            row for row in [
+                [1, 'Test', 'User\tTab'],
+                [2, 'Test2\\', 'User2\nNewline'],
+            ]
+        )
+        query.insert(rows, use_copy=True)
+
+        accounts = Account.objects.order_by('user_id')
+        self.assertEqual(
+            [(account.user_id, account.first_name, account.last_name) for account in accounts],
+            [(1, 'Test', 'User\tTab'), (2, 'Test2\\', 'User2\nNewline')]
+        )
+
+    def test_copy_insert_count(self):
+        G(User, id=1)
+
+        query = Query().from_table(
+            table=Account,
+            fields=[
+                'user_id',
+                'first_name',
+                'last_name'
+            ]
+        )
+
+        self.assertEqual(query.copy_insert([[1, 'Test', 'User']]), 1)
+        self.assertEqual(query.copy_insert([]), 0)
+
+    def test_insert_batches(self):
+        G(User, id=1)
+        G(User, id=2)
+        G(User, id=3)
+
+        query = Query().from_table(
+            table=Account,
+            fields=[
+                'user_id',
+                'first_name',
+                'last_name'
+            ]
+        )
+        query.max_params = 6
+
+        rows = [
+            [1, 'Test', 'User'],
+            [2, 'Test2', 'User2'],
+            [3, 'Test3', 'User3'],
+        ]
+        query.insert(rows)
+
+        insert_sqls = [
+            log['sql'] for log in self.logger.get_log()
+            if log['sql'].startswith('INSERT INTO querybuilder_tests_account')
+        ]
+        self.assertEqual(insert_sqls, [
+            "INSERT INTO querybuilder_tests_account (user_id, first_name, last_name) "
+            "VALUES (1, 'Test', 'User'), (2, 'Test2', 'User2')",
+            "INSERT INTO querybuilder_tests_account (user_id, first_name, last_name) "
+            "VALUES (3, 'Test3', 'User3')",
+        ])
+        self.assertEqual(Account.objects.count(), 3)
+
+    def test_insert_batches_rollback(self):
+        G(User, id=1)
+
+        query = Query().from_table(
+            table=Account,
+            fields=[
+                'user_id',
+                'first_name',
+                'last_name'
+            ]
+        )
+
+        rows = [
+            [1, 'Test', 'User'],
+            [1, None, 'User2'],
+        ]
+        with self.assertRaises(IntegrityError):
+            query.insert(rows, batch_size=1)
+
+        self.assertEqual(Account.objects.count(), 0)
@@ -0,0 +1,366 @@
+import asyncio
+import functools
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.utils import ProgrammingError
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django_dynamic_fixture import G
+
+from querybuilder.cache import LocMemResultCache
+from querybuilder.cursor import get_sql_fingerprint
+from querybuilder.executor import run_pipeline
+from querybuilder.instrumentation import (
+    QueryEvent, QueryStats, add_query_hook, estimate_rows_bytes, get_execution, get_percentile, null_execution,
+    query_hooks, remove_query_hook
+)
+from querybuilder.query import Query
+from querybuilder.tests.base import QuerybuilderTestCase
+from querybuilder.tests.models import Account, MetricRecord, User
+from querybuilder.utils import LazyJsonRow
+
+
+class FingerprintTest(QuerybuilderTestCase):
+    def test_fingerprint(self):
+        get_fingerprint = functools.partial(get_sql_fingerprint, normalize=True)
+        fingerprint = get_fingerprint('SELECT * FROM t WHERE (id IN (%(A0)s,%(A1)s)) LIMIT 10')
+        self.assertEqual(len(fingerprint), 20)
+        self.assertEqual(fingerprint, get_fingerprint('SELECT * FROM t WHERE (id IN (%(A0)s)) LIMIT 20'))
+        self.assertNotEqual(fingerprint, get_fingerprint('SELECT * FROM t WHERE (name IN (%(A0)s)) LIMIT 10'))
+        self.assertEqual(
+            get_fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            get_fingerprint('INSERT INTO t (a, b) VALUES (%s, %s)'),
+        )
+        self.assertEqual(
+            get_fingerprint('SELECT * FROM t WHERE (a = %(A0)s)'),
+            get_fingerprint('SELECT  *  FROM t\nWHERE (a = %(A1)s)'),
+        )
+        self.assertNotEqual(
+            get_fingerprint("SELECT * FROM t WHERE a LIKE 'x%%'"),
+            get_fingerprint("SELECT * FROM t WHERE a LIKE 'x?'"),
+        )
+        # the exact fingerprint that prepared statements are named for is not normalized
+        self.assertNotEqual(
+            get_sql_fingerprint('SELECT * FROM t WHERE (a = %(A0)s)'),
+            get_sql_fingerprint('SELECT * FROM t WHERE (a = %(A1)s)'),
+        )
+
+    def test_estimate_rows_bytes(self):
+        self.assertEqual(estimate_rows_bytes([{'id': 1, 'name': 'abc', 'data': {'a': [1, 'b']}, 'none': None}]), 20)
+        self.assertEqual(estimate_rows_bytes([(1, 'ab')]), 10)
+        self.assertEqual(estimate_rows_bytes({'id': [1, 2], 'name': ['a', 'bc']}), 19)
+
+        row = LazyJsonRow({'id': 1, 'data': '{"a": 1}'}, pending_keys={'data'})
+        self.assertEqual(estimate_rows_bytes([row]), 16)
+        self.assertEqual(row.pending_keys, {'data'})
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(get_percentile(values, 50), 50)
+        self.assertEqual(get_percentile(values, 95), 95)
+        self.assertEqual(get_percentile(values, 99), 99)
+        self.assertEqual(get_percentile([3], 99), 3)
+        self.assertEqual(get_percentile([1, 2, 3], 0), 1)
+        self.assertIsNone(get_percentile([], 50))
+
+
+@override_settings(DEBUG=False)
+class QueryHookTest(QuerybuilderTestCase):
+    def setUp(self):
+        super(QueryHookTest, self).setUp()
+        self.events = []
+        add_query_hook(self.events.append)
+        self.user = G(User, email='one@example.com')
+
+    def tearDown(self):
+        remove_query_hook(self.events.append)
+        Query.result_cache = None
+        super(QueryHookTest, self).tearDown()
+
+    def test_hooks(self):
+        add_query_hook(self.events.append)
+        self.assertEqual(query_hooks.count(self.events.append), 1)
+        remove_query_hook(self.events.append)
+        remove_query_hook(self.events.append)
+        Query().from_table(User).select()
+        self.assertEqual(self.events, [])
+        self.assertIs(get_execution(), null_execution)
+
+    def test_select(self):
+        query = Query().from_table(User, fields=['id', 'email'])
+        rows = query.select()
+        event = self.events[0]
+        self.assertIsInstance(event, QueryEvent)
+        self.assertEqual(event.method, 'select')
+        self.assertEqual(event.alias, 'default')
+        self.assertEqual(event.sql, query.get_sql())
+        self.assertEqual(event.fingerprint, get_sql_fingerprint(query.get_sql(), normalize=True))
+        self.assertEqual(event.statement_count, 1)
+        self.assertEqual(event.row_count, 1)
+        self.assertEqual(event.byte_estimate, estimate_rows_bytes(rows))
+        self.assertFalse(event.cached)
+        self.assertIsNone(event.error)
+        for time in [event.build_time, event.execute_time, event.fetch_time]:
+            self.assertGreater(time, 0)
+        self.assertGreaterEqual(event.total_time, event.build_time + event.execute_time + event.fetch_time)
+        self.assertIs(get_execution(), null_execution)
+
+        query.select(row_format='columns')
+        self.assertEqual(self.events[1].row_count, 1)
+        self.assertEqual(self.events[1].fingerprint, event.fingerprint)
+
+    def test_cached(self):
+        Query.result_cache = LocMemResultCache()
+        query = Query().from_table(User).cache_results()
+        query.select()
+        query.select()
+        self.assertEqual([event.cached for event in self.events], [False, True])
+        self.assertEqual(self.events[1].statement_count, 0)
+        self.assertEqual(self.events[1].row_count, 1)
+
+    def test_aggregates(self):
+        query = Query().from_table(User)
+        self.assertEqual(query.count(), 1)
+        query.max('id')
+        query.count(estimate=True)
+        self.assertEqual([event.method for event in self.events], ['count', 'max', 'count'])
+        self.assertEqual(self.events[0].sql, query.get_count_query().get_sql())
+        self.assertEqual(self.events[0].row_count, 1)
+        self.assertTrue(self.events[2].sql.startswith('EXPLAIN (FORMAT JSON)'))
+
+    def test_explain(self):
+        rows = Query().from_table(User).explain()
+        self.assertEqual(self.events[0].method, 'explain')
+        self.assertEqual(self.events[0].row_count, len(rows))
+
+    def test_writes(self):
+        query = Query().from_table(Account, fields=['user_id', 'first_name', 'last_name'])
+        query.insert([[self.user.id, 'Test', 'User']])
+        Query().from_table(User, fields=['id', 'email']).update(
+            [[self.user.id, 'new@example.com']], batch_size=1
+        )
+        G(User)
+        Query().from_table(User, fields=['id', 'email']).update([[self.user.id, 'a'], [self.user.id + 1, 'b']])
+
+        insert_event, update_event, batched_update_event = self.events
+        self.assertEqual(insert_event.method, 'insert')
+        self.assertTrue(insert_event.sql.startswith('INSERT INTO'))
+        self.assertEqual(insert_event.row_count, 1)
+        self.assertEqual(update_event.method, 'update')
+        self.assertEqual(update_event.row_count, 1)
+        self.assertEqual(batched_update_event.row_count, 2)
+
+        self.events[:] = []
+        Query().from_table(MetricRecord, fields=['other_value', 'data']).insert(
+            [[1, '{}'], [2, '{}']], use_copy=True, batch_size=1
+        )
+        self.assertEqual(len(self.events), 1)
+        self.assertEqual(self.events[0].method, 'insert')
+        self.assertTrue(self.events[0].sql.startswith('COPY'))
+        self.assertEqual(self.events[0].row_count, 2)
+
+    def test_upsert(self):
+        query = Query().from_table(User)
+        query.upsert([User(id=self.user.id, email='a')], unique_fields=['id'], update_fields=['email'])
+        query.upsert(
+            [User(id=self.user.id, email='b'), User(email='c')],
+            unique_fields=['id'],
+            update_fields=['email'],
+            return_rows=True,
+        )
+        self.assertEqual([event.method for event in self.events], ['upsert', 'upsert'])
+        self.assertEqual(self.events[0].row_count, 1)
+        self.assertEqual(self.events[1].row_count, 2)
+        self.assertEqual(self.events[1].statement_count, 2)
+        self.assertGreater(self.events[1].byte_estimate, 0)
+
+    def test_error(self):
+        with self.assertRaises(Exception):
+            Query().from_table('missing_table').select()
+        self.assertIsNotNone(self.events[0].error)
+        self.assertIs(get_execution(), null_execution)
+
+    def test_hook_error(self):
+        def fail(event):
+            raise ValueError('hook error')
+
+        add_query_hook(fail)
+        self.addCleanup(remove_query_hook, fail)
+        with self.assertLogs('querybuilder.instrumentation', level='ERROR') as logs:
+            self.assertEqual(len(Query().from_table(User).select()), 1)
+            with self.assertRaises(ProgrammingError):
+                Query().from_table('missing_table').select()
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(len(self.events), 2)
+        self.assertIsInstance(self.events[1].error, ProgrammingError)
+
+    def test_iter_select(self):
+        G(User, email='two@example.com')
+        query = Query().from_table(User, fields=['id', 'email']).order_by('id')
+        rows = list(query.iter_select(chunk_size=1))
+        self.assertEqual(len(self.events), 1)
+        event = self.events[0]
+        self.assertEqual(event.method, 'iter_select')
+        self.assertEqual(event.sql, query.get_sql())
+        self.assertEqual(event.row_count, 2)
+        self.assertEqual(event.byte_estimate, estimate_rows_bytes(rows))
+        self.assertIs(get_execution(), null_execution)
+
+        # a generator that is closed early still sends its event
+        rows_iter = query.iter_select(chunk_size=1)
+        next(rows_iter)
+        rows_iter.close()
+        self.assertEqual(self.events[1].row_count, 1)
+        self.assertIsNone(self.events[1].error)
+
+    def test_run_pipeline(self):
+        Query.result_cache = LocMemResultCache()
+        queries = [
+            Query().from_table(User, fields=['email']),
+            Query().from_table(Account).cache_results(),
+        ]
+        run_pipeline(queries)
+        run_pipeline(queries[1:])
+        self.assertEqual([event.method for event in self.events], ['select'] * 3)
+        self.assertEqual([event.sql for event in self.events[:2]], [query.get_sql() for query in queries])
+        self.assertEqual([event.row_count for event in self.events], [1, 0, 0])
+        self.assertEqual([event.cached for event in self.events], [False, False, True])
+        self.assertEqual([event.statement_count for event in self.events], [1, 1, 0])
+
+        self.events[:] = []
+        with self.assertRaises(ProgrammingError):
+            run_pipeline([Query().from_table(User), Query().from_table('missing_table')])
+        self.assertEqual(len(self.events), 2)
+        self.assertTrue(all(event.error is not None for event in self.events))
+
+    def test_no_hooks(self):
+        remove_query_hook(self.events.append)
+        with patch('querybuilder.instrumentation.QueryExecution') as execution:
+            Query().from_table(User).select()
+        self.assertEqual(execution.call_count, 0)
+
+
+@override_settings(DEBUG=False)
+class AsyncQueryHookTest(TransactionTestCase):
+    """
+    The native async methods run on their own connections, so the rows they read have to be committed
+    """
+    databases = ['default']
+
+    def setUp(self):
+        super(AsyncQueryHookTest, self).setUp()
+        self.events = []
+        add_query_hook(self.events.append)
+        self.user = G(User, email='one@example.com')
+
+    def tearDown(self):
+        remove_query_hook(self.events.append)
+        super(AsyncQueryHookTest, self).tearDown()
+
+    def get_query(self):
+        return Query().from_table(User, fields=['id', 'email'])
+
+    async def run_queries(self):
+        query = self.get_query()
+        rows = await query.aselect()
+        iter_rows = [row async for row in query.aiter_select(chunk_size=1)]
+        await query.acount()
+        await query.aexplain()
+        await Query().from_table(Account, fields=['user_id', 'first_name', 'last_name']).ainsert(
+            [[self.user.id, 'Test', 'User']]
+        )
+        await query.aupdate([[self.user.id, 'new@example.com']])
+        await Query().from_table(User).aupsert(
+            [User(id=self.user.id, email='a')], unique_fields=['id'], update_fields=['email'], return_rows=True
+        )
+        return rows, iter_rows
+
+    def test_async(self):
+        rows, iter_rows = asyncio.run(self.run_queries())
+        self.assertEqual([event.method for event in self.events], [
+            'aselect', 'aiter_select', 'acount', 'aexplain', 'ainsert', 'aupdate', 'aupsert'
+        ])
+        select_event, iter_event, count_event, explain_event, insert_event, update_event, upsert_event = self.events
+        self.assertEqual(select_event.sql, self.get_query().get_sql())
+        self.assertEqual(select_event.row_count, 1)
+        self.assertEqual(select_event.byte_estimate, estimate_rows_bytes(rows))
+        self.assertEqual(iter_event.row_count, len(iter_rows))
+        self.assertEqual(count_event.sql, self.get_query().get_count_query().get_sql())
+        self.assertTrue(explain_event.sql.startswith('EXPLAIN'))
+        self.assertEqual(insert_event.row_count, 1)
+        self.assertEqual(update_event.row_count, 1)
+        self.assertEqual(upsert_event.row_count, 1)
+        for event in self.events:
+            self.assertEqual(event.statement_count, 1)
+            self.assertGreater(event.execute_time, 0)
+            self.assertIsNone(event.error)
+
+    def test_async_fallback(self):
+        # the fallback runs on the django connections of the sync_to_async thread
+        self.addCleanup(lambda: asyncio.run(sync_to_async(connections.close_all)()))
+        with patch('querybuilder.aio.supports_async', return_value=False):
+            asyncio.run(self.run_queries())
+        self.assertEqual([event.method for event in self.events], [
+            'aselect', 'iter_select', 'acount', 'aexplain', 'ainsert', 'aupdate', 'aupsert'
+        ])
+        self.assertEqual(self.events[0].row_count, 1)
+        self.assertEqual(self.events[2].statement_count, 1)
+
+
+class QueryStatsTest(QuerybuilderTestCase):
+    def setUp(self):
+        super(QueryStatsTest, self).setUp()
+        self.stats = QueryStats(max_samples=100).install()
+
+    def tearDown(self):
+        self.stats.uninstall()
+        super(QueryStatsTest, self).tearDown()
+
+    def get_event(self, sql, total_time, error=None):
+        event = QueryEvent('select', 'default')
+        event.sql = sql
+        event.fingerprint = get_sql_fingerprint(sql)
+        event.total_time = total_time
+        event.row_count = 2
+        event.error = error
+        return event
+
+    def test_summary(self):
+        for total_time in range(1, 201):
+            self.stats(self.get_event('SELECT 1', total_time))
+        self.stats(self.get_event('SELECT 2', 5, error=ValueError()))
+        self.stats(QueryEvent('select', 'default'))
+
+        summary = self.stats.get_summary()
+        self.assertEqual(len(summary), 2)
+        entry = summary[get_sql_fingerprint('SELECT 1')]
+        self.assertEqual(entry['sql'], 'SELECT 1')
+        self.assertEqual(entry['method'], 'select')
+        self.assertEqual(entry['count'], 200)
+        self.assertEqual(entry['errors'], 0)
+        self.assertEqual(entry['rows'], 400)
+        self.assertEqual(entry['mean'], 100.5)
+        # the percentiles are of the most recent 100 times
+        self.assertEqual(entry['p50'], 150)
+        self.assertEqual(entry['p95'], 195)
+        self.assertEqual(entry['p99'], 199)
+        self.assertEqual(summary[get_sql_fingerprint('SELECT 2')]['errors'], 1)
+
+        self.stats.reset()
+        self.assertEqual(self.stats.get_summary(), {})
+
+    @override_settings(DEBUG=False)
+    def test_queries(self):
+        G(User)
+        for _ in range(3):
+            Query().from_table(User).where(id__in=[1, 2, 3]).select()
+        Query().from_table(User).where(id__in=[1]).select()
+        Query().from_table(User).count()
+
+        summary = self.stats.get_summary()
+        self.assertEqual(sorted(entry['count'] for entry in summary.values()), [1, 4])
+        for entry in summary.values():
+            self.assertLessEqual(entry['p50'], entry['p95'])
+            self.assertLessEqual(entry['p95'], entry['p99'])
@@ -1,10 +1,15 @@
+import json
+import pickle
 import unittest
+from unittest.mock import patch
+
 from django.test.utils import override_settings
 from querybuilder.fields import JsonField
 from querybuilder.query import Query, JsonQueryset
 from querybuilder.tests.base import QuerybuilderTestCase
 from querybuilder.tests.models import MetricRecord
 from querybuilder.tests.utils import get_postgres_version
+from querybuilder.utils import LazyJsonRow, get_json_decoder, json_decode_column, set_json_decoder
 
 
 @override_settings(DEBUG=True)
@@ -73,6 +78,14 @@ class JsonFieldTest(QuerybuilderTestCase):
         )
         self.assertEqual(query.select(), [])
 
+    def test_row_formats(self):
+        MetricRecord.objects.create(data={'one': 1})
+        query = Query().from_table(MetricRecord, fields=['data'])
+
+        self.assertEqual(query.select(row_format='tuple'), [({'one': 1},)])
+        self.assertEqual(query.select(row_format='namedtuple')[0].data, {'one': 1})
+        self.assertEqual(query.select(row_format='columns'), {'data': [{'one': 1}]})
+
     # Currently unused (but maybe again sometime) function to check django version for test results
     # from django import VERSION
     # def is_31_or_above(self):
@@ -83,6 +96,123 @@ class JsonFieldTest(QuerybuilderTestCase):
     #     return False
 
 
+class JsonDecodingTest(QuerybuilderTestCase):
+
+    def setUp(self):
+        super(JsonDecodingTest, self).setUp()
+        MetricRecord.objects.create(data={'one': 1, 'two': 'two'})
+        MetricRecord.objects.create(data=[1, 2])
+
+    def tearDown(self):
+        Query.native_json_decoding = False
+        set_json_decoder()
+        super(JsonDecodingTest, self).tearDown()
+
+    def get_query(self):
+        return Query().from_table(
+            MetricRecord,
+            fields=['data', JsonField('data', key='two', alias='two')]
+        ).order_by('id')
+
+    def test_decode_column(self):
+        self.assertEqual(
+            json_decode_column(['{"a": 1}', None, [1], '2']),
+            [{'a': 1}, None, [1], 2]
+        )
+        # invalid json is left as is
+        self.assertEqual(
+            json_decode_column(['{"a": 1}', 'not json', None]),
+            [{'a': 1}, 'not json', None]
+        )
+
+    def test_default_json_decoder(self):
+        """
+        Verifies the default decoder keeps big integers exact even when a faster decoder is installed
+        """
+        self.assertIs(get_json_decoder(), json.loads)
+        self.assertEqual(
+            json_decode_column(['123456789012345678901234567890', '1e400']),
+            [123456789012345678901234567890, float('inf')]
+        )
+
+    def test_set_json_decoder(self):
+        calls = []
+
+        def loads(value):
+            calls.append(value)
+            return json.loads(value)
+
+        set_json_decoder(loads)
+        self.assertIs(get_json_decoder(), loads)
+        self.assertEqual(self.get_query().select(), [
+            {'data': {'one': 1, 'two': 'two'}, 'two': 'two'},
+            {'data': [1, 2], 'two': None},
+        ])
+        self.assertEqual(len(calls), 3)
+
+        set_json_decoder()
+        self.assertIs(get_json_decoder(), json.loads)
+
+    def test_native_json_decoding(self):
+        rows = self.get_query().select()
+        Query.native_json_decoding = True
+        with patch('querybuilder.utils.json_decode_column') as json_decode_column:
+            self.assertEqual(self.get_query().select(), rows)
+            self.assertEqual(list(self.get_query().iter_select(chunk_size=1)), rows)
+        self.assertEqual(json_decode_column.call_count, 0)
+
+        # the decoder is only registered on the cursors of the query
+        Query.native_json_decoding = False
+        self.assertEqual(self.get_query().select(), rows)
+
+
+class LazyJsonTest(QuerybuilderTestCase):
+
+    def setUp(self):
+        super(LazyJsonTest, self).setUp()
+        self.record = MetricRecord.objects.create(data={'one': 1, 'two': 'two'})
+
+    def get_query(self):
+        return Query().from_table(MetricRecord, fields=['id', 'data'])
+
+    def test_lazy_json(self):
+        with patch('querybuilder.utils.json_decode_value', wraps=json.loads) as json_decode_value:
+            rows = self.get_query().select(lazy_json=True)
+            self.assertEqual(json_decode_value.call_count, 0)
+            self.assertIsInstance(rows[0], LazyJsonRow)
+            self.assertEqual(rows[0]['id'], self.record.id)
+            self.assertEqual(json_decode_value.call_count, 0)
+
+            self.assertEqual(rows[0]['data'], {'one': 1, 'two': 'two'})
+            self.assertIs(rows[0]['data'], rows[0].get('data'))
+            self.assertEqual(json_decode_value.call_count, 1)
+
+    def test_lazy_json_row(self):
+        row = LazyJsonRow([('id', 1), ('data', '{"a": 1}'), ('other', '[1]')], {'data', 'other'})
+        self.assertEqual(list(row), ['id', 'data', 'other'])
+        self.assertEqual(dict(**row), {'id': 1, 'data': {'a': 1}, 'other': [1]})
+
+        row = LazyJsonRow([('id', 1), ('data', '{"a": 1}')], {'data'})
+        self.assertEqual(row, {'id': 1, 'data': {'a': 1}})
+        self.assertEqual(list(row.values()), [1, {'a': 1}])
+
+        row = LazyJsonRow([('id', 1), ('data', '{"a": 1}')], {'data'})
+        row['data'] = 'not json'
+        self.assertEqual(row['data'], 'not json')
+
+        row = LazyJsonRow([('id', 1), ('data', '{"a": 1}')], {'data'})
+        copied_row = pickle.loads(pickle.dumps(row))
+        self.assertIs(type(copied_row), dict)
+        self.assertEqual(copied_row, {'id': 1, 'data': {'a': 1}})
+        self.assertEqual(json.dumps(row), '{"id": 1, "data": {"a": 1}}')
+
+    def test_lazy_json_formats(self):
+        rows = self.get_query().select(lazy_json=True, nest=True)
+        self.assertEqual(rows, [{'id': self.record.id, 'data': {'one': 1, 'two': 'two'}}])
+        with self.assertRaises(ValueError):
+            self.get_query().select(lazy_json=True, row_format='tuple')
+
+
 @override_settings(DEBUG=True)
 class JsonQuerysetTest(QuerybuilderTestCase):
 
@@ -116,3 +246,35 @@ class JsonQuerysetTest(QuerybuilderTestCase):
         records = list(JsonQueryset(model=MetricRecord).order_by('data->one'))
         self.assertEqual(records[0].data['one'], 1)
         self.assertEqual(records[1].data['one'], 5)
+
+    def test_slice_after(self):
+        records = [MetricRecord.objects.create(data={'one': i}) for i in range(5)]
+        queryset = JsonQueryset(model=MetricRecord).order_by('-id')
+
+        page = queryset[0:2]
+        self.assertEqual([record.id for record in page], [records[4].id, records[3].id])
+
+        page = queryset[queryset.get_after_token(page[-1]):2]
+        self.assertEqual([record.id for record in page], [records[2].id, records[1].id])
+        self.assertEqual(page[0].data, {'one': 2})
+
+    def test_slice_after_json_sorter(self):
+        records = [MetricRecord.objects.create(data={'one': i}) for i in [3, 1, 2]]
+        queryset = JsonQueryset(model=MetricRecord).order_by('data->one').order_by('id')
+
+        page = queryset[0:2]
+        self.assertEqual([record.id for record in page], [records[1].id, records[2].id])
+
+        page = queryset[queryset.get_after_token(page[-1]):2]
+        self.assertEqual([record.id for record in page], [records[0].id])
+
+    def test_after_token_json_errors(self):
+        record = MetricRecord.objects.create(data={'one': 1})
+        query = Query().from_table(MetricRecord).order_by("data->'one'")
+        with self.assertRaises(ValueError):
+            query.get_after_token(record)
+        with self.assertRaises(ValueError):
+            Query().from_table(MetricRecord).order_by("data->>'one'").get_after_token({'id': 1})
+
+        query = Query().from_table(MetricRecord).order_by("data->'a'->>'b'")
+        self.assertEqual(query.get_sort_value({'data': {'a': {'b': [1]}}}, query.sorters[0]), '[1]')
@@ -1,4 +1,11 @@
+import datetime
+
+from django.test.utils import override_settings
+from django_dynamic_fixture import G
+
+from querybuilder.logger import Logger, LogManager
 from querybuilder.query import Query
+from querybuilder.tests.models import Account, Order
 from querybuilder.tests.query_tests import QueryTestCase, get_comparison_str
 
 
@@ -31,3 +38,169 @@ class LimitTest(QueryTestCase):
         query_str = query.get_sql()
         expected_query = 'SELECT test_table.* FROM test_table LIMIT 5 OFFSET 20'
         self.assertEqual(query_str, expected_query, get_comparison_str(query_str, expected_query))
+
+
+class KeysetPaginationTest(QueryTestCase):
+    def test_after_one_field(self):
+        query = Query().from_table(
+            table='test_table'
+        ).order_by('id').after([10])
+        query_str = query.get_sql()
+        expected_query = 'SELECT test_table.* FROM test_table WHERE (id > %(A0)s) ORDER BY id ASC'
+        self.assertEqual(query_str, expected_query, get_comparison_str(query_str, expected_query))
+        self.assertEqual(query.get_args(), {'A0': 10})
+
+    def test_after_row_comparison(self):
+        query = Query().from_table(
+            table='test_table'
+        ).order_by('-time').order_by('-id').after(['2012-10-19', 10])
+        query_str = query.get_sql()
+        expected_query = (
+            'SELECT test_table.* FROM test_table WHERE ((time, id) < (%(A0)s, %(A1)s)) '
+            'ORDER BY time DESC, id DESC'
+        )
+        self.assertEqual(query_str, expected_query, get_comparison_str(query_str, expected_query))
+        self.assertEqual(query.get_args(), {'A0': '2012-10-19', 'A1': 10})
+
+    def test_tuple_value(self):
+        """
+        Verifies a tuple that is not from ``after()`` is still passed as a single arg
+        """
+        query = Query().from_table(
+            table='test_table'
+        ).where(id=(1, 2))
+        query_str = query.get_sql()
+        expected_query = 'SELECT test_table.* FROM test_table WHERE (id = %(A0)s)'
+        self.assertEqual(query_str, expected_query, get_comparison_str(query_str, expected_query))
+        self.assertEqual(query.get_args(), {'A0': (1, 2)})
+
+    def test_after_mixed_directions(self):
+        query = Query().from_table(
+            table='test_table'
+        ).order_by('-time').order_by('id').after(['2012-10-19', 10])
+        query_str = query.get_sql()
+        expected_query = (
+            'SELECT test_table.* FROM test_table WHERE ((time < %(A0)s OR (time = %(A1)s AND id > %(A2)s))) '
+            'ORDER BY time DESC, id ASC'
+        )
+        self.assertEqual(query_str, expected_query, get_comparison_str(query_str, expected_query))
+
+    def test_after_errors(self):
+        with self.assertRaises(ValueError):
+            Query().from_table(Order).after([1])
+        with self.assertRaises(ValueError):
+            Query().from_table(Order).order_by('id').after([1, 2])
+        with self.assertRaises(ValueError):
+            Query().from_table(Order).order_by('id').after('not a token')
+
+    def test_paginate(self):
+        query = Query().from_table(Order, fields=['id', 'margin']).order_by('-margin').order_by('id')
+        expected_ids = [order.id for order in Order.objects.order_by('-margin', 'id')]
+
+        ids = []
+        rows, token = query.paginate(3)
+        ids.extend(row['id'] for row in rows)
+        self.assertIsNotNone(token)
+        rows, token = query.paginate(3, after=token)
+        ids.extend(row['id'] for row in rows)
+        self.assertIsNone(token)
+
+        self.assertEqual(ids, expected_ids)
+        self.assertEqual(len(query._where.wheres), 0)
+
+    def test_paginate_models(self):
+        query = Query().from_table(Order).order_by('time').order_by('id')
+        expected_ids = [order.id for order in Order.objects.order_by('time', 'id')]
+        rows, token = query.paginate(2, return_models=True)
+        rows2, token = query.paginate(2, after=token, return_models=True)
+        self.assertEqual([row.id for row in rows + rows2], expected_ids)
+
+
+class SafeLimitTest(QueryTestCase):
+    def setUp(self):
+        super(SafeLimitTest, self).setUp()
+        Query.enable_safe_limit = True
+        Query.safe_limit = 2
+
+    def tearDown(self):
+        Query.enable_safe_limit = False
+        Query.safe_limit = 1000
+        Query.safe_limit_callback = None
+        LogManager.loggers = {}
+        super(SafeLimitTest, self).tearDown()
+
+    @override_settings(DEBUG=True)
+    def test_safe_limit(self):
+        truncated_queries = []
+        Query.safe_limit_callback = truncated_queries.append
+        query = Query().from_table(Order, fields=['id']).order_by('id')
+
+        logger = Logger()
+        logger.start_logging()
+        rows = query.select()
+        logger.stop_logging()
+
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(query.safe_limit_truncated)
+        self.assertEqual(truncated_queries, [query])
+        self.assertEqual(logger.count(), 1)
+        self.assertTrue(logger.get_log()[0]['sql'].endswith('LIMIT 3'))
+
+        # the query itself is not limited
+        self.assertEqual(
+            query.get_sql(),
+            'SELECT querybuilder_tests_order.id FROM querybuilder_tests_order ORDER BY id ASC'
+        )
+        self.assertEqual(len(query.select(bypass_safe_limit=True)), 4)
+        self.assertFalse(query.safe_limit_truncated)
+
+    def test_safe_limit_not_truncated(self):
+        query = Query().from_table(Order, fields=['id']).where(margin=100)
+        self.assertEqual(len(query.select()), 2)
+        self.assertFalse(query.safe_limit_truncated)
+
+        query = Query().from_table(Order, fields=['id']).limit(1, 1)
+        self.assertEqual(len(query.select()), 1)
+        self.assertFalse(query.safe_limit_truncated)
+
+        query = Query().from_table(Order, fields=['id']).limit(10, 1)
+        self.assertEqual(len(query.select()), 2)
+        self.assertTrue(query.safe_limit_truncated)
+
+    def test_safe_limit_columns(self):
+        query = Query().from_table(Order, fields=['id', 'margin'])
+        rows = query.select(row_format='columns')
+        self.assertEqual(len(rows['id']), 2)
+        self.assertEqual(len(rows['margin']), 2)
+        self.assertTrue(query.safe_limit_truncated)
+
+    def test_paginate_microseconds(self):
+        """
+        Verifies pages advance when the sort values only differ by microseconds
+        """
+        Order.objects.all().delete()
+        account = Account.objects.get(id=1)
+        time = datetime.datetime(2012, 10, 19, 1, 2, 3, 100)
+        for microseconds in range(4):
+            G(
+                Order,
+                account=account,
+                margin=1,
+                margin_percent=1,
+                time=time + datetime.timedelta(microseconds=microseconds)
+            )
+        expected_ids = [order.id for order in Order.objects.order_by('time')]
+
+        for query in [
+            Query().from_table(Order, fields=['id', 'time']).order_by('time'),
+            Query().from_table(Order, fields=['id', 'time']).order_by('-time').order_by('id'),
+        ]:
+            ids = []
+            token = None
+            for _ in expected_ids:
+                rows, token = query.paginate(1, after=token)
+                ids.extend(row['id'] for row in rows)
+            self.assertIsNone(token)
+            if query.sorters[0].desc:
+                ids.reverse()
+            self.assertEqual(ids, expected_ids)
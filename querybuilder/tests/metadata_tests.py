@@ -0,0 +1,79 @@
+from unittest.mock import patch
+
+from django.db import connection, models
+from django.test.utils import isolate_apps
+
+from querybuilder.metadata import get_model_metadata, model_metadata_cache
+from querybuilder.query import Query
+from querybuilder.tests.base import QuerybuilderTestCase
+from querybuilder.tests.models import Account, Order, User, Uniques
+
+
+class ModelMetadataTest(QuerybuilderTestCase):
+    """
+    Tests the cached model meta data
+    """
+
+    def test_metadata(self):
+        metadata = get_model_metadata(Account)
+        self.assertEqual(metadata.db_table, 'querybuilder_tests_account')
+        self.assertEqual(metadata.column_names, ['id', 'user_id', 'first_name', 'last_name'])
+        self.assertEqual(metadata.pk_name, 'id')
+        self.assertEqual(metadata.foreign_keys[User].name, 'user')
+        self.assertEqual(metadata.related_objects[Order].get_accessor_name(), 'order_set')
+        self.assertNotIn(User, metadata.related_objects)
+        self.assertIs(metadata.get_field('user_id'), Account._meta.get_field('user'))
+
+    def test_cached(self):
+        self.assertIs(get_model_metadata(Account), get_model_metadata(Account))
+
+    def test_db_type(self):
+        metadata = get_model_metadata(Uniques)
+        self.assertEqual(metadata.get_db_type('field1', connection), 'varchar(16)')
+        with patch.object(models.CharField, 'db_type') as db_type:
+            self.assertEqual(metadata.get_db_type('field1', connection), 'varchar(16)')
+        self.assertEqual(db_type.call_count, 0)
+
+    @isolate_apps('querybuilder.tests')
+    def test_clear_on_new_model(self):
+        """
+        Verifies the cache is cleared when a model is created, since it can add reverse relations
+        """
+        get_model_metadata(User)
+        self.assertIn(User, model_metadata_cache)
+
+        class Profile(models.Model):
+            user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+            class Meta:
+                app_label = 'querybuilder_tests'
+
+        self.assertNotIn(User, model_metadata_cache)
+
+    def test_join_uses_metadata(self):
+        """
+        Verifies joins are built from the cached meta data without reading the model's fields
+        """
+        get_model_metadata(Account)
+        get_model_metadata(Order)
+        with patch.object(type(Order._meta), 'get_fields') as get_fields:
+            query = Query().from_table(Account).join(Order, fields=['*'])
+            self.assertEqual(
+                query.get_sql(),
+                'SELECT querybuilder_tests_account.*, '
+                'querybuilder_tests_order.id, '
+                'querybuilder_tests_order.account_id, '
+                'querybuilder_tests_order.revenue, '
+                'querybuilder_tests_order.margin, '
+                'querybuilder_tests_order.margin_percent, '
+                'querybuilder_tests_order.time '
+                'FROM querybuilder_tests_account '
+                'JOIN querybuilder_tests_order ON querybuilder_tests_order.account_id = querybuilder_tests_account.id'
+            )
+        self.assertEqual(get_fields.call_count, 0)
+        self.assertEqual(query.joins[0].right_table.field_prefix, 'order')
+
+        with patch.object(type(Order._meta), 'get_fields') as get_fields:
+            related_objects = query.joins[0].get_all_related_objects(query.tables[0])
+        self.assertEqual(get_fields.call_count, 0)
+        self.assertEqual([field.get_accessor_name() for field in related_objects], ['order_set'])
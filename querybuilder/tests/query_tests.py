@@ -1,10 +1,13 @@
+import copy
 import datetime
+from unittest.mock import patch
 
 from django.db import connections
+from django.db.models import Q
 from django_dynamic_fixture import G
 
-from querybuilder.fields import CountField
-from querybuilder.query import Query
+from querybuilder.fields import CountField, RankField, SimpleField, SumField
+from querybuilder.query import Group, Query, QueryWindow, Sorter
 from querybuilder.tests.base import QuerybuilderTestCase
 from querybuilder.tests.models import User, Account, Order
 
@@ -167,6 +170,149 @@ class QueryTest(QueryTestCase):
         self.assertTrue(len(rows) > 0, 'Explain did not return anything')
 
 
+class QueryCacheTest(QuerybuilderTestCase):
+
+    def test_get_sql_uses_cache(self):
+        """
+        Verifies the sql is only built once when the query does not change
+        """
+        query = Query().from_table(Account).where(id=1)
+        with patch.object(Query, 'build_select_fields', autospec=True, side_effect=Query.build_select_fields) as mock:
+            sql = query.get_sql()
+            self.assertEqual(query.get_sql(), sql)
+            self.assertEqual(query.get_args(), {'A0': 1})
+            self.assertEqual(mock.call_count, 1)
+
+            query.get_sql(use_cache=False)
+            self.assertEqual(mock.call_count, 2)
+
+    def test_mutators_mark_dirty(self):
+        """
+        Verifies each method that changes the query invalidates the cached sql
+        """
+        query = Query().from_table(Account, fields=['id'])
+        self.assertEqual(query.get_sql(), 'SELECT querybuilder_tests_account.id FROM querybuilder_tests_account')
+
+        query.tables[0].add_field('first_name')
+        self.assertEqual(
+            query.get_sql(),
+            (
+                'SELECT querybuilder_tests_account.id, querybuilder_tests_account.first_name '
+                'FROM querybuilder_tests_account'
+            )
+        )
+
+        query.where(id__gt=1)
+        self.assertEqual(query.get_args(), {'A0': 1})
+        query.group_by('id').order_by('-id').limit(5).distinct()
+        self.assertEqual(
+            query.get_sql(),
+            (
+                'SELECT DISTINCT querybuilder_tests_account.id, querybuilder_tests_account.first_name '
+                'FROM querybuilder_tests_account WHERE (id > %(A0)s) GROUP BY id ORDER BY id DESC LIMIT 5'
+            )
+        )
+
+        query.join(
+            User,
+            condition='querybuilder_tests_user.id = querybuilder_tests_account.user_id',
+            fields=['email']
+        )
+        self.assertIn('JOIN querybuilder_tests_user', query.get_sql())
+
+    def test_inner_query_change_marks_outer_dirty(self):
+        """
+        Verifies changing an inner query invalidates the cached sql and args of the outer query
+        """
+        inner_query = Query().from_table(Account).where(id=1)
+        query = Query().from_table(inner_query)
+        self.assertEqual(query.get_args(), {'T0A0': 1})
+
+        inner_query.where(first_name='Wes')
+        self.assertEqual(
+            query.get_sql(),
+            (
+                'WITH T0 AS (SELECT querybuilder_tests_account.* FROM querybuilder_tests_account '
+                'WHERE (id = %(T0A0)s AND first_name = %(T0A1)s)) SELECT T0.* FROM T0'
+            )
+        )
+        self.assertEqual(query.get_args(), {'T0A0': 1, 'T0A1': 'Wes'})
+
+    def test_window_change_marks_outer_dirty(self):
+        """
+        Verifies changing the window of a field invalidates the cached sql of the query
+        """
+        window = QueryWindow().partition_by('id')
+        query = Query().from_table(Account, fields=['id', RankField(over=window)])
+        self.assertIn('RANK() OVER (PARTITION BY id)', query.get_sql())
+
+        window.order_by('id')
+        self.assertIn('RANK() OVER (PARTITION BY id ORDER BY id ASC)', query.get_sql())
+
+    def test_joined_query_change_marks_outer_dirty(self):
+        """
+        Verifies changing a joined inner query invalidates the cached sql of the outer query
+        """
+        inner_query = Query().from_table(Order, fields=['account_id'])
+        query = Query().from_table(Account, fields=['id']).join(
+            {'T1': inner_query},
+            condition='T1.account_id = querybuilder_tests_account.id',
+            fields=['account_id']
+        )
+        query.get_sql()
+        self.assertFalse(query.is_dirty())
+
+        inner_query.where(margin=1)
+        self.assertTrue(query.is_dirty())
+        query.get_sql()
+        self.assertFalse(query.is_dirty())
+
+    def test_direct_changes_mark_dirty(self):
+        """
+        Verifies direct changes to the lists, table aliases, and limit of the query invalidate the cached sql
+        """
+        query = Query().from_table(Account, fields=['id']).limit(5)
+        query.get_sql()
+
+        query.sorters.append(Sorter('id'))
+        self.assertIn('ORDER BY id ASC', query.get_sql())
+        query.sorters[0].desc = True
+        self.assertIn('ORDER BY id DESC', query.get_sql())
+        query.sorters.clear()
+        query.sorters.append(Sorter('first_name'))
+        self.assertIn('ORDER BY first_name ASC', query.get_sql())
+        query.sorters.clear()
+        self.assertNotIn('ORDER BY', query.get_sql())
+
+        query.groups.append(Group('id'))
+        self.assertIn('GROUP BY id', query.get_sql())
+
+        query.tables[0].fields.append(SimpleField('first_name', table=query.tables[0]))
+        self.assertIn('querybuilder_tests_account.first_name', query.get_sql())
+
+        query.tables[0].alias = 'account'
+        self.assertIn('FROM querybuilder_tests_account AS account', query.get_sql())
+
+        query._limit.limit = 10
+        self.assertIn('LIMIT 10', query.get_sql())
+        self.assertFalse(query.is_dirty())
+
+    def test_copy_does_not_share_cache(self):
+        """
+        Verifies a count query built from a cached query generates its own sql
+        """
+        query = Query().from_table(Account).order_by('id')
+        query.get_sql()
+        self.assertEqual(
+            query.get_count_query().get_sql(),
+            'SELECT COUNT(querybuilder_tests_account.*) AS "all_count" FROM querybuilder_tests_account'
+        )
+        self.assertEqual(
+            query.get_sql(),
+            'SELECT querybuilder_tests_account.* FROM querybuilder_tests_account ORDER BY id ASC'
+        )
+
+
 class TableTest(QueryTestCase):
     def test_find_field(self):
         query = Query().from_table(
@@ -244,3 +390,89 @@ class FieldTest(QueryTestCase):
                 received
             )
         )
+
+
+class QueryCloneTest(QuerybuilderTestCase):
+
+    def get_query(self):
+        inner_query = Query().from_table(Order, fields=['id', 'account_id', 'margin']).where(margin__gt=10)
+        return Query().from_table(
+            inner_query,
+            fields=['account_id', {'margin_total': SumField('margin')}]
+        ).join(
+            Account,
+            fields=['first_name'],
+            condition='T0.account_id = querybuilder_tests_account.id',
+        ).where(
+            Q(margin__lt=1000) | Q(margin__isnull=False)
+        ).group_by(
+            'account_id'
+        ).group_by(
+            'querybuilder_tests_account.first_name'
+        ).order_by(
+            '-margin_total'
+        ).limit(10, 5)
+
+    def test_clone_sql(self):
+        """
+        Verifies a cloned query builds the same sql and args as the original
+        """
+        query = self.get_query()
+        sql = query.get_sql()
+        copied_query = query.copy()
+        self.assertEqual(copied_query.get_sql(), sql)
+        self.assertEqual(copied_query.get_sql(use_cache=False), sql)
+        self.assertEqual(copied_query.get_args(), query.get_args())
+
+    def test_clone_references(self):
+        """
+        Verifies the references between the copied objects point to the other copies
+        """
+        query = self.get_query()
+        copied_query = query.clone()
+        table = copied_query.tables[0]
+        self.assertIsNot(table, query.tables[0])
+        self.assertIs(table.owner, copied_query)
+        self.assertIs(table.fields[0].table, table)
+        self.assertIs(table.fields[1].field.table, table)
+        self.assertIsNot(table.query, query.tables[0].query)
+        self.assertIs(table.query.tables[0].owner, table.query)
+        self.assertIs(copied_query.joins[0].owner, copied_query)
+        self.assertIs(copied_query.joins[0].left_table, table)
+        self.assertIs(copied_query.joins[0].right_table.owner, copied_query)
+        self.assertIsNot(copied_query._where.wheres, query._where.wheres)
+        self.assertIs(copied_query.connection, query.connection)
+
+        # copying a field also copies its table, which contains the copied field
+        field = copy.copy(query.tables[0].fields[0])
+        self.assertIs(field.table.fields[0], field)
+
+    def test_clone_independent(self):
+        """
+        Verifies changing a cloned query does not change the original
+        """
+        query = self.get_query()
+        sql = query.get_sql()
+        copied_query = query.copy()
+        copied_query.tables[0].add_field('margin')
+        copied_query.tables[0].query.where(id=1)
+        copied_query.joins[0].right_table.add_field('last_name')
+        copied_query.where(account_id=1).order_by('account_id').limit(1)
+        copied_query.get_sql()
+
+        self.assertEqual(query.get_sql(), sql)
+        self.assertEqual(query.get_sql(use_cache=False), sql)
+        self.assertNotEqual(copied_query.get_sql(), sql)
+
+    def test_clone_window(self):
+        """
+        Verifies the window of a window function is copied
+        """
+        query = Query().from_table(Order, fields=[
+            'id',
+            RankField(over=QueryWindow().partition_by('account_id').order_by('margin')),
+        ])
+        sql = query.get_sql()
+        copied_query = query.copy()
+        self.assertEqual(copied_query.get_sql(), sql)
+        self.assertIsNot(copied_query.tables[0].fields[1].over, query.tables[0].fields[1].over)
@@ -0,0 +1,209 @@
+from django.db import connections
+from django.db.models import Q
+from django.test import TransactionTestCase
+from django_dynamic_fixture import G
+
+from querybuilder.fields import AvgField, CountField, MaxField, MinField, SumField
+from querybuilder.query import Query
+from querybuilder.router import ShardRouter, compare_values, freeze_value
+from querybuilder.tests.base import QuerybuilderTestCase
+from querybuilder.tests.models import MetricRecord
+
+
+class ShardRouterTest(QuerybuilderTestCase):
+    def setUp(self):
+        super(ShardRouterTest, self).setUp()
+        self.router = ShardRouter('tenant_id', ['shard0', 'shard1', 'shard2'])
+
+    def get_query(self, *args, **kwargs):
+        return Query().from_table('orders').where(*args, **kwargs)
+
+    def test_get_shard(self):
+        self.assertEqual(self.router.get_shard(4), 'shard1')
+        self.assertEqual(self.router.get_shard('abc'), self.router.get_shard('abc'))
+        router = ShardRouter('tenant_id', ['a', 'b'], shard_function=lambda value, shards: shards[-1])
+        self.assertEqual(router.get_shard(4), 'b')
+        with self.assertRaises(ValueError):
+            ShardRouter('tenant_id', [])
+
+    def test_get_shard_values(self):
+        get_values = self.router.get_shard_values
+        self.assertIsNone(get_values(Query().from_table('orders')))
+        self.assertIsNone(get_values(self.get_query(id=1)))
+        self.assertEqual(get_values(self.get_query(tenant_id=1, id=2)), {1})
+        self.assertEqual(get_values(self.get_query(**{'orders.tenant_id': 1})), {1})
+        self.assertEqual(get_values(self.get_query(tenant_id__eq=1)), {1})
+        self.assertEqual(get_values(self.get_query(tenant_id__in=[1, 2])), {1, 2})
+        self.assertEqual(get_values(self.get_query(tenant_id__in=[1, 2]).where(tenant_id=2)), {2})
+        self.assertEqual(get_values(self.get_query(Q(tenant_id=1) | Q(tenant_id=3))), {1, 3})
+        self.assertIsNone(get_values(self.get_query(tenant_id__gt=1)))
+        self.assertIsNone(get_values(self.get_query(tenant_id=None)))
+        self.assertIsNone(get_values(self.get_query(tenant_id__in='1,2')))
+        self.assertIsNone(get_values(self.get_query(Q(tenant_id=1) | Q(id=3))))
+        self.assertIsNone(get_values(self.get_query(~Q(tenant_id=1))))
+        self.assertIsNone(get_values(self.get_query(other__tenant_id=1)))
+
+    def test_get_shards(self):
+        self.assertEqual(self.router.get_shards(self.get_query(tenant_id__in=[1, 4])), ['shard1'])
+        self.assertEqual(self.router.get_shards(self.get_query(tenant_id__in=[2, 1])), ['shard1', 'shard2'])
+        self.assertEqual(self.router.get_shards(self.get_query(id=1)), ['shard0', 'shard1', 'shard2'])
+        self.assertEqual(self.router.get_shards(self.get_query(tenant_id=1).where(tenant_id=2)), [])
+
+    def test_route(self):
+        router = ShardRouter('tenant_id', ['default', 'mock-second-database'])
+        query = self.get_query(tenant_id__in=[1, 3])
+        routed_query = router.route(query)
+        self.assertIsNot(routed_query, query)
+        self.assertIs(routed_query.connection, connections['mock-second-database'])
+        self.assertEqual(routed_query.get_sql(), query.get_sql())
+
+        with self.assertRaises(ValueError):
+            router.route(self.get_query(tenant_id__in=[1, 2]))
+        with self.assertRaises(ValueError):
+            router.route(self.get_query(id=1))
+
+    def test_compare_values(self):
+        self.assertEqual(compare_values(1, 1), 0)
+        self.assertEqual(compare_values(1, 2), -1)
+        self.assertEqual(compare_values(None, 2), 1)
+        self.assertEqual(compare_values(2, None), -1)
+
+        rows = [{'a': 1, 'b': 2}, {'a': None, 'b': 1}, {'a': 1, 'b': 3}, {'a': 2, 'b': 1}]
+        sort_key = self.router.get_sort_key([('a', True), ('b', False)])
+        self.assertEqual(sorted(rows, key=sort_key), [
+            {'a': None, 'b': 1}, {'a': 2, 'b': 1}, {'a': 1, 'b': 2}, {'a': 1, 'b': 3},
+        ])
+
+    def test_reaggregate_unhashable(self):
+        rows = [
+            {'data': {'a': 1, 'b': [1]}, 'id_count': 1},
+            {'data': [1, 2], 'id_count': 2},
+            {'data': {'b': [1], 'a': 1}, 'id_count': 3},
+            {'data': '[1, 2]', 'id_count': 4},
+        ]
+        self.assertEqual(self.router.reaggregate(rows, {'id_count': sum}), [
+            {'data': {'a': 1, 'b': [1]}, 'id_count': 4},
+            {'data': [1, 2], 'id_count': 2},
+            {'data': '[1, 2]', 'id_count': 4},
+        ])
+        self.assertEqual(freeze_value({'b': 1, 'a': 2}), freeze_value({'a': 2, 'b': 1}))
+        self.assertNotEqual(freeze_value([1, 2]), freeze_value('[1, 2]'))
+
+    def test_reaggregate_functions(self):
+        query = Query().from_table(MetricRecord, fields=[
+            'data', CountField('id'), SumField('other_value'), MinField('id'), MaxField('id'),
+        ]).group_by('data')
+        self.assertEqual(sorted(self.router.get_reaggregate_functions(query)), [
+            'id_count', 'id_max', 'id_min', 'other_value_sum'
+        ])
+        with self.assertRaises(ValueError):
+            self.router.get_reaggregate_functions(Query().from_table(MetricRecord, fields=[AvgField('id')]))
+        with self.assertRaises(ValueError):
+            self.router.get_reaggregate_functions(
+                Query().from_table(MetricRecord, fields=[CountField('id', distinct=True)])
+            )
+
+
+class TestShardRouter(ShardRouter):
+    """
+    Both test databases are the same database, so each shard only selects the rows of its shard key values
+    """
+
+    def get_shard_query(self, query, alias):
+        shard_query = super(TestShardRouter, self).get_shard_query(query, alias)
+        ids = MetricRecord.objects.values_list('id', flat=True)
+        return shard_query.where(**{
+            'querybuilder_tests_metricrecord.id__in': [id for id in ids if self.get_shard(id) == alias]
+        })
+
+
+class ShardRouterGatherTest(TransactionTestCase):
+    """
+    The shards are queried on the connections of worker threads, so the rows have to be committed
+    """
+    databases = ['default', 'mock-second-database']
+
+    def setUp(self):
+        super(ShardRouterGatherTest, self).setUp()
+        self.router = TestShardRouter('id', ['default', 'mock-second-database'])
+        self.records = [
+            G(MetricRecord, other_value=value, data={'parity': value % 2})
+            for value in [5, 1, 4, 2, 3, 6]
+        ]
+
+    def get_query(self, *args, **kwargs):
+        return Query().from_table(MetricRecord, fields=['id', 'other_value']).where(*args, **kwargs)
+
+    def test_concatenate(self):
+        rows = self.router.select(self.get_query())
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(record.id for record in self.records))
+        self.assertEqual({self.router.get_shard(row['id']) for row in rows[:3]}, {'default'})
+
+        rows = self.router.select(self.get_query().limit(2, 3))
+        self.assertEqual(len(rows), 2)
+
+    def test_merge(self):
+        rows = self.router.select(self.get_query().order_by('-other_value'))
+        self.assertEqual([row['other_value'] for row in rows], [6, 5, 4, 3, 2, 1])
+
+        rows = self.router.select(self.get_query().order_by('other_value').limit(3, 2))
+        self.assertEqual([row['other_value'] for row in rows], [3, 4, 5])
+
+        rows = self.router.select(self.get_query().order_by('other_value').limit(2))
+        self.assertEqual([row['other_value'] for row in rows], [1, 2])
+
+        with self.assertRaises(ValueError):
+            self.router.select(Query().from_table(MetricRecord, fields=['id']).order_by('other_value'))
+
+    def test_models(self):
+        models = self.router.select(self.get_query().order_by('other_value'), return_models=True)
+        self.assertEqual([model.other_value for model in models], [1, 2, 3, 4, 5, 6])
+        for model in models:
+            self.assertEqual(model._state.db, self.router.get_shard(model.id))
+
+        rows = self.router.select(Query().from_table(
+            MetricRecord, fields=['id', {'value__amount': 'other_value'}]
+        ).order_by('id'), nest=True)
+        self.assertEqual(rows[0], {'id': self.records[0].id, 'value': {'amount': 5}})
+
+    def test_route(self):
+        record = self.records[1]
+        query = self.router.route(self.get_query(id=record.id))
+        self.assertEqual(query.connection.alias, self.router.get_shard(record.id))
+        self.assertEqual(query.select(), [{'id': record.id, 'other_value': 1}])
+
+    def test_reaggregate(self):
+        query = Query().from_table(MetricRecord, fields=[
+            {'parity': "data->>'parity'"},
+            CountField('id'),
+            SumField('other_value'),
+            MinField('other_value'),
+            MaxField('other_value'),
+        ]).group_by("data->>'parity'").order_by('parity')
+        self.assertEqual(self.router.select(query), [
+            {'parity': '0', 'id_count': 3, 'other_value_sum': 12, 'other_value_min': 2, 'other_value_max': 6},
+            {'parity': '1', 'id_count': 3, 'other_value_sum': 9, 'other_value_min': 1, 'other_value_max': 5},
+        ])
+        self.assertEqual(len(self.router.select(query.limit(1))), 1)
+
+        query = Query().from_table(MetricRecord, fields=[CountField('id'), MaxField('other_value')])
+        self.assertEqual(self.router.select(query), [{'id_count': 6, 'other_value_max': 6}])
+
+        query = Query().from_table(MetricRecord, fields=['data', CountField('id')]).group_by('data')
+        rows = sorted(self.router.select(query), key=lambda row: row['data']['parity'])
+        self.assertEqual(rows, [{'data': {'parity': 0}, 'id_count': 3}, {'data': {'parity': 1}, 'id_count': 3}])
+
+    def test_aggregates(self):
+        query = self.get_query()
+        self.assertEqual(self.router.count(query), 6)
+        self.assertEqual(self.router.sum(query, 'other_value'), 21)
+        self.assertEqual(self.router.min(query, 'other_value'), 1)
+        self.assertEqual(self.router.max(query, 'other_value'), 6)
+        self.assertEqual(self.router.aggregate(query, count='*', total=SumField('other_value')), {
+            'count': 6,
+            'total': 21,
+        })
+        with self.assertRaises(ValueError):
+            self.router.aggregate(query, mean=AvgField('other_value'))
+
+        self.assertEqual(self.router.count(self.get_query(id=self.records[0].id)), 1)
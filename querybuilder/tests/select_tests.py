@@ -1,7 +1,14 @@
+from unittest.mock import patch
+
+from django.db import connection, transaction
 from django.db.models import Q
+from django.test.utils import override_settings
+from django_dynamic_fixture import G
+from querybuilder.cursor import PreparedStatementCache
+from querybuilder.fields import CountField
 from querybuilder.logger import Logger
 from querybuilder.query import Query
-from querybuilder.tests.models import Account, Order, User
+from querybuilder.tests.models import Account, Order, User, Uniques
 from querybuilder.tests.query_tests import QueryTestCase, get_comparison_str
 
 
@@ -520,6 +527,62 @@ class ModelTest(QueryTestCase):
             self.assertIsInstance(row.account, Account, 'Nested record is not model instance')
         self.assertEqual(logger.count(), 0, 'Queries were executed when none should')
 
+    def test_model_state(self):
+        # the rows are marked with the alias of the query's connection
+        with patch.object(connection, 'alias', 'other'):
+            rows = Query().from_table(Account).select(True)
+        self.assertEqual(rows[0]._state.db, 'other')
+        self.assertFalse(rows[0]._state.adding)
+
+        rows = Query().from_table(Order).join(Account, fields=['*'], prefix_fields=True).select(True)
+        self.assertEqual(rows[0]._state.db, 'default')
+        self.assertFalse(rows[0].account._state.adding)
+
+    def test_model_fields(self):
+        """
+        Verifies columns are set on their fields, unselected fields have their defaults, and other
+        values are set as attributes
+        """
+        G(Uniques, field1='a', field2='b', custom_field_name='custom')
+        rows = Query().from_table(
+            Uniques,
+            fields=['id', 'field1', 'actual_db_column_name', {'num': CountField('id')}]
+        ).group_by('id').select(True)
+        self.assertEqual(rows[0].field1, 'a')
+        self.assertEqual(rows[0].custom_field_name, 'custom')
+        self.assertEqual(rows[0].field4, 'default_value')
+        self.assertEqual(rows[0].num, 1)
+
+    def test_joined_model_cache(self):
+        """
+        Verifies joined models are stored in the related object cache of both models
+        """
+        rows = Query().from_table(Order).join(Account, fields=['*'], prefix_fields=True).select(True)
+        self.assertTrue(Order.account.is_cached(rows[0]))
+        self.assertEqual(rows[0].account_id, rows[0].account.id)
+
+        rows = Query().from_table(User).join(Account, fields=['*'], prefix_fields=True).select(True)
+        logger = Logger()
+        logger.start_logging()
+        self.assertIs(rows[0].account.user, rows[0])
+        self.assertEqual(logger.count(), 0)
+
+    def test_joined_model_foreign_key(self):
+        """
+        Verifies the foreign key of a joined relation is set when its column is not selected
+        """
+        rows = Query().from_table(Order, fields=['id']).join(
+            Account, fields=['id', 'first_name'], prefix_fields=True
+        ).select(True)
+        self.assertEqual(rows[0].account_id, rows[0].account.id)
+        self.assertIsNotNone(rows[0].account_id)
+
+        rows = Query().from_table(User, fields=['id']).join(
+            Account, fields=['id', 'first_name'], prefix_fields=True
+        ).select(True)
+        self.assertEqual(rows[0].account.user_id, rows[0].id)
+        self.assertIs(rows[0].account.user, rows[0])
+
 
 class DistinctTest(QueryTestCase):
     def test_distinct(self):
@@ -564,3 +627,161 @@ class DistinctTest(QueryTestCase):
 
         with self.assertRaises(ValueError):
             query.get_sql()
+
+
+class IterSelectTest(QueryTestCase):
+    def test_iter_select(self):
+        query = Query().from_table(Order).order_by('id')
+        rows = query.iter_select(chunk_size=3)
+
+        self.assertFalse(isinstance(rows, list))
+        self.assertEqual(list(rows), query.select())
+
+    def test_iter_select_nest(self):
+        query = Query().from_table(
+            Account
+        ).join(
+            right_table=User,
+            fields=[
+                '*'
+            ],
+            prefix_fields=True
+        ).order_by('id')
+
+        rows = list(query.iter_select(nest=True, chunk_size=1))
+        self.assertEqual(rows, query.select(nest=True))
+        self.assertEqual(rows[0]['user']['email'], 'wes.okes@gmail.com')
+
+    def test_iter_select_models(self):
+        query = Query().from_table(
+            Order
+        ).join(
+            right_table=Account,
+            fields=[
+                '*'
+            ],
+            prefix_fields=True
+        )
+
+        rows = list(query.iter_select(return_models=True, chunk_size=2))
+        self.assertEqual(len(rows), 4)
+        for row in rows:
+            self.assertIsInstance(row, Order, 'Record is not model instance')
+            self.assertIsInstance(row.account, Account, 'Nested record is not model instance')
+
+
+class RowFormatTest(QueryTestCase):
+    def setUp(self):
+        super(RowFormatTest, self).setUp()
+        self.query = Query().from_table(User, fields=['id', 'email']).order_by('id')
+
+    def test_tuple(self):
+        rows = self.query.select(row_format='tuple')
+        self.assertEqual([tuple(row) for row in rows], [(1, 'wes.okes@gmail.com'), (2, 'two+wes.okes@gmail.com')])
+
+    def test_namedtuple(self):
+        rows = self.query.select(row_format='namedtuple')
+        self.assertEqual(rows[0].id, 1)
+        self.assertEqual(rows[1].email, 'two+wes.okes@gmail.com')
+        self.assertIs(type(rows[0]), type(rows[1]))
+
+    def test_columns(self):
+        rows = self.query.select(row_format='columns')
+        self.assertEqual(rows, {'id': [1, 2], 'email': ['wes.okes@gmail.com', 'two+wes.okes@gmail.com']})
+
+    def test_columns_no_rows(self):
+        rows = self.query.where(id=0).select(row_format='columns')
+        self.assertEqual(rows, {'id': [], 'email': []})
+
+    def test_invalid_row_format(self):
+        with self.assertRaises(ValueError):
+            self.query.select(row_format='fake')
+
+    def test_nest_requires_dict(self):
+        with self.assertRaises(ValueError):
+            self.query.select(nest=True, row_format='tuple')
+
+    def test_explain(self):
+        rows = self.query.explain(row_format='tuple')
+        self.assertTrue(len(rows) > 0, 'Explain did not return anything')
+        self.assertIsInstance(rows[0][0], str)
+
+
+class PreparedStatementTest(QueryTestCase):
+    def setUp(self):
+        super(PreparedStatementTest, self).setUp()
+        connection.querybuilder_prepared_statements = None
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DEALLOCATE ALL')
+        connection.querybuilder_prepared_statements = None
+        super(PreparedStatementTest, self).tearDown()
+
+    def get_query(self, user_id):
+        return Query().from_table(User, fields=['id', 'email']).where(id__in=[user_id, 0], email__contains='wes')
+
+    @override_settings(DEBUG=True)
+    def test_prepare_repeated_shape(self):
+        logger = Logger()
+        logger.start_logging()
+        rows = [self.get_query(user_id).select(prepare=True) for user_id in [1, 2, 1]]
+        logger.stop_logging()
+
+        self.assertEqual(rows[0], [{'id': 1, 'email': 'wes.okes@gmail.com'}])
+        self.assertEqual(rows[1], [{'id': 2, 'email': 'two+wes.okes@gmail.com'}])
+        self.assertEqual(rows[2], rows[0])
+
+        sqls = [log['sql'] for log in logger.get_log()]
+        prepare_sqls = [sql for sql in sqls if sql.startswith('PREPARE')]
+        self.assertEqual(len(prepare_sqls), 1)
+        self.assertEqual(len([sql for sql in sqls if sql.startswith('EXECUTE')]), 2)
+        self.assertIn('IN ($1,$2)', prepare_sqls[0])
+        self.assertIn('LIKE $3', prepare_sqls[0])
+        # the test transaction is open, so the PREPARE is run in a savepoint
+        self.assertTrue(sqls[sqls.index(prepare_sqls[0]) - 1].startswith('SAVEPOINT'))
+
+    def test_prepare_disabled(self):
+        for user_id in [1, 2, 1]:
+            self.get_query(user_id).select()
+        self.assertIsNone(connection.querybuilder_prepared_statements)
+
+    def test_prepare_lru(self):
+        Query.max_prepared_statements = 1
+        try:
+            for i in range(2):
+                Query().from_table(User).where(id=1).select(prepare=True)
+            for i in range(2):
+                Query().from_table(Account).where(id=1).select(prepare=True)
+            rows = Query().from_table(User).where(id=1).select(prepare=True)
+        finally:
+            Query.max_prepared_statements = 100
+
+        self.assertEqual(rows[0]['id'], 1)
+        self.assertEqual(len(connection.querybuilder_prepared_statements.statements), 1)
+
+    def test_prepare_null(self):
+        G(Uniques, field1='a', field2='a', field5=None)
+        G(Uniques, field1='b', field2='b', field5='b')
+        query = Query().from_table(Uniques, fields=['field1']).where(field5=None)
+        self.assertIn('field5 IS NULL', query.get_sql())
+        self.assertNotIn('A0', query.get_sql())
+        for i in range(3):
+            self.assertEqual(query.select(prepare=True), [{'field1': 'a'}])
+        self.assertEqual(
+            Query().from_table(Uniques, fields=['field1']).where(~Q(field5=None)).select(prepare=True),
+            [{'field1': 'b'}]
+        )
+        self.assertIn('qb_', list(connection.querybuilder_prepared_statements.statements.values())[0][0])
+
+    def test_prepare_error(self):
+        cache = PreparedStatementCache(connection.connection, threshold=1)
+        sql = 'SELECT 1 WHERE NULL IS $1'
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                self.assertIsNone(cache.get_statement_name(cursor, sql, connection))
+                self.assertIsNone(cache.get_statement_name(cursor, sql, connection))
+                # the failed PREPARE did not abort the transaction
+                cursor.execute('SELECT 1')
+                self.assertEqual(cursor.fetchone(), (1,))
+        self.assertEqual(list(cache.statements.values()), [[False, 2]])
@@ -1,5 +1,7 @@
 import json
+from unittest.mock import patch
 
+from django.db import models
 from django.test.utils import override_settings
 from django_dynamic_fixture import G
 
@@ -184,3 +186,117 @@ class TestUpdate(QueryTestCase):
         self.assertIsNone(orders[0].revenue)
         self.assertIsNone(orders[1].revenue)
         self.assertIsNone(orders[2].revenue)
+
+    def test_update_batches(self):
+        G(Account, id=1, first_name='First')
+        G(Account, id=2, first_name='First2')
+
+        query = Query().from_table(
+            table=Account,
+            fields=[
+                'id',
+                'first_name',
+            ]
+        )
+        query.max_params = 4
+
+        rows = [
+            [1, 'Test'],
+            [2, 'Test2'],
+        ]
+        query.update(rows)
+
+        update_sqls = [log['sql'] for log in self.logger.get_log() if 'new_values' in log['sql']]
+        self.assertEqual(len(update_sqls), 1)
+
+        query.update(rows, batch_size=1)
+
+        update_sqls = [log['sql'] for log in self.logger.get_log() if 'new_values' in log['sql']]
+        self.assertEqual(len(update_sqls), 3)
+        self.assertEqual(
+            list(Account.objects.order_by('id').values_list('first_name', flat=True)),
+            ['Test', 'Test2']
+        )
+
+    def test_update_unnest(self):
+        G(Account, id=1, first_name='First')
+        G(Account, id=2, first_name='First2')
+        MetricRecord.objects.create(id=10, data={'default1': 'd1'})
+
+        query = Query().from_table(
+            table=Account,
+            fields=[
+                'id',
+                'user_id',
+                'first_name',
+            ]
+        )
+
+        rows = [
+            [1, 1, 'Test'],
+            [2, 2, None],
+        ]
+
+        sql, sql_params = query.get_update_sql(rows, use_unnest=True)
+
+        self.assertEqual(
+            sql,
+            (
+                'UPDATE querybuilder_tests_account '
+                'SET user_id = new_values.user_id, '
+                'first_name = new_values.first_name '
+                'FROM unnest(%s::integer[], %s::integer[], %s::varchar(64)[]) '
+                'AS new_values (id, user_id, first_name) '
+                'WHERE querybuilder_tests_account.id = new_values.id'
+            )
+        )
+        self.assertEqual(sql_params, [[1, 2], [1, 2], ['Test', None]])
+        self.assertEqual(query.get_update_sql(rows[:1], use_unnest=True)[0], sql)
+
+        Query().from_table(Account, fields=['id', 'first_name']).update(
+            [[1, 'Test'], [2, 'Test2']],
+            use_unnest=True
+        )
+        self.assertEqual(
+            list(Account.objects.order_by('id').values_list('first_name', flat=True)),
+            ['Test', 'Test2']
+        )
+
+        Query().from_table(MetricRecord, fields=['id', 'data']).update(
+            [[10, json.dumps({'first': '111'})]],
+            use_unnest=True
+        )
+        self.assertEqual(MetricRecord.objects.get().data, {'first': '111'})
+
+    def test_update_unnest_requires_model(self):
+        query = Query().from_table(
+            table='querybuilder_tests_account',
+            fields=[
+                'id',
+                'first_name',
+            ]
+        )
+        with self.assertRaises(ValueError):
+            query.get_update_sql([[1, 'Test']], use_unnest=True)
+
+    def test_update_casts_cached(self):
+        """
+        Verifies the casts of the first row are cached so repeated updates don't inspect the model's fields
+        """
+        query = Query().from_table(
+            table=Account,
+            fields=[
+                'id',
+                'user_id',
+                'first_name',
+            ]
+        )
+        rows = [[1, 1, 'Test']]
+        sql, sql_params = query.get_update_sql(rows)
+        with patch.object(models.CharField, 'db_type') as db_type:
+            self.assertEqual(query.get_update_sql(rows), (sql, sql_params))
+            self.assertEqual(
+                query.get_update_casts(['id', 'user_id', 'first_name']),
+                ['%s', '%s::integer', '%s::varchar(64)']
+            )
+        self.assertEqual(db_type.call_count, 0)
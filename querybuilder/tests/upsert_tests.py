@@ -1,3 +1,4 @@
+from django.db import connection
 from django.test.utils import override_settings
 from django import VERSION
 from django_dynamic_fixture import G
@@ -204,6 +205,8 @@ class TestUpsert(QueryTestCase):
         # Check ids
         for record in records:
             self.assertIsNotNone(record.id)
+            self.assertFalse(record._state.adding)
+            self.assertEqual(record._state.db, 'default')
 
         # Check emails
         email_set = {
@@ -217,6 +220,134 @@ class TestUpsert(QueryTestCase):
         self.assertEqual(users[1].email, 'user2')
         self.assertEqual(users[2].email, 'user3')
 
+    def test_upsert_batches_return_order(self):
+        """
+        Makes sure rows upserted in batches are returned in the order they were passed
+        """
+        user1 = G(User, email='user1')
+        user1.email = 'user1change'
+        user2 = User(email='user2')
+        user3 = G(User, email='user3')
+        user4 = User(email='user4')
+
+        rows = Query().from_table(User).upsert(
+            [user2, user1, user4, user3],
+            unique_fields=['id'],
+            update_fields=['email'],
+            return_rows=True,
+            batch_size=1,
+        )
+        self.assertEqual([row['email'] for row in rows], ['user2', 'user1change', 'user4', 'user3'])
+        self.assertEqual(User.objects.count(), 4)
+
+    def test_upsert_conflicts_return_order(self):
+        """
+        Makes sure conflicting rows upserted without update fields in several batches are returned in
+        the order they were passed
+        """
+        G(Uniques, field1='2', field2='2', field3='old', field6='2', field7='2')
+        G(Uniques, field1='4', field2='4', field3='old', field6='4', field7='4')
+        items = [
+            Uniques(field1=value, field2=value, field3='new', field6=value, field7=value)
+            for value in ['4', '1', '2', '3']
+        ]
+
+        rows = Query().from_table(Uniques).upsert(
+            items, unique_fields=['field1'], update_fields=[], return_rows=True, batch_size=3
+        )
+        self.assertEqual([row['field1'] for row in rows], ['4', '1', '2', '3'])
+        self.assertEqual([row['field3'] for row in rows], ['old', 'new', 'old', 'new'])
+
+    def test_upsert_skipped_rows_return_order(self):
+        """
+        Makes sure the rows returned by batches that skip some rows are in the order they were passed
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE FUNCTION querybuilder_tests_skip_row() RETURNS trigger AS $$ BEGIN '
+                "IF NEW.field3 = 'skip' THEN RETURN NULL; END IF; RETURN NEW; END; $$ LANGUAGE plpgsql"
+            )
+            cursor.execute(
+                'CREATE TRIGGER querybuilder_tests_skip_row BEFORE INSERT ON querybuilder_tests_uniques '
+                'FOR EACH ROW EXECUTE FUNCTION querybuilder_tests_skip_row()'
+            )
+        existing = [
+            G(Uniques, field1=value, field2=value, field3='old', field6=value, field7=value) for value in ['2', '4']
+        ]
+        existing[0].field3 = 'skip'
+        existing[1].field3 = 'new'
+        # rows without an id are inserted by the last batches
+        items = [
+            Uniques(field1='1', field2='1', field3='new', field6='1', field7='1'),
+            existing[0],
+            Uniques(field1='3', field2='3', field3='new', field6='3', field7='3'),
+            existing[1],
+            Uniques(field1='5', field2='5', field3='skip', field6='5', field7='5'),
+        ]
+
+        rows = Query().from_table(Uniques).upsert(
+            items, unique_fields=['id'], update_fields=['field3'], return_rows=True, batch_size=2
+        )
+        self.assertEqual([row['field1'] for row in rows], ['1', '3', '4'])
+        self.assertEqual(list(Uniques.objects.order_by('field1').values_list('field3', flat=True)), [
+            'new', 'old', 'new', 'new'
+        ])
+
+    def test_upsert_unnest(self):
+        """
+        Makes sure upserting with one array per column gives the same sql for any number of rows
+        """
+        items = [
+            Uniques(field1='1.1', field2='1.2', field3='1.3', field6='1.6', field7='1.7', field8={'one': 1}),
+            Uniques(field1='2.1', field2='2.2', field3='2.3', field6='2.6', field7='2.7'),
+        ]
+
+        query = Query().from_table(Uniques)
+        auto_field_name = query.get_auto_field_name(Uniques)
+        sql, sql_args = query.get_upsert_sql(
+            items, ['field1'], ['field3'], auto_field_name=auto_field_name, use_unnest=True
+        )
+        self.assertEqual(
+            sql,
+            query.get_upsert_sql(
+                items[:1], ['field1'], ['field3'], auto_field_name=auto_field_name, use_unnest=True
+            )[0]
+        )
+        self.assertIn('SELECT * FROM unnest(%s::varchar(16)[], ', sql)
+        self.assertEqual(sql_args[0], ['1.1', '2.1'])
+
+        rows = query.upsert(
+            items, unique_fields=['field1'], update_fields=['field3'], return_rows=True, use_unnest=True
+        )
+        self.assertEqual([row['field1'] for row in rows], ['1.1', '2.1'])
+
+        items[0].field3 = '1.3 edited'
+        query.upsert(items, unique_fields=['field1'], update_fields=['field3'], use_unnest=True)
+
+        models = list(Uniques.objects.order_by('field1'))
+        self.assertEqual(len(models), 2)
+        self.assertEqual(models[0].field3, '1.3 edited')
+        self.assertEqual(models[0].field8, {'one': 1})
+        self.assertEqual(models[1].field8, {})
+
+    def test_upsert_unnest_pk(self):
+        """
+        Makes sure auto fields are cast to their integer type when upserting on the pk with unnest
+        """
+        user1 = G(User, email='user1')
+        user1.email = 'user1change'
+        user2 = User(email='user2')
+
+        rows = Query().from_table(User).upsert(
+            [user1, user2],
+            unique_fields=['id'],
+            update_fields=['email'],
+            return_rows=True,
+            use_unnest=True,
+        )
+        self.assertEqual([row['email'] for row in rows], ['user1change', 'user2'])
+        self.assertEqual(User.objects.count(), 2)
+
     def test_upsert_custom_db_column(self):
         """
         Makes sure upserting a model containing a field with a custom db_column name works.
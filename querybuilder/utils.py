@@ -1,11 +1,75 @@
 import json
+from collections import namedtuple
+from functools import lru_cache
 
 # constant for jsonb column type in postgressql - setting explicitly instead of pulling
 # from psycopg2 in order to reduce reliance on it (so we can move towards psycopg3)
 JSONB_OID = 3802
 
+# The function used to decode jsonb values. See ``set_json_decoder``
+_json_decoder = json.loads
 
-def json_fetch_all_as_dict(cursor):
+
+def get_json_decoder():
+    """
+    Gets the function used to decode jsonb values
+
+    :rtype: callable
+    """
+    return _json_decoder
+
+
+def set_json_decoder(loads=None):
+    """
+    Sets the function used to decode jsonb values. It is passed a str and must raise a
+    ``json.JSONDecodeError`` for invalid json, like ``json.loads`` and ``orjson.loads``.
+    A faster decoder like ``orjson.loads`` can be opted into, but it may not decode every value
+    the same way. orjson decodes integers over 64 bits as floats and raises on numbers that
+    overflow a float, so those values are returned as the undecoded string.
+
+    :param loads: The decoder function. Defaults to ``json.loads``
+    :type loads: callable or None
+    """
+    global _json_decoder
+    if loads is None:
+        loads = json.loads
+    _json_decoder = loads
+
+
+def json_decode_value(value, loads=None):
+    """
+    Runs a json decode on a jsonb value if it is presenting as a string. If the string is not
+    valid json, the original value is returned. See ``json_fetch_all_as_dict``.
+    """
+    if type(value) is not str:  # need to check type to avoid attempting to jsonify a None
+        return value
+    try:
+        return (loads or _json_decoder)(value)
+    # It is possible that we are selecting a sub-value from the json in the column. I.e.
+    # we got here because it IS a jsonb column, but what we selected is not json and will
+    # fail to parse. In that case, we already have the value we want in place.
+    except json.JSONDecodeError:
+        return value
+
+
+def json_decode_column(values, loads=None):
+    """
+    Decodes all of the jsonb values of a column that are presenting as strings. The whole column is
+    decoded at once and only falls back to handling invalid json value by value if decoding fails.
+
+    :param values: The values of a jsonb column
+    :type values: list or tuple
+
+    :rtype: list
+    """
+    loads = loads or _json_decoder
+    try:
+        return [loads(value) if type(value) is str else value for value in values]
+    except json.JSONDecodeError:
+        return [json_decode_value(value, loads) for value in values]
+
+
+def json_fetch_all_as_dict(cursor, decode_json=True):
     """
     Iterates over a result set and converts each row to a dictionary.
     The cursor passed in is assumed to have just executed a raw Postgresql query.
@@ -21,39 +85,328 @@ def json_fetch_all_as_dict(cursor):
     still jsonb, but the result value is a string as it should be. This ignoring of
     errors is the same logic used in json handling in Django's from_db_value() method.
 
+    :param decode_json: Set to False if the cursor already decodes jsonb values, see ``jsonify_cursor``
+    :type decode_json: bool
+
+    :return: A list of dictionaries where each row is a dictionary
+    :rtype: list of dict
+    """
+    return json_rows_as_dict(cursor, cursor.fetchall(), decode_json)
+
+
+def json_fetch_many_as_dict(cursor, chunk_size=2000, decode_json=True):
+    """
+    Generator that fetches ``chunk_size`` rows at a time from a result set and yields each
+    chunk as a list of dictionaries. jsonb columns are handled the same way as in
+    ``json_fetch_all_as_dict``. This is meant to be used with a server-side cursor so that
+    only one chunk of the result set is held in memory at a time.
+
+    :param chunk_size: The number of rows to fetch from the cursor at a time
+    :type chunk_size: int
+
+    :param decode_json: Set to False if the cursor already decodes jsonb values
+    :type decode_json: bool
+
+    :return: A generator of lists of dictionaries where each row is a dictionary
+    :rtype: generator of list of dict
+    """
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield json_rows_as_dict(cursor, rows, decode_json)
+
+
+def json_fetch_all(cursor, row_format='dict', decode_json=True):
+    """
+    Iterates over a result set and converts each row to the requested format. jsonb columns are
+    handled the same way as in ``json_fetch_all_as_dict``.
+
+    :param row_format: The format of the returned rows. One of ``ROW_FORMATS``:
+        'dict' returns a list of dictionaries,
+        'tuple' returns a list of tuples in the same order as the selected columns,
+        'namedtuple' returns a list of namedtuples built from the selected column names,
+        'columns' returns a dictionary of column name to a list of the values for that column
+    :type row_format: str
+
+    :param decode_json: Set to False if the cursor already decodes jsonb values
+    :type decode_json: bool
+
+    :return: The rows in the requested format
+    :rtype: list of dict or list of tuple or dict of list
+    """
+    return json_format_rows(cursor, cursor.fetchall(), row_format, decode_json)
+
+
+def json_format_rows(cursor, rows, row_format='dict', decode_json=True):
+    """
+    Converts rows that were fetched from the cursor to the requested format. See ``json_fetch_all``.
+
+    :param rows: The rows fetched from the cursor
+    :type rows: list of tuple
+
+    :param row_format: The format of the returned rows. One of ``ROW_FORMATS``
+    :type row_format: str
+
+    :param decode_json: Set to False if the cursor already decodes jsonb values
+    :type decode_json: bool
+
+    :return: The rows in the requested format
+    :rtype: list of dict or list of tuple or dict of list
+    """
+    if row_format not in ROW_FORMATS:
+        raise ValueError('Invalid row_format {0}. Must be one of {1}'.format(row_format, ', '.join(ROW_FORMATS)))
+    return ROW_FORMATS[row_format](cursor, rows, decode_json)
+
+
+def json_rows_as_dict(cursor, rows, decode_json=True):
+    """
+    Converts rows that were fetched from the cursor to dictionaries and runs a json.loads()
+    on any jsonb values that are presenting as strings. See ``json_fetch_all_as_dict``.
+
+    :param rows: The rows fetched from the cursor
+    :type rows: list of tuple
+
     :return: A list of dictionaries where each row is a dictionary
     :rtype: list of dict
     """
+    colnames = [col.name for col in cursor.description]
+    return [
+        dict(zip(colnames, row))
+        for row in json_rows_as_tuples(cursor, rows, decode_json)
+    ]
+
+
+class LazyJsonRow(dict):
+    """
+    A row dictionary whose jsonb values are decoded the first time they are read and then
+    replaced by the decoded value. Reading all of the values with ``items()``, ``values()``,
+    comparing rows, or copying a row decodes every value. Copies and pickles are plain dictionaries.
+    """
+    __slots__ = ('pending_keys',)
+
+    def __init__(self, values, pending_keys):
+        """
+        :param values: The column names and values of the row
+        :type values: iterable of tuple
+
+        :param pending_keys: The keys of the jsonb values that have not been decoded
+        :type pending_keys: set of str
+        """
+        super(LazyJsonRow, self).__init__(values)
+        self.pending_keys = pending_keys
+
+    def decode(self, key):
+        if key in self.pending_keys:
+            self.pending_keys.discard(key)
+            value = json_decode_value(dict.__getitem__(self, key))
+            dict.__setitem__(self, key, value)
+
+    def decode_all(self):
+        """
+        Decodes all of the jsonb values that have not been read yet
+        """
+        for key in list(self.pending_keys):
+            self.decode(key)
+
+    def __getitem__(self, key):
+        self.decode(key)
+        return super(LazyJsonRow, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self.pending_keys.discard(key)
+        super(LazyJsonRow, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.pending_keys.discard(key)
+        super(LazyJsonRow, self).__delitem__(key)
+
+    def __iter__(self):
+        # defining __iter__ keeps ** unpacking and dict(row) from reading the undecoded values
+        return super(LazyJsonRow, self).__iter__()
+
+    def __eq__(self, other):
+        self.decode_all()
+        if isinstance(other, LazyJsonRow):
+            other.decode_all()
+        return super(LazyJsonRow, self).__eq__(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        self.decode_all()
+        return super(LazyJsonRow, self).__repr__()
+
+    def __reduce__(self):
+        return dict, (self.copy(),)
+
+    def get(self, key, default=None):
+        self.decode(key)
+        return super(LazyJsonRow, self).get(key, default)
+
+    def pop(self, key, *args):
+        self.decode(key)
+        return super(LazyJsonRow, self).pop(key, *args)
+
+    def popitem(self):
+        self.decode_all()
+        return super(LazyJsonRow, self).popitem()
+
+    def setdefault(self, key, default=None):
+        self.decode(key)
+        return super(LazyJsonRow, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        self.pending_keys.difference_update(values)
+        super(LazyJsonRow, self).update(values)
+
+    def items(self):
+        self.decode_all()
+        return super(LazyJsonRow, self).items()
+
+    def values(self):
+        self.decode_all()
+        return super(LazyJsonRow, self).values()
+
+    def copy(self):
+        return dict(self.items())
+
+
+def json_rows_as_lazy_dict(cursor, rows):
+    """
+    Converts rows that were fetched from the cursor to ``LazyJsonRow`` dictionaries, so jsonb values
+    presenting as strings are only decoded when they are read.
+
+    :param rows: The rows fetched from the cursor
+    :type rows: list of tuple
+
+    :return: A list of dictionaries where each row is a dictionary
+    :rtype: list of :class:`LazyJsonRow <querybuilder.utils.LazyJsonRow>`
+    """
+    colnames = [col.name for col in cursor.description]
+    jsonbcols = [i for i, col in enumerate(cursor.description) if col.type_code == JSONB_OID]
+    if not jsonbcols:
+        return [dict(zip(colnames, row)) for row in rows]
+
+    return [
+        LazyJsonRow(
+            zip(colnames, row),
+            {colnames[colindex] for colindex in jsonbcols if type(row[colindex]) is str}
+        )
+        for row in rows
+    ]
+
+
+def json_rows_as_namedtuples(cursor, rows, decode_json=True):
+    """
+    Converts rows that were fetched from the cursor to namedtuples. The namedtuple class is
+    created once per set of column names and reused for every row.
+
+    :param rows: The rows fetched from the cursor
+    :type rows: list of tuple
+
+    :return: A list of namedtuples where each row is a namedtuple
+    :rtype: list of namedtuple
+    """
+    row_class = get_row_class(tuple(col.name for col in cursor.description))
+    return [
+        row_class._make(row)
+        for row in json_rows_as_tuples(cursor, rows, decode_json)
+    ]
+
 
+def json_rows_as_columns(cursor, rows, decode_json=True):
+    """
+    Converts rows that were fetched from the cursor to a single dictionary of column name to
+    the list of values in that column.
+
+    :param rows: The rows fetched from the cursor
+    :type rows: list of tuple
+
+    :return: A dictionary of column name to a list of the column values
+    :rtype: dict of list
+    """
     colnames = [col.name for col in cursor.description]
+    rows = json_rows_as_tuples(cursor, rows, decode_json)
+    if not rows:
+        return {colname: [] for colname in colnames}
+    return {
+        colname: list(values)
+        for colname, values in zip(colnames, zip(*rows))
+    }
+
+
+@lru_cache(maxsize=256)
+def get_row_class(colnames):
+    """
+    Creates a namedtuple class for the column names. Invalid or duplicate column names
+    are renamed to positional names like ``_1``.
+
+    :param colnames: The column names from the cursor description
+    :type colnames: tuple of str
+
+    :rtype: type
+    :return: The namedtuple class for the column names
+    """
+    return namedtuple('Row', colnames, rename=True)
+
+
+def json_rows_as_tuples(cursor, rows, decode_json=True):
+    """
+    Runs a json.loads() on any jsonb values that are presenting as strings in the rows that
+    were fetched from the cursor. See ``json_fetch_all_as_dict``.
+
+    :param rows: The rows fetched from the cursor
+    :type rows: list of tuple
+
+    :param decode_json: Set to False to return the rows as they are when the cursor already decodes jsonb values
+    :type decode_json: bool
+
+    :return: A list of tuples where each tuple is a row
+    :rtype: list of tuple
+    """
+    if not decode_json:
+        return rows
+
     coltypes = [col.type_code for col in cursor.description]
     # Identify any jsonb columns in the query, by column index
     jsonbcols = [i for i, x in enumerate(coltypes) if x == JSONB_OID]
 
-    # Optimize with a simple comprehension if we know there are no jsonb columns to handle.
+    # Skip the conversion if we know there are no jsonb columns to handle.
     if not jsonbcols:
-        return [
-            dict(zip(colnames, row))
-            for row in cursor.fetchall()
-        ]
+        return rows
 
-    # If there are jsonb columns, intercept the result rows and run a json.loads() on any jsonb
+    # If there are jsonb columns, intercept the result rows and run a json decode on any jsonb
     # columns that are presenting as strings.
     # In Django 3.1.0 they would already be a json type (e.g. dict or list) but in Django 3.1.1 it changes
     # and raw sql queries return strings for jsonb columns.
     # https://docs.djangoproject.com/en/4.0/releases/3.1.1/
-    results = []
-
-    for row in cursor.fetchall():
-        rowvals = list(row)
-        for colindex in jsonbcols:
-            if type(rowvals[colindex]) is str:  # need to check type to avoid attempting to jsonify a None
-                try:
-                    rowvals[colindex] = json.loads(rowvals[colindex])
-                # It is possible that we are selecting a sub-value from the json in the column. I.e.
-                # we got here because it IS a jsonb column, but what we selected is not json and will
-                # fail to parse. In that case, we already have the value we want in place.
-                except json.JSONDecodeError:
-                    pass
-        results.append(dict(zip(colnames, rowvals)))
-    return results
+    # The rows are transposed so each jsonb column is decoded in bulk. Columns that were already
+    # decoded by the cursor (see ``jsonify_cursor``) are left alone.
+    if not rows:
+        return rows
+    columns = None
+    for colindex in jsonbcols:
+        values = columns[colindex] if columns else [row[colindex] for row in rows]
+        if not any(type(value) is str for value in values):
+            continue
+        if columns is None:
+            columns = list(zip(*rows))
+        columns[colindex] = json_decode_column(values)
+
+    if columns is None:
+        return rows
+    return list(zip(*columns))
+
+
+# Map of each supported row format to the function that converts the fetched rows
+ROW_FORMATS = {
+    'dict': json_rows_as_dict,
+    'tuple': json_rows_as_tuples,
+    'namedtuple': json_rows_as_namedtuples,
+    'columns': json_rows_as_columns,
+}